@@ -3,6 +3,23 @@ ASGI config for BulletinBoard project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Запуск под ASGI с асинхронными главной, страницей объявления и профилем
+(``ads.views_async``)::
+
+    export ADS_ASYNC_VIEWS=True
+    uvicorn BulletinBoard.asgi:application --workers 4
+
+или через gunicorn с воркерами uvicorn::
+
+    gunicorn BulletinBoard.asgi:application -k uvicorn.workers.UvicornWorker --workers 4
+
+Остальные страницы остаются синхронными и выполняются в пуле потоков.
+Под ASGI синхронный код каждого запроса выполняется в новом потоке, и
+постоянные соединения с базой не переиспользуются: задайте
+``DB_CONN_MAX_AGE=0``, а для PostgreSQL — пул ``DB_POOL_MAX_SIZE``.
+Пропускную способность двух режимов сравнивает ``python manage.py benchmark``
+с ``--mode wsgi`` и ``--mode asgi`` (второй — с ``ADS_ASYNC_VIEWS=True``).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
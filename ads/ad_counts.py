@@ -0,0 +1,45 @@
+"""Хранимые счётчики объявлений в категориях, городах и тегах."""
+from collections import defaultdict
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Advertisement, AdvertisementTag, Category, City, Tag
+
+
+def adjust_ads_count(model, pks, delta):
+    """Изменяет ads_count у перечисленных объектов на delta"""
+    pks = [pk for pk in pks if pk is not None]
+    if not pks or not delta:
+        return
+    model.objects.filter(pk__in=pks).update(ads_count=Greatest(F('ads_count') + delta, Value(0)))
+
+
+def adjust_ads_counts(model, deltas):
+    """Применяет {pk: изменение} одним запросом на каждое различное изменение"""
+    by_delta = defaultdict(list)
+    for pk, delta in deltas.items():
+        by_delta[delta].append(pk)
+    for delta, pks in by_delta.items():
+        adjust_ads_count(model, pks, delta)
+
+
+def _actual_counts(model):
+    """Подзапрос с фактическим количеством объявлений для model"""
+    if model is Tag:
+        rows = AdvertisementTag.objects.filter(tag=OuterRef('pk')).values('tag')
+    else:
+        field = model._meta.model_name
+        rows = Advertisement.objects.filter(**{field: OuterRef('pk')}).values(field)
+    counts = rows.annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def reconcile_ads_counts():
+    """Исправляет расхождения счётчиков; возвращает число исправленных строк по моделям"""
+    fixed = {}
+    for model in (Category, City, Tag):
+        actual = _actual_counts(model)
+        drifted = model.objects.annotate(actual=actual).exclude(ads_count=F('actual'))
+        fixed[model._meta.verbose_name_plural] = drifted.update(ads_count=actual)
+    return fixed
@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def setup_search_index(sender, **kwargs):
+    from .search import get_search_backend
+
+    get_search_backend().setup()
 
 
 class AdsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ads'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        post_migrate.connect(setup_search_index, sender=self)
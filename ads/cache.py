@@ -0,0 +1,136 @@
+"""Кэш страниц и фрагментов с инвалидацией по зависимостям.
+
+Каждая запись кэша объявляет зависимости — строки вида ``ads``,
+``category:<slug>``, ``tag:<slug>``, ``cities``. У каждой зависимости есть
+номер версии, который входит в ключ записи. Изменение данных увеличивает
+версии затронутых зависимостей (см. ``ads.signals``), и зависящие от них
+записи перестают находиться, остальные продолжают использоваться.
+"""
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse
+
+DEPENDENCY_PREFIX = 'ads:dep:'
+
+
+def get_cache():
+    return caches[getattr(settings, 'ADS_PAGE_CACHE', 'default')]
+
+
+def is_shared_cache(cache):
+    """Видят ли записи кэша все процессы сервера (не LocMemCache и не DummyCache)"""
+    return not isinstance(cache, (LocMemCache, DummyCache))
+
+
+def get_timeout():
+    return getattr(settings, 'ADS_PAGE_CACHE_TIMEOUT', 300)
+
+
+def normalize_querystring(params, exclude=()):
+    """Строка параметров без пустых значений, отсортированная по имени и значению"""
+    items = sorted(
+        (key, value)
+        for key in params
+        if key not in exclude
+        for value in params.getlist(key)
+        if value != ''
+    )
+    return '&'.join(f'{key}={value}' for key, value in items)
+
+
+def get_versions(dependencies):
+    cache = get_cache()
+    keys = [f'{DEPENDENCY_PREFIX}{name}' for name in dependencies]
+    versions = cache.get_many(keys)
+    missing = {key: 1 for key in keys if key not in versions}
+    if missing:
+        for key in missing:
+            cache.add(key, 1, timeout=None)
+        versions.update(cache.get_many(list(missing)))
+    return [str(versions.get(key, 1)) for key in keys]
+
+
+def invalidate(*dependencies):
+    """Увеличивает версии зависимостей, делая зависящие от них записи недоступными"""
+    cache = get_cache()
+    for name in set(dependencies):
+        key = f'{DEPENDENCY_PREFIX}{name}'
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 2, timeout=None)
+
+
+def make_key(prefix, identity, dependencies):
+    versions = get_versions(dependencies)
+    digest = hashlib.md5(f'{identity}|{"|".join(dependencies)}|{".".join(versions)}'.encode()).hexdigest()
+    return f'ads:{prefix}:{digest}'
+
+
+def cached_fragment(name, dependencies, build):
+    """Возвращает фрагмент из кэша или строит его функцией build"""
+    cache = get_cache()
+    key = make_key('fragment', name, dependencies)
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        cache.set(key, value, get_timeout())
+    return value
+
+
+class CachedPageMixin:
+    """Кэширует страницы ListView для анонимных пользователей"""
+
+    def get_cache_dependencies(self):
+        return []
+
+    def is_page_cacheable(self, request):
+        return (
+            request.method in ('GET', 'HEAD')
+            and 'messages' not in request.COOKIES
+            and not request.user.is_authenticated
+        )
+
+    def get_cached_page(self, request):
+        """(ключ кэша, закэшированный ответ или None)"""
+        key = make_key('page', f'{request.path}?{normalize_querystring(request.GET)}', self.get_cache_dependencies())
+        cached = get_cache().get(key)
+        if cached is None:
+            return key, None
+        content, content_type = cached
+        return key, HttpResponse(content, content_type=content_type)
+
+    def store_page(self, key, response):
+        if response.status_code == 200 and hasattr(response, 'add_post_render_callback'):
+            def store(rendered):
+                if not rendered.cookies:
+                    get_cache().set(key, (rendered.content, rendered['Content-Type']), get_timeout())
+            response.add_post_render_callback(store)
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.view_is_async:
+            return self.adispatch(request, *args, **kwargs)
+        if not self.is_page_cacheable(request):
+            return super().dispatch(request, *args, **kwargs)
+
+        key, cached = self.get_cached_page(request)
+        if cached is not None:
+            return cached
+        return self.store_page(key, super().dispatch(request, *args, **kwargs))
+
+    async def adispatch(self, request, *args, **kwargs):
+        # Проверка пользователя и обращения к кэшу синхронные
+        cacheable = await sync_to_async(self.is_page_cacheable)(request)
+        if not cacheable:
+            return await super().dispatch(request, *args, **kwargs)
+
+        key, cached = await sync_to_async(self.get_cached_page)(request)
+        if cached is not None:
+            return cached
+        return self.store_page(key, await super().dispatch(request, *args, **kwargs))
@@ -0,0 +1,169 @@
+"""Буферизованный счётчик просмотров объявлений.
+
+Просмотры накапливаются в кэше (``ADS_VIEW_COUNTER_CACHE``) и периодически
+сбрасываются в базу агрегированными ``UPDATE ... SET views = views + n``.
+Потерять можно не больше ``ADS_VIEW_COUNTER_MAX_PENDING`` просмотров или
+``ADS_VIEW_COUNTER_FLUSH_INTERVAL`` секунд просмотров одного процесса.
+С локальным кэшем (по умолчанию) буфер у каждого процесса свой, процесс
+сам сбрасывает его и при аварийном завершении теряет. Общий кэш
+(``VIEW_COUNTS_CACHE_BACKEND``) сбрасывает только плановая команда
+``flush_view_counts``. Кэш должен выполнять ``incr``/``add`` атомарно
+(Redis, Memcached); FileBasedCache для буфера не подходит.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import F
+
+from .routers import untracked_writes
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounter:
+    key_prefix = 'ads:views:'
+    lock_key = 'ads:views:flush-lock'
+
+    def __init__(self, cache_alias='default', flush_interval=10, max_pending=100, flush_in_process=None, lock_timeout=600):
+        self.cache_alias = cache_alias
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # Чтение буфера и его уменьшение после UPDATE — отдельные шаги: два процесса, сбрасывающие
+        # общий буфер одновременно, учли бы просмотры дважды. Поэтому общий кэш сбрасывает только
+        # плановая команда flush_view_counts, а процессы сервера — лишь свой локальный кэш
+        if flush_in_process is None:
+            flush_in_process = isinstance(self.cache, LocMemCache)
+        self.flush_in_process = flush_in_process
+        self.lock_timeout = lock_timeout
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._dirty = set()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def make_key(self, advertisement_id):
+        return f'{self.key_prefix}{advertisement_id}'
+
+    def hit(self, advertisement_id):
+        """Учитывает просмотр и возвращает число ещё не сброшенных просмотров объявления"""
+        key = self.make_key(advertisement_id)
+        try:
+            buffered = self.cache.incr(key)
+        except ValueError:
+            buffered = 1 if self.cache.add(key, 1, timeout=None) else self.cache.incr(key)
+        if not self.flush_in_process:
+            return buffered
+
+        with self._lock:
+            self._dirty.add(advertisement_id)
+            self._pending += 1
+            due = (
+                self._pending >= self.max_pending
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        if due:
+            self.flush()
+        return buffered
+
+    def pending(self, advertisement_id):
+        return self.cache.get(self.make_key(advertisement_id), 0)
+
+    def flush(self, advertisement_ids=None, chunk_size=1000):
+        """Сбрасывает накопленные просмотры в базу и возвращает их количество.
+
+        Без аргументов сбрасываются объявления, просмотренные в этом процессе;
+        с ``advertisement_ids`` — перечисленные (например, все id при общем кэше).
+        Сброс общего кэша выполняется под блокировкой в самом кэше: если
+        предыдущий ещё идёт, возвращается 0.
+        """
+        if self.flush_in_process:
+            return self._flush(advertisement_ids, chunk_size)
+        if not self.cache.add(self.lock_key, 1, timeout=self.lock_timeout):
+            logger.warning('Просмотры уже сбрасываются другим процессом')
+            return 0
+        try:
+            return self._flush(advertisement_ids, chunk_size)
+        finally:
+            self.cache.delete(self.lock_key)
+
+    def _flush(self, advertisement_ids, chunk_size):
+        with self._flush_lock:
+            with self._lock:
+                if advertisement_ids is None:
+                    advertisement_ids, self._dirty = self._dirty, set()
+                self._pending = 0
+                self._last_flush = time.monotonic()
+
+            total = 0
+            chunk = []
+            for advertisement_id in advertisement_ids:
+                chunk.append(advertisement_id)
+                if len(chunk) >= chunk_size:
+                    total += self._flush_chunk(chunk)
+                    chunk = []
+            if chunk:
+                total += self._flush_chunk(chunk)
+            return total
+
+    def _flush_chunk(self, advertisement_ids):
+        from .models import Advertisement, FeedEntry
+
+        keys = {self.make_key(pk): pk for pk in advertisement_ids}
+        counts = {keys[key]: value for key, value in self.cache.get_many(list(keys)).items() if value}
+        if not counts:
+            return 0
+
+        # Объявления с одинаковым приростом обновляются одним запросом
+        by_increment = defaultdict(list)
+        for pk, value in counts.items():
+            by_increment[value].append(pk)
+        # Просмотры — не изменения пользователя: чтение с реплик не отключается
+        with untracked_writes(), transaction.atomic():
+            for increment, pks in by_increment.items():
+                Advertisement.objects.filter(pk__in=pks).update(views=F('views') + increment)
+                # Снимок главной обновляется сигналами, а UPDATE их не вызывает
+                FeedEntry.objects.filter(pk__in=pks).update(views=F('views') + increment)
+
+        # Уменьшаем, а не удаляем: просмотры, пришедшие во время сброса, сохранятся
+        for pk, value in counts.items():
+            try:
+                self.cache.decr(self.make_key(pk), value)
+            except ValueError:
+                pass
+        return sum(counts.values())
+
+
+_counter = None
+_counter_lock = threading.Lock()
+
+
+def get_view_counter():
+    global _counter
+    if _counter is None:
+        with _counter_lock:
+            if _counter is None:
+                _counter = ViewCounter(
+                    cache_alias=getattr(settings, 'ADS_VIEW_COUNTER_CACHE', 'default'),
+                    flush_interval=getattr(settings, 'ADS_VIEW_COUNTER_FLUSH_INTERVAL', 10),
+                    max_pending=getattr(settings, 'ADS_VIEW_COUNTER_MAX_PENDING', 100),
+                )
+                atexit.register(_flush_on_exit, _counter)
+    return _counter
+
+
+def _flush_on_exit(counter):
+    try:
+        counter.flush()
+    except Exception:
+        logger.exception('Не удалось сохранить просмотры при завершении процесса')
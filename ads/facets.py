@@ -0,0 +1,116 @@
+"""Счётчики уточнений фильтров главной (фасеты).
+
+Для текущего набора фильтров считается, сколько объявлений даст каждый
+вариант уточнения: категории, города, популярные теги и диапазоны цен.
+Счётчики измерения считаются по остальным фильтрам без его собственного,
+чтобы рядом с выбранным значением были видны альтернативы. На измерение —
+один запрос с GROUP BY, для цен — один агрегат с COUNT по условию, то есть
+четыре запроса при любом наборе фильтров. Если других фильтров у
+измерения нет, категории, города и теги берутся из хранимых счётчиков
+``ads_count`` без обращения к объявлениям. Результат кэшируется по
+нормализованной строке фильтров (``ads.cache``) и сбрасывается вместе с
+кэшем страниц.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.db.models import Count, F
+
+from .cache import cached_fragment, normalize_querystring
+from .filters import FILTER_PARAMS, get_filter_conditions, price_condition
+from .models import Advertisement, Category, City, Tag
+
+FacetValue = namedtuple('FacetValue', ['slug', 'name', 'count', 'color'], defaults=[None])
+
+# Измерение: (параметр фильтра, модель, связь объявления, ограничивать ли число значений)
+DIMENSIONS = {
+    'categories': ('category', Category, 'category', False),
+    'cities': ('city', City, 'city', True),
+    'tags': ('tag', Tag, 'tags', True),
+}
+
+DEPENDENCIES = ['ads', 'categories', 'tags', 'cities']
+
+
+def get_price_ranges():
+    """[(от, до)] по ADS_FACET_PRICE_BOUNDS, крайние диапазоны открыты"""
+    bounds = list(getattr(settings, 'ADS_FACET_PRICE_BOUNDS', (1000, 5000, 20000, 100000)))
+    edges = [None, *bounds, None]
+    return list(zip(edges, edges[1:]))
+
+
+def _format_price(value):
+    return f'{value:,}'.replace(',', ' ')
+
+
+def _price_value(low, high, count):
+    slug = f"{'' if low is None else low}-{'' if high is None else high}"
+    if low is None:
+        name = f'до {_format_price(high)} ₽'
+    elif high is None:
+        name = f'от {_format_price(low)} ₽'
+    else:
+        name = f'{_format_price(low)} – {_format_price(high)} ₽'
+    return FacetValue(slug, name, count)
+
+
+def _filtered(conditions, exclude):
+    queryset = Advertisement.objects.order_by()
+    for name, condition in conditions.items():
+        if name != exclude:
+            queryset = queryset.filter(condition)
+    return queryset
+
+
+def _dimension_values(conditions, param, model, relation, limited, selected):
+    fields = ['slug', 'name'] + (['color'] if model is Tag else [])
+    if set(conditions) - {param}:
+        prefix = f'{relation}__'
+        rows = _filtered(conditions, param).values(*[prefix + field for field in fields]).annotate(count=Count('pk'))
+    else:
+        prefix = ''
+        rows = model.objects.filter(ads_count__gt=0).values(*fields, count=F('ads_count'))
+
+    values = [
+        FacetValue(row[f'{prefix}slug'], row[f'{prefix}name'], row['count'], row.get(f'{prefix}color'))
+        # Объявления без тегов дают группу с пустым тегом
+        for row in rows if row[f'{prefix}slug'] is not None
+    ]
+    if limited:
+        values.sort(key=lambda value: (-value.count, value.name))
+        top = values[:getattr(settings, 'ADS_FACET_LIMIT', 10)]
+        # Выбранное значение выводится, даже если не попало в первые
+        top += [value for value in values[len(top):] if value.slug == selected]
+        values = top
+    else:
+        values.sort(key=lambda value: value.name)
+
+    if selected and selected not in {value.slug for value in values}:
+        row = model.objects.filter(slug=selected).values(*fields).first()
+        if row:
+            values.append(FacetValue(row['slug'], row['name'], 0, row.get('color')))
+    return values
+
+
+def build_facets(params):
+    """{'categories', 'cities', 'tags', 'price_ranges': [FacetValue]} для фильтров из params"""
+    conditions = get_filter_conditions(params)
+    facets = {
+        name: _dimension_values(conditions, param, model, relation, limited, params.get(param))
+        for name, (param, model, relation, limited) in DIMENSIONS.items()
+    }
+    ranges = get_price_ranges()
+    counts = _filtered(conditions, 'price').aggregate(**{
+        f'range_{number}': Count('pk', filter=price_condition(low, high))
+        for number, (low, high) in enumerate(ranges)
+    })
+    facets['price_ranges'] = [
+        _price_value(low, high, counts[f'range_{number}']) for number, (low, high) in enumerate(ranges)
+    ]
+    return facets
+
+
+def get_facets(params):
+    """Фасеты для фильтров из params, закэшированные по нормализованной строке фильтров"""
+    key = normalize_querystring(params, exclude=[name for name in params if name not in FILTER_PARAMS])
+    return cached_fragment(f'facets:{key}', DEPENDENCIES, lambda: build_facets(params))
@@ -0,0 +1,142 @@
+"""Снимок первых страниц главной.
+
+Главная без фильтров с сортировкой по новизне — самый посещаемый адрес.
+Первые ``ADS_HOME_FEED_SIZE`` объявлений этой ленты хранятся в таблице
+``FeedEntry`` уже в том виде, в каком их выводит шаблон: название, начало
+описания, цена, просмотры, город и автор. Первая страница и следующие за
+ней по курсору читаются одним запросом к этой таблице (плюс сумма
+счётчиков категорий вместо COUNT), без объявлений, городов и пользователей.
+
+Снимок меняется в той же транзакции, что и данные (см. ``ads.signals``):
+сохранённое объявление заменяет свою строку или вытесняет последнюю,
+после удаления снимок дополняется следующими объявлениями. Просмотры
+прибавляются при сбросе счётчика (``ads.counters``). Массовые загрузки
+через ``bulk_create`` сигналы не вызывают и перестраивают снимок целиком
+(``rebuild_feed``, команда ``rebuild_home_feed``).
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils.text import Truncator
+
+from .models import Advertisement, Category, City, FeedEntry
+from .pagination import DEFAULT_SORT, CursorPaginator, _cursor_page, _cursor_query
+
+# Поле снимка: поле в запросе к объявлениям
+ENTRY_FIELDS = {
+    'advertisement_id': 'id',
+    'title': 'title',
+    'slug': 'slug',
+    'summary': 'description',
+    'price': 'price',
+    'views': 'views',
+    'created_at': 'created_at',
+    'city_id': 'city_id',
+    'city_name': 'city__name',
+    'author_id': 'author_id',
+    'author_username': 'author__username',
+}
+
+ORDERING = ['-created_at', '-pk']
+
+
+def get_capacity():
+    # На одну строку больше: по ней последняя страница снимка узнаёт, есть ли следующая
+    return getattr(settings, 'ADS_HOME_FEED_SIZE', 50) + 1
+
+
+def _make_entries(queryset):
+    entries = []
+    for row in queryset.values(*ENTRY_FIELDS.values()):
+        entry = FeedEntry(**{field: row[source] for field, source in ENTRY_FIELDS.items()})
+        # Шаблон всё равно обрезает описание до 200 символов, повторная обрезка его не меняет
+        entry.summary = Truncator(entry.summary).chars(200)
+        entries.append(entry)
+    return entries
+
+
+def _trim(capacity):
+    extra = list(FeedEntry.objects.order_by(*ORDERING).values_list('pk', flat=True)[capacity:])
+    if extra:
+        FeedEntry.objects.filter(pk__in=extra).delete()
+
+
+@transaction.atomic
+def rebuild_feed():
+    """Строит снимок заново; возвращает число строк"""
+    FeedEntry.objects.all().delete()
+    entries = FeedEntry.objects.bulk_create(_make_entries(Advertisement.objects.order_by(*ORDERING)[:get_capacity()]))
+    return len(entries)
+
+
+@transaction.atomic
+def update_feed(advertisement_ids):
+    """Обновляет строки объявлений, попадающих в снимок, и обрезает его до нужного размера"""
+    advertisement_ids = list(advertisement_ids)
+    if not advertisement_ids:
+        return
+    capacity = get_capacity()
+    advertisements = Advertisement.objects.filter(pk__in=advertisement_ids)
+    # Пока снимок не заполнен, в нём все объявления, и любое объявление в него попадает
+    boundary = list(FeedEntry.objects.order_by(*ORDERING).values_list('created_at', 'pk')[capacity - 1:capacity])
+    if boundary:
+        created_at, pk = boundary[0]
+        advertisements = advertisements.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gte=pk))
+    FeedEntry.objects.filter(pk__in=advertisement_ids).delete()
+    FeedEntry.objects.bulk_create(_make_entries(advertisements))
+    _trim(capacity)
+
+
+@transaction.atomic
+def fill_feed():
+    """Дополняет снимок после удаления объявлений следующими по новизне"""
+    capacity = get_capacity()
+    entries = FeedEntry.objects.order_by(*ORDERING)
+    missing = capacity - entries.count()
+    if missing <= 0:
+        return
+    advertisements = Advertisement.objects.order_by(*ORDERING)
+    oldest = entries.values_list('created_at', 'pk').last()
+    if oldest:
+        created_at, pk = oldest
+        advertisements = advertisements.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+    FeedEntry.objects.bulk_create(_make_entries(advertisements[:missing]))
+
+
+def refresh_feed_entries(**filters):
+    """Перечитывает строки снимка по условию, например после переименования города"""
+    update_feed(FeedEntry.objects.filter(**filters).values_list('pk', flat=True))
+
+
+def _make_advertisement(entry):
+    advertisement = Advertisement(
+        id=entry.pk,
+        title=entry.title,
+        slug=entry.slug,
+        description=entry.summary,
+        price=entry.price,
+        views=entry.views,
+        created_at=entry.created_at,
+        city_id=entry.city_id,
+        author_id=entry.author_id,
+    )
+    advertisement.city = City(id=entry.city_id, name=entry.city_name)
+    advertisement.author = User(id=entry.author_id, username=entry.author_username)
+    return advertisement
+
+
+def get_feed_page(per_page, token=None):
+    """CursorPage первой или следующей по курсору страницы ленты; None — страницы нет в снимке"""
+    page_query, direction = _cursor_query(FeedEntry.objects.all(), DEFAULT_SORT, per_page, token)
+    # Обратное листание может начинаться за пределами снимка
+    if direction != 'next':
+        return None
+    entries = list(page_query)
+    total = Category.objects.aggregate(total=Sum('ads_count'))['total'] or 0
+    # Неполная страница — конец ленты, только если в снимке все объявления
+    if len(entries) <= per_page and (token or len(entries) != total):
+        return None
+    paginator = CursorPaginator(FeedEntry.objects.all(), per_page)
+    paginator.count = total
+    return _cursor_page([_make_advertisement(entry) for entry in entries], paginator, DEFAULT_SORT, token, direction)
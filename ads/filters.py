@@ -0,0 +1,75 @@
+"""Фильтрация списков объявлений, общая для страниц и JSON API."""
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+
+from .search import get_search_backend
+
+FILTER_PARAMS = ('category', 'city', 'tag', 'price', 'q')
+
+
+def parse_price_range(value):
+    """'1000-5000' → (1000, 5000), края можно не указывать: '-1000', '100000-'; None — неверное значение"""
+    low, sep, high = (value or '').partition('-')
+    if not sep:
+        return None
+    try:
+        bounds = tuple(Decimal(bound) if bound else None for bound in (low, high))
+    except InvalidOperation:
+        return None
+    # NaN и Infinity Decimal принимает, а поле цены — нет
+    if any(bound is not None and not bound.is_finite() for bound in bounds):
+        return None
+    return bounds
+
+
+def price_condition(low, high):
+    condition = Q()
+    if low is not None:
+        condition &= Q(price__gte=low)
+    if high is not None:
+        condition &= Q(price__lt=high)
+    return condition
+
+
+def get_filter_conditions(params):
+    """Условия по заданным фильтрам: {параметр: Q}.
+
+    Поиск отбирает все совпадения, а не только первые ADS_SEARCH_RESULTS_LIMIT,
+    которые упорядочиваются по релевантности (см. ``get_ranked_ids``).
+    """
+    conditions = {}
+    category_slug = params.get('category')
+    if category_slug:
+        conditions['category'] = Q(category__slug=category_slug)
+
+    city_slug = params.get('city')
+    if city_slug:
+        conditions['city'] = Q(city__slug=city_slug)
+
+    tag_slug = params.get('tag')
+    if tag_slug:
+        conditions['tag'] = Q(tags__slug=tag_slug)
+
+    price_range = parse_price_range(params.get('price'))
+    if price_range:
+        conditions['price'] = price_condition(*price_range)
+
+    search_query = params.get('q')
+    if search_query:
+        conditions['q'] = get_search_backend().condition(search_query)
+    return conditions
+
+
+def get_ranked_ids(params):
+    """Первые ADS_SEARCH_RESULTS_LIMIT id результатов поиска по релевантности (``None`` без поиска)"""
+    search_query = params.get('q')
+    return get_search_backend().search(search_query) if search_query else None
+
+
+def filter_advertisements(queryset, params):
+    """Фильтрует объявления по category, city, tag, price и q"""
+    # Отдельный filter() на условие, как и раньше: для тега — свой JOIN
+    for condition in get_filter_conditions(params).values():
+        queryset = queryset.filter(condition)
+    return queryset
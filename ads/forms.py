@@ -13,6 +13,14 @@ class TagForm(forms.ModelForm):
             'color': 'Цвет тега',
         }
 
+def check_city_choice(city, new_city):
+    """Город задаётся либо выбором из списка, либо названием нового города"""
+    if not city and not new_city:
+        raise forms.ValidationError("Выберите город из списка или введите новый")
+
+    if city and new_city:
+        raise forms.ValidationError("Выберите только один вариант: город из списка или новый город")
+
 class AdvertisementForm(forms.ModelForm):
     city = forms.ModelChoiceField(
         queryset=City.objects.all(),
@@ -52,13 +60,7 @@ class AdvertisementForm(forms.ModelForm):
         cleaned_data = super().clean()
         city = cleaned_data.get('city')
         new_city = cleaned_data.get('new_city')
-
-        if not city and not new_city:
-            raise forms.ValidationError("Выберите город из списка или введите новый")
-
-        if city and new_city:
-            raise forms.ValidationError("Выберите только один вариант: город из списка или новый город")
-
+        check_city_choice(city, new_city)
         return cleaned_data
 
     def save(self, commit=True):
@@ -0,0 +1,164 @@
+"""Обработка обложек объявлений.
+
+После загрузки обложки из оригинала удаляются метаданные (EXIF, GPS):
+очищенная копия сохраняется под новым именем, а старый файл удаляется
+только после записи нового пути в базу. Также создаются уменьшенные копии
+в WebP и JPEG фиксированной ширины (``ADS_COVER_WIDTHS``). Обработка выполняется после коммита транзакции в
+пуле потоков (``ADS_IMAGE_WORKERS``); при нуле потоков — сразу в запросе.
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Ключи Image.info с метаданными, которых не должно остаться в оригинале
+METADATA_KEYS = ('exif', 'xmp', 'XML:com.adobe.xmp', 'icc_profile', 'comment', 'photoshop')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_widths():
+    return sorted(getattr(settings, 'ADS_COVER_WIDTHS', (320, 640, 1024)))
+
+
+def _encode(image, image_format, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def _flatten(image):
+    """RGB без прозрачности для JPEG"""
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _has_metadata(image):
+    return bool(image.getexif()) or any(key in image.info for key in METADATA_KEYS)
+
+
+def strip_metadata(field):
+    """Сохраняет оригинал без метаданных, учитывая ориентацию из EXIF; возвращает (картинка, новый путь).
+
+    Очищенная копия записывается под свободным именем рядом с оригиналом, сам
+    оригинал удаляет вызывающий после того, как в базе окажется новый путь.
+    Уже очищенный оригинал повторно не перекодируется: новый путь — None.
+    """
+    storage = field.storage
+    with storage.open(field.name, 'rb') as source:
+        original = Image.open(source)
+        original.load()
+    if not _has_metadata(original):
+        return original, None
+    image_format = original.format or 'JPEG'
+    image = ImageOps.exif_transpose(original)
+    if image_format == 'JPEG':
+        image = _flatten(image)
+    content = _encode(image, image_format, quality=90) if image_format in ('JPEG', 'WEBP') else _encode(image, image_format)
+    return image, storage.save(field.name, content)
+
+
+def build_variants(field, image):
+    """Создаёт уменьшенные копии и возвращает {формат: [[ширина, путь], ...]}"""
+    storage = field.storage
+    base, _ = os.path.splitext(field.name)
+    # Картинку не увеличиваем: если она уже всех ширин, остаётся одна копия исходного размера
+    widths = [width for width in get_widths() if width < image.width] or [image.width]
+
+    variants = {}
+    for name, (image_format, options) in VARIANT_FORMATS.items():
+        variants[name] = []
+        for width in widths:
+            resized = image.copy()
+            resized.thumbnail((width, image.height), Image.LANCZOS)
+            if image_format == 'JPEG':
+                resized = _flatten(resized)
+            path = f'{base}-{width}.{name}'
+            if storage.exists(path):
+                storage.delete(path)
+            path = storage.save(path, _encode(resized, image_format, **options))
+            variants[name].append([width, path])
+    return variants
+
+
+def delete_variants(storage, variants):
+    for items in (variants or {}).values():
+        for _, path in items:
+            if storage.exists(path):
+                storage.delete(path)
+
+
+def process_cover(advertisement_id):
+    """Очищает обложку объявления от метаданных и сохраняет её копии"""
+    from .models import Advertisement
+
+    advertisement = Advertisement.objects.filter(pk=advertisement_id).only('cover', 'cover_variants').first()
+    if advertisement is None or not advertisement.cover:
+        return None
+    storage = advertisement.cover.storage
+    original = advertisement.cover.name
+    image, stripped = strip_metadata(advertisement.cover)
+    delete_variants(storage, advertisement.cover_variants)
+    if stripped:
+        advertisement.cover.name = stripped
+    variants = build_variants(advertisement.cover, image)
+    # update() не вызывает сигналы и не трогает updated_at
+    updated = Advertisement.objects.filter(pk=advertisement_id, cover=original).update(
+        cover=advertisement.cover.name, cover_variants=variants,
+    )
+    if not updated:
+        # Обложку успели заменить или удалить: новые файлы никому не нужны
+        delete_variants(storage, variants)
+        if stripped:
+            storage.delete(stripped)
+        return None
+    if stripped:
+        storage.delete(original)
+    return variants
+
+
+def _process_in_worker(advertisement_id):
+    try:
+        process_cover(advertisement_id)
+    except Exception:
+        logger.exception('Не удалось обработать обложку объявления %s', advertisement_id)
+    finally:
+        close_old_connections()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'ADS_IMAGE_WORKERS', 2),
+                    thread_name_prefix='ads-images',
+                )
+    return _executor
+
+
+def schedule_cover_processing(advertisement_id):
+    """Ставит обработку обложки в очередь после коммита текущей транзакции"""
+    if getattr(settings, 'ADS_IMAGE_WORKERS', 2) <= 0:
+        transaction.on_commit(lambda: process_cover(advertisement_id))
+    else:
+        transaction.on_commit(lambda: get_executor().submit(_process_in_worker, advertisement_id))
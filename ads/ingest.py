@@ -0,0 +1,228 @@
+"""Массовая загрузка объявлений продавца.
+
+Строки проверяются по тем же правилам, что и ``AdvertisementForm``,
+города, категории и теги ищутся в словарях, загруженных один раз, а
+объявления и их связи с тегами вставляются через ``bulk_create`` пачками,
+каждая в своей транзакции. ``bulk_create`` не вызывает сигналы, поэтому
+счётчики, поисковый индекс, снимок главной и кэш страниц обновляются здесь
+же. Результат — отчёт по каждой строке: созданное объявление или список
+ошибок.
+"""
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db import DatabaseError, IntegrityError, transaction
+
+from .ad_counts import adjust_ads_counts
+from .cache import invalidate
+from .feed import update_feed
+from .forms import check_city_choice
+from .images import schedule_cover_processing
+from .models import Advertisement, AdvertisementTag, Category, City, Tag
+from .search import get_search_backend
+from .similar import invalidate_similar_advertisements
+from .slugs import SAVE_ATTEMPTS, allocate_slugs
+
+# Поля, которые проверяются отдельно или заполняются при вставке
+UNCHECKED_FIELDS = ['slug', 'city', 'category', 'author', 'cover', 'tags']
+
+
+def _text(row, name):
+    value = row.get(name)
+    return '' if value is None else str(value).strip()
+
+
+def _tag_slugs(value):
+    if isinstance(value, (list, tuple)):
+        return [str(slug).strip() for slug in value if str(slug).strip()]
+    return [slug.strip() for slug in (value or '').replace(',', '|').split('|') if slug.strip()]
+
+
+def _messages(error):
+    if hasattr(error, 'message_dict'):
+        return [f'{field}: {message}' for field, messages in error.message_dict.items() for message in messages]
+    return list(error.messages)
+
+
+class AdvertisementIngest:
+    """Загрузка объявлений одного автора; run() возвращает отчёт по строкам"""
+
+    def __init__(self, author, batch_size=500, workers=4, allow_local_covers=True):
+        self.author = author
+        self.batch_size = batch_size
+        self.workers = workers
+        # Пути к файлам на сервере допустимы только из командной строки
+        self.allow_local_covers = allow_local_covers
+        self.categories = dict(Category.objects.values_list('slug', 'id'))
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.cities = {}
+        for pk, slug, name in City.objects.values_list('id', 'slug', 'name'):
+            self.cities[name.casefold()] = pk
+            if slug:
+                self.cities[slug] = pk
+
+    def run(self, rows):
+        report = []
+        numbered = enumerate(rows, start=1)
+        while True:
+            chunk = list(islice(numbered, self.batch_size))
+            if not chunk:
+                return report
+            report.extend(self.import_chunk(chunk))
+
+    def prepare(self, row):
+        """Проверяет строку; возвращает (объявление, id тегов, название нового города, путь к обложке)"""
+        city, new_city = _text(row, 'city'), _text(row, 'new_city')
+        errors = []
+        try:
+            check_city_choice(city, new_city)
+        except ValidationError as exc:
+            errors.extend(exc.messages)
+        city_id = (self.cities.get(city) or self.cities.get(city.casefold())) if city else None
+        if city and city_id is None:
+            errors.append(f'Город не найден: {city}')
+        category_id = self.categories.get(_text(row, 'category'))
+        if category_id is None:
+            errors.append(f'Категория не найдена: {_text(row, "category")}')
+        tag_slugs = _tag_slugs(row.get('tags'))
+        unknown_tags = [slug for slug in tag_slugs if slug not in self.tags]
+        if unknown_tags:
+            errors.append(f'Теги не найдены: {", ".join(unknown_tags)}')
+        cover = _text(row, 'cover')
+        if cover and not self.allow_local_covers:
+            errors.append('Обложки по пути на сервере загружаются только командой')
+
+        advertisement = Advertisement(
+            title=_text(row, 'title'),
+            description=_text(row, 'description'),
+            price=_text(row, 'price') or None,
+            author=self.author,
+            category_id=category_id,
+            city_id=city_id,
+        )
+        try:
+            advertisement.full_clean(exclude=UNCHECKED_FIELDS, validate_unique=False, validate_constraints=False)
+        except ValidationError as exc:
+            errors.extend(_messages(exc))
+        if errors:
+            raise ValidationError(errors)
+        return advertisement, {self.tags[slug] for slug in tag_slugs}, new_city, cover
+
+    def store_cover(self, path):
+        field = Advertisement._meta.get_field('cover')
+        with open(path, 'rb') as source:
+            return field.storage.save(field.generate_filename(None, os.path.basename(path)), File(source))
+
+    def delete_covers(self, advertisements):
+        for advertisement in advertisements:
+            if advertisement.cover:
+                advertisement.cover.storage.delete(advertisement.cover.name)
+
+    def import_chunk(self, chunk):
+        results, prepared = {}, []
+        for number, row in chunk:
+            try:
+                prepared.append((number, *self.prepare(row)))
+            except ValidationError as exc:
+                results[number] = {'row': number, 'status': 'error', 'errors': _messages(exc)}
+
+        # Обложки копируются в хранилище параллельно, до транзакции
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+            futures = {
+                number: (advertisement, executor.submit(self.store_cover, cover))
+                for number, advertisement, _, _, cover in prepared
+                if cover
+            }
+        for number, (advertisement, future) in futures.items():
+            try:
+                advertisement.cover = future.result()
+            except OSError as exc:
+                results[number] = {'row': number, 'status': 'error', 'errors': [f'Обложка: {exc}']}
+        prepared = [item for item in prepared if item[0] not in results]
+
+        try:
+            for attempt in range(SAVE_ATTEMPTS):
+                try:
+                    created = self.insert(prepared)
+                    break
+                except IntegrityError:
+                    # slug успели занять параллельно — выбираем заново
+                    if attempt == SAVE_ATTEMPTS - 1:
+                        raise
+                    for item in prepared:
+                        item[1].pk = None
+        except DatabaseError as exc:
+            # Пачку откатили: её строки не загружены, а скопированные обложки не нужны ни одной строке.
+            # Предыдущие пачки уже зафиксированы, поэтому загрузка продолжается и отчёт остаётся полным
+            self.delete_covers([item[1] for item in prepared])
+            created = []
+            for number, _, _, _, _ in prepared:
+                results[number] = {'row': number, 'status': 'error', 'errors': [f'База данных: {exc}']}
+        except BaseException:
+            self.delete_covers([item[1] for item in prepared])
+            raise
+        for number, advertisement in created:
+            results[number] = {'row': number, 'status': 'created', 'id': advertisement.pk, 'slug': advertisement.slug}
+        return [results[number] for number, _ in chunk]
+
+    @transaction.atomic
+    def insert(self, prepared):
+        if not prepared:
+            return []
+        # Словарь городов обновляется только после успешной вставки: транзакцию могут откатить
+        cities = dict(self.cities)
+        new_cities = {name.casefold(): name for _, _, _, name, _ in prepared if name and name.casefold() not in cities}
+        if new_cities:
+            names = list(new_cities.values())
+            City.objects.bulk_create(
+                [City(name=name, slug=slug) for name, slug in zip(names, allocate_slugs(City, names))]
+            )
+            cities.update(
+                (name.casefold(), pk) for pk, name in City.objects.filter(name__in=names).values_list('id', 'name')
+            )
+
+        advertisements = []
+        for _, advertisement, _, new_city, _ in prepared:
+            if new_city:
+                advertisement.city_id = cities[new_city.casefold()]
+            advertisements.append(advertisement)
+        for advertisement, slug in zip(advertisements, allocate_slugs(Advertisement, [ad.title for ad in advertisements])):
+            advertisement.slug = slug
+        Advertisement.objects.bulk_create(advertisements)
+
+        links = [
+            AdvertisementTag(advertisement=advertisement, tag_id=tag_id)
+            for (_, advertisement, tag_ids, _, _) in prepared
+            for tag_id in tag_ids
+        ]
+        AdvertisementTag.objects.bulk_create(links)
+
+        adjust_ads_counts(Category, Counter(ad.category_id for ad in advertisements))
+        adjust_ads_counts(City, Counter(ad.city_id for ad in advertisements))
+        adjust_ads_counts(Tag, Counter(link.tag_id for link in links))
+        get_search_backend().index_many(advertisements)
+        update_feed([advertisement.pk for advertisement in advertisements])
+        for advertisement in advertisements:
+            if advertisement.cover:
+                schedule_cover_processing(advertisement.pk)
+
+        category_slugs = list(
+            Category.objects.filter(pk__in={ad.category_id for ad in advertisements}).values_list('slug', flat=True)
+        )
+        tag_slugs = list(Tag.objects.filter(pk__in={link.tag_id for link in links}).values_list('slug', flat=True))
+        transaction.on_commit(lambda: self.invalidate(category_slugs, tag_slugs, bool(new_cities)))
+        self.cities = cities
+        return [(item[0], advertisement) for item, advertisement in zip(prepared, advertisements)]
+
+    def invalidate(self, category_slugs, tag_slugs, cities_changed):
+        invalidate(
+            'ads',
+            *(['cities'] if cities_changed else []),
+            *[f'category:{slug}' for slug in category_slugs],
+            *[f'tag:{slug}' for slug in tag_slugs],
+        )
+        invalidate_similar_advertisements()
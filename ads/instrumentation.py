@@ -0,0 +1,177 @@
+"""Замеры запросов к базе и времени ответа по именам URL.
+
+Middleware считает для каждого запроса количество SQL-запросов, время в
+базе, время рендеринга шаблона и общее время, отдаёт их в заголовке
+Server-Timing и складывает в скользящее окно последних замеров (в памяти
+процесса), по которому страница ``request_metrics`` показывает перцентили.
+Для представлений из ``ADS_QUERY_BUDGETS`` проверяется лимит запросов:
+превышение пишется в лог, а при ``ADS_QUERY_BUDGET_STRICT`` вызывает
+исключение, поэтому тесты с лишними запросами падают.
+
+Под ASGI запросы асинхронного ORM выполняются через ``sync_to_async`` в
+отдельном потоке, общем для всего HTTP-запроса, поэтому счётчик
+подключается к соединениям этого потока.
+"""
+import logging
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('total', 'db', 'template', 'queries')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryRecorder:
+    """execute_wrapper, считающий запросы и их суммарное время"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+class MetricsStore:
+    """Последние замеры по каждому имени URL"""
+
+    def __init__(self, window):
+        self.window = window
+        self.samples = defaultdict(lambda: deque(maxlen=self.window))
+        self.lock = threading.Lock()
+
+    def record(self, name, sample):
+        with self.lock:
+            self.samples[name].append(sample)
+
+    def clear(self):
+        with self.lock:
+            self.samples.clear()
+
+    def summary(self, percentiles=(50, 95, 99, 100)):
+        """[{name, count, total: {p50: …}, db: {…}, template: {…}, queries: {…}}] по именам URL"""
+        with self.lock:
+            snapshot = {name: list(samples) for name, samples in self.samples.items()}
+        rows = []
+        for name, samples in sorted(snapshot.items()):
+            row = {'name': name, 'count': len(samples)}
+            for metric in METRICS:
+                values = sorted(sample[metric] for sample in samples)
+                row[metric] = {f'p{p}': values[max(0, math.ceil(p / 100 * len(values)) - 1)] for p in percentiles}
+            rows.append(row)
+        return rows
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_metrics_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = MetricsStore(getattr(settings, 'ADS_METRICS_WINDOW', 500))
+    return _store
+
+
+def check_query_budget(name, queries):
+    budget = getattr(settings, 'ADS_QUERY_BUDGETS', {}).get(name)
+    if budget is None or queries <= budget:
+        return
+    message = f'Представление {name} выполнило {queries} SQL-запросов при лимите {budget}'
+    if getattr(settings, 'ADS_QUERY_BUDGET_STRICT', False):
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not getattr(settings, 'ADS_INSTRUMENTATION', True):
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        request._template_timing = [None, None]
+        started = time.perf_counter()
+        with self.record_queries(recorder):
+            response = self.get_response(request)
+        return self.finish(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        if not getattr(settings, 'ADS_INSTRUMENTATION', True):
+            return await self.get_response(request)
+
+        recorder = QueryRecorder()
+        request._template_timing = [None, None]
+        started = time.perf_counter()
+        stack = await sync_to_async(self.record_queries)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.finish(request, response, recorder, started)
+
+    def record_queries(self, recorder):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        return stack
+
+    def finish(self, request, response, recorder, started):
+        total = time.perf_counter() - started
+        render_started, render_finished = request._template_timing
+        template = render_finished - render_started if render_finished else 0.0
+        timings = {
+            'total': total * 1000,
+            'db': recorder.duration * 1000,
+            'template': template * 1000,
+            'queries': recorder.count,
+        }
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={timings["db"]:.1f};desc="{recorder.count} queries"',
+            f'tpl;dur={timings["template"]:.1f}',
+            f'total;dur={timings["total"]:.1f}',
+        ])
+
+        match = request.resolver_match
+        if match is not None and match.url_name:
+            get_metrics_store().record(match.view_name, timings)
+            check_query_budget(match.view_name, recorder.count)
+        return response
+
+    def process_template_response(self, request, response):
+        timing = getattr(request, '_template_timing', None)
+        if timing is not None:
+            # Рендеринг TemplateResponse начинается сразу после всех process_template_response
+            timing[0] = time.perf_counter()
+
+            def finished(rendered):
+                timing[1] = time.perf_counter()
+            response.add_post_render_callback(finished)
+        return response
@@ -0,0 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from ads.images import process_cover
+from ads.models import Advertisement
+
+class Command(BaseCommand):
+    help = 'Создаёт копии обложек для объявлений, у которых их ещё нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Пересоздать копии для всех обложек')
+        parser.add_argument('--workers', type=int, default=4, help='Количество потоков обработки')
+
+    def process(self, advertisement_id):
+        try:
+            return process_cover(advertisement_id) is not None
+        except Exception as exc:
+            self.stderr.write(self.style.ERROR(f'Объявление {advertisement_id}: {exc}'))
+            return False
+        finally:
+            close_old_connections()
+
+    def handle(self, *args, **options):
+        queryset = Advertisement.objects.exclude(cover='').exclude(cover__isnull=True)
+        if not options['force']:
+            queryset = queryset.filter(cover_variants={})
+        ids = list(queryset.values_list('pk', flat=True))
+
+        with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as executor:
+            processed = sum(executor.map(self.process, ids))
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Обработано обложек: {processed} из {len(ids)}')
+        )
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from ads.benchmark import MODES, compare_results, load_results, run_benchmark, save_results
+
+
+class Command(BaseCommand):
+    help = 'Замеряет запросы, время ответа и память основных страниц и сравнивает с базовым прогоном'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='Запросов на сценарий')
+        parser.add_argument('--warmup', type=int, default=2, help='Прогревочных запросов перед замером')
+        parser.add_argument('--cold', action='store_true', help='Очищать кэш страниц перед каждым запросом')
+        parser.add_argument('--mode', choices=MODES, default='wsgi', help='Обработчик запросов: WSGI или ASGI')
+        parser.add_argument('--concurrency', type=int, default=0, help='Одновременных клиентов для замера пропускной способности')
+        parser.add_argument('--output', default='benchmark-results.json', help='Файл для результатов')
+        parser.add_argument('--baseline', help='Файл с результатами базового прогона для сравнения')
+        parser.add_argument('--threshold', type=float, default=0.2, help='Допустимое замедление p95 (0.2 = 20%%)')
+
+    def handle(self, *args, **options):
+        if options['mode'] == 'asgi' and not settings.ADS_ASYNC_VIEWS:
+            raise CommandError('Для --mode asgi задайте ADS_ASYNC_VIEWS=True, иначе замеряются синхронные представления')
+        results = run_benchmark(
+            options['iterations'], options['cold'], options['warmup'], log=self.stdout.write,
+            mode=options['mode'], concurrency=options['concurrency'],
+        )
+        save_results(results, options['output'])
+        self.stdout.write(self.style.SUCCESS(f"Результаты сохранены в {options['output']}"))
+
+        if options['baseline']:
+            baseline = load_results(options['baseline'])
+            for key in ('database', 'pool', 'cold_cache'):
+                if baseline['meta'].get(key, results['meta'][key]) != results['meta'][key]:
+                    raise CommandError(f'Базовый прогон выполнен с другим параметром {key}: сравнение бессмысленно')
+            regressions = compare_results(results, baseline, options['threshold'])
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(regression))
+            if regressions:
+                raise CommandError(f'Регрессий относительно базового прогона: {len(regressions)}')
+            self.stdout.write(self.style.SUCCESS('Регрессий относительно базового прогона нет'))
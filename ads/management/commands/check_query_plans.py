@@ -0,0 +1,101 @@
+import re
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from ads import views
+from ads.models import Advertisement, Category, City, Tag
+from ads.profile import RESPONSE_STATUSES, get_section_querysets, response_stats_query, status_counts_query
+
+# Полный просмотр таблицы в выводе EXPLAIN для SQLite и PostgreSQL
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN (?P<table>\w+)(?! USING)(?:\s|$)'),
+    'postgresql': re.compile(r'Seq Scan on (?P<table>\w+)'),
+}
+
+class Command(BaseCommand):
+    help = 'Проверяет планы запросов списков объявлений (EXPLAIN) на полный просмотр таблиц'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Выводить планы всех запросов')
+
+    def get_scenarios(self):
+        category = Category.objects.first()
+        city = City.objects.first()
+        tag = Tag.objects.first()
+        user = User.objects.first()
+
+        scenarios = [
+            ('home', views.AdvertisementListView, {}, {}),
+            ('home', views.AdvertisementListView, {'sort': 'price'}, {}),
+            ('home', views.AdvertisementListView, {'sort': '-views'}, {}),
+            ('admin_ads', views.AdminAdvertisementListView, {}, {}),
+        ]
+        if category:
+            scenarios += [
+                ('home', views.AdvertisementListView, {'category': category.slug}, {}),
+                ('category_ads', views.CategoryAdvertisementListView, {}, {'category_slug': category.slug}),
+            ]
+        if city:
+            scenarios.append(('home', views.AdvertisementListView, {'city': city.slug}, {}))
+        if tag:
+            scenarios += [
+                ('home', views.AdvertisementListView, {'tag': tag.slug}, {}),
+                ('tag_ads', views.TagAdvertisementListView, {}, {'tag_slug': tag.slug}),
+            ]
+        if user:
+            scenarios.append(('my_ads', views.UserAdvertisementListView, {}, {}))
+        return scenarios, user
+
+    def build_queryset(self, view_class, params, kwargs, user):
+        request = RequestFactory().get('/', params)
+        request.user = user or AnonymousUser()
+        view = view_class()
+        view.setup(request, **kwargs)
+        queryset = view.get_queryset()
+        # Первая страница так, как её запрашивает курсорная пагинация
+        if hasattr(view, 'get_sort'):
+            sort = view.get_sort()
+            queryset = queryset.order_by(sort, '-pk' if sort.startswith('-') else 'pk')
+        return queryset[:view.paginate_by + 1]
+
+    def get_profile_queries(self, user):
+        """[(имя, запрос)] разделов профиля так, как их выбирает ProfileView"""
+        if user is None:
+            return []
+        queries = [
+            (f'profile {name}', queryset.order_by('-created_at', '-pk')[:views.ProfileView.paginate_by + 1])
+            for name, queryset in get_section_querysets(user).items()
+        ]
+        inbox = get_section_querysets(user, RESPONSE_STATUSES[0])['received_responses']
+        queries.append((f'profile received_responses status={RESPONSE_STATUSES[0]}', inbox.order_by('-created_at', '-pk')[:views.ProfileView.paginate_by + 1]))
+        queries.append(('profile status_counts', status_counts_query(user)))
+        ad_ids = list(Advertisement.objects.filter(author=user).values_list('pk', flat=True)[:views.ProfileView.paginate_by])
+        queries.append(('profile response_stats', response_stats_query(ad_ids)))
+        return queries
+
+    def handle(self, *args, **options):
+        pattern = FULL_SCAN_PATTERNS.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(f'Проверка планов не поддерживается для {connection.vendor}')
+
+        scenarios, user = self.get_scenarios()
+        queries = [
+            (f'{name} {params or ""}'.strip(), self.build_queryset(view_class, params, kwargs, user))
+            for name, view_class, params, kwargs in scenarios
+        ]
+        failures = []
+        for label, queryset in queries + self.get_profile_queries(user):
+            plan = queryset.explain()
+            scans = [match.group('table') for match in pattern.finditer(plan)]
+            if options['verbose_plans']:
+                self.stdout.write(f'{label}:\n{plan}\n')
+            if scans:
+                failures.append(f'{label}: полный просмотр {", ".join(scans)}')
+                self.stdout.write(self.style.ERROR(failures[-1]))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{label}: OK'))
+
+        if failures:
+            raise CommandError(f'Запросов с полным просмотром таблиц: {len(failures)}')
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+from ads.models import Advertisement
+from ads.recommendations import SimilarityEngine
+
+class Command(BaseCommand):
+    help = 'Пересчитывает похожие объявления'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=8, help='Сколько соседей хранить для объявления')
+        parser.add_argument('--batch-size', type=int, default=200, help='Количество объявлений в одной пачке')
+        parser.add_argument('--since', help='Пересчитать только объявления, изменённые после даты (ISO 8601), и объявления с общими тегами')
+
+    def handle(self, *args, **options):
+        advertisement_ids = None
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError('Неверный формат даты, ожидается ISO 8601')
+            advertisement_ids = list(
+                Advertisement.objects.filter(updated_at__gte=since).values_list('pk', flat=True)
+            )
+
+        engine = SimilarityEngine(top_k=options['top_k'], batch_size=options['batch_size'])
+        total = engine.compute(advertisement_ids)
+        self.stdout.write(
+            self.style.SUCCESS(f'Пересчитаны похожие объявления для {total} объявлений')
+        )
@@ -0,0 +1,51 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from ads.export import EXPORT_FORMATS, export_lines, export_rows, parse_since
+
+
+class Command(BaseCommand):
+    help = 'Выгружает объявления в CSV или NDJSON (полностью или только изменённые)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='ndjson', help='Формат выгрузки')
+        parser.add_argument('--output', help='Файл для записи (по умолчанию stdout)')
+        parser.add_argument('--since', help='Выгрузить объявления, изменённые после этого момента (ISO 8601), с перекрытием ADS_EXPORT_OVERLAP_SECONDS')
+        parser.add_argument(
+            '--state-file',
+            help='Файл с моментом последней выгрузки: читается вместо --since и обновляется после выгрузки',
+        )
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Объявлений в одной пачке')
+
+    def handle(self, *args, **options):
+        since = options['since']
+        state_file = options['state_file']
+        if state_file and not since and os.path.exists(state_file):
+            with open(state_file, encoding='utf-8') as state:
+                since = state.read()
+        try:
+            since = parse_since(since)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        watermark = {'updated_at': since, 'count': 0}
+
+        def tracked(rows):
+            for row in rows:
+                watermark['updated_at'] = row['updated_at']
+                watermark['count'] += 1
+                yield row
+
+        rows = tracked(export_rows(since, options['chunk_size']))
+        target = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else self.stdout
+        try:
+            for line in export_lines(options['format'], rows):
+                target.write(line)
+        finally:
+            if target is not self.stdout:
+                target.close()
+
+        if state_file and watermark['updated_at']:
+            with open(state_file, 'w', encoding='utf-8') as state:
+                state.write(watermark['updated_at'].isoformat())
+        self.stderr.write(self.style.SUCCESS(f'Выгружено объявлений: {watermark["count"]}'))
@@ -0,0 +1,25 @@
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+from ads.counters import get_view_counter
+from ads.models import Advertisement
+
+class Command(BaseCommand):
+    help = 'Сбрасывает накопленные просмотры объявлений из кэша в базу (при общем кэше view_counts запускается по расписанию)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Количество объявлений в одном запросе к кэшу')
+
+    def handle(self, *args, **options):
+        counter = get_view_counter()
+        if isinstance(counter.cache, LocMemCache):
+            # Локальный кэш этого процесса пуст: просмотры копятся в памяти процессов сервера
+            self.stderr.write(self.style.WARNING(
+                'Кэш view_counts локальный для процесса, команда не видит просмотры сервера. '
+                'Задайте VIEW_COUNTS_CACHE_BACKEND и VIEW_COUNTS_CACHE_LOCATION'
+            ))
+        chunk_size = options['chunk_size']
+        ids = Advertisement.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=chunk_size)
+        total = counter.flush(ids, chunk_size=chunk_size)
+        self.stdout.write(
+            self.style.SUCCESS(f'Сохранено просмотров: {total}')
+        )
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from ads.benchmark import generate_catalog
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическим каталогом для нагрузочных замеров (не для рабочей базы!)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ads', type=int, default=10000, help='Количество объявлений (10000, 100000, 1000000)')
+        parser.add_argument('--users', type=int, help='Количество пользователей (по умолчанию объявлений / 20)')
+        parser.add_argument('--cities', type=int, default=50, help='Количество городов')
+        parser.add_argument('--tags', type=int, default=200, help='Количество тегов')
+        parser.add_argument('--responses', type=float, default=0.3, help='Среднее число откликов на объявление')
+        parser.add_argument('--seed', type=int, default=0, help='Начальное значение генератора случайных чисел')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Строк в одной вставке')
+
+    def handle(self, *args, **options):
+        result = generate_catalog(
+            ads=options['ads'],
+            users=options['users'],
+            cities=options['cities'],
+            tags=options['tags'],
+            responses=options['responses'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано объявлений: {result['ads']}, пользователей: {result['users']}, "
+            f"городов: {result['cities']}, тегов: {result['tags']}"
+        ))
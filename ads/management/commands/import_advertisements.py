@@ -0,0 +1,43 @@
+import csv
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from ads.ingest import AdvertisementIngest
+from ads.reference_data import read_rows
+
+REPORT_COLUMNS = ['row', 'status', 'id', 'slug', 'errors']
+
+
+class Command(BaseCommand):
+    help = 'Массово загружает объявления продавца из CSV / JSON Lines / JSON с отчётом по каждой строке'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу (.csv, .jsonl, .ndjson, .json)')
+        parser.add_argument('--author', required=True, help='Имя пользователя — автора объявлений')
+        parser.add_argument('--batch-size', type=int, default=500, help='Строк в одной транзакции')
+        parser.add_argument('--workers', type=int, default=4, help='Потоков для копирования обложек')
+        parser.add_argument('--report', help='CSV-файл для отчёта по строкам (по умолчанию выводятся только ошибки)')
+
+    def handle(self, *args, **options):
+        try:
+            author = User.objects.get(username=options['author'])
+        except User.DoesNotExist:
+            raise CommandError(f'Пользователь {options["author"]} не найден')
+
+        ingest = AdvertisementIngest(author, options['batch_size'], options['workers'])
+        try:
+            report = ingest.run(read_rows(options['path']))
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc)) from exc
+
+        if options['report']:
+            with open(options['report'], 'w', encoding='utf-8', newline='') as target:
+                writer = csv.DictWriter(target, REPORT_COLUMNS)
+                writer.writeheader()
+                for result in report:
+                    writer.writerow({**result, 'errors': '; '.join(result.get('errors', []))})
+
+        errors = [result for result in report if result['status'] == 'error']
+        for result in errors:
+            self.stdout.write(self.style.ERROR(f"Строка {result['row']}: {'; '.join(result['errors'])}"))
+        self.stdout.write(self.style.SUCCESS(f'Создано: {len(report) - len(errors)}, с ошибками: {len(errors)}'))
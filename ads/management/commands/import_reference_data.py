@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from ads.reference_data import REFERENCE_MODELS, import_reference_data, read_rows
+
+class Command(BaseCommand):
+    help = 'Импортирует города или категории из CSV / JSON Lines / JSON без удаления существующих'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу (.csv, .jsonl, .ndjson, .json)')
+        parser.add_argument('--model', choices=sorted(REFERENCE_MODELS), required=True, help='Что импортировать')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Количество строк в одной пачке')
+
+    def handle(self, *args, **options):
+        try:
+            result = import_reference_data(
+                options['model'], read_rows(options['path']), options['batch_size'],
+                log=lambda message: self.stderr.write(self.style.WARNING(message)),
+            )
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc)) from exc
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано: {result['created']}, обновлено: {result['updated']}, "
+            f"без изменений: {result['unchanged']}, пропущено: {result['skipped']}, отклонено: {result['rejected']}"
+        ))
@@ -1,5 +1,5 @@
 from django.core.management.base import BaseCommand
-from ads.models import City
+from ads.reference_data import import_reference_data
 
 class Command(BaseCommand):
     help = 'Загружает основные города России'
@@ -27,19 +27,13 @@ class Command(BaseCommand):
             'Бийск', 'Прокопьевск', 'Южно-Сахалинск', 'Рыбинск', 'Балаково'
         ]
 
-        for city_name in cities:
-            city, created = City.objects.get_or_create(
-                name=city_name,
-                defaults={'name': city_name}
-            )
-            if created:
-                self.stdout.write(
-                    self.style.SUCCESS(f'Добавлен город: {city_name}')
-                )
-            else:
-                self.stdout.write(
-                    self.style.WARNING(f'Город уже существует: {city_name}')
-                )
+        result = import_reference_data('city', ({'name': city_name} for city_name in cities))
+        self.stdout.write(
+            self.style.SUCCESS(f"Добавлено городов: {result['created']}")
+        )
+        self.stdout.write(
+            self.style.WARNING(f"Уже существовало: {result['unchanged'] + result['updated']}")
+        )
 
         self.stdout.write(
             self.style.SUCCESS('Загрузка городов завершена!')
@@ -1,15 +1,11 @@
 from django.core.management.base import BaseCommand
-from ads.models import Category, City
-from django.utils.text import slugify
+from ads.reference_data import import_reference_data
 
 class Command(BaseCommand):
     help = 'Загружает начальные данные (категории и города)'
 
     def handle(self, *args, **options):
-        # Сначала удалим существующие данные
-        Category.objects.all().delete()
-        City.objects.all().delete()
-
+        # Существующие данные не удаляются: повторный запуск только дополняет справочники
         # Создаем категории с ручным указанием slug
         categories = [
             {'name': 'Электроника', 'slug': 'electronics', 'description': 'Техника, гаджеты, компьютеры'},
@@ -21,11 +17,13 @@ class Command(BaseCommand):
             {'name': 'Услуги', 'slug': 'services', 'description': 'Различные услуги'},
         ]
 
-        for cat_data in categories:
-            category = Category.objects.create(**cat_data)
-            self.stdout.write(
-                self.style.SUCCESS(f'Создана категория: {category.name}')
+        result = import_reference_data('category', categories)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Категории: создано {result['created']}, обновлено {result['updated']}, "
+                f"без изменений {result['unchanged']}"
             )
+        )
 
         # Создаем города с ручным указанием slug
         cities = [
@@ -51,11 +49,13 @@ class Command(BaseCommand):
             {'name': 'Ижевск', 'slug': 'izhevsk'},
         ]
 
-        for city_data in cities:
-            city = City.objects.create(**city_data)
-            self.stdout.write(
-                self.style.SUCCESS(f'Создан город: {city.name}')
+        result = import_reference_data('city', cities)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Города: создано {result['created']}, обновлено {result['updated']}, "
+                f"без изменений {result['unchanged']}"
             )
+        )
 
         self.stdout.write(
             self.style.SUCCESS('Начальные данные успешно загружены!')
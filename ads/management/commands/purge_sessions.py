@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+from ads.sessions import get_session_model, purge_expired_sessions
+
+
+class Command(BaseCommand):
+    help = 'Удаляет истёкшие сессии из базы небольшими пачками, не блокируя таблицу надолго'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Сессий в одной транзакции')
+        parser.add_argument('--pause', type=float, default=0.0, help='Пауза между пачками, секунд')
+
+    def handle(self, *args, **options):
+        if get_session_model() is None:
+            raise CommandError('Сессии хранятся не в базе данных: удалять нечего')
+        deleted = purge_expired_sessions(options['batch_size'], options['pause'], log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(f'Удалено истёкших сессий: {deleted}'))
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from ads.feed import rebuild_feed
+
+class Command(BaseCommand):
+    help = 'Перестраивает снимок первых страниц главной'
+
+    def handle(self, *args, **options):
+        total = rebuild_feed()
+        self.stdout.write(self.style.SUCCESS(f'Объявлений в снимке: {total}'))
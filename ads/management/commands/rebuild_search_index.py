@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from ads.models import Advertisement
+from ads.search import get_search_backend
+
+class Command(BaseCommand):
+    help = 'Перестраивает поисковый индекс объявлений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Количество объявлений в одной пачке')
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        total = backend.rebuild(Advertisement.objects.all(), batch_size=options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Проиндексировано объявлений: {total} ({type(backend).__name__})')
+        )
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from ads.ad_counts import reconcile_ads_counts
+
+class Command(BaseCommand):
+    help = 'Исправляет счётчики объявлений в категориях, городах и тегах'
+
+    def handle(self, *args, **options):
+        for name, fixed in reconcile_ads_counts().items():
+            style = self.style.WARNING if fixed else self.style.SUCCESS
+            self.stdout.write(style(f'{name}: исправлено {fixed}'))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='city',
+            name='slug',
+            field=models.SlugField(max_length=100, unique=True, verbose_name='URL-адрес города'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0003_advertisement_views'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarAdvertisement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='Сходство')),
+                ('advertisement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_links', to='ads.advertisement')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ads.advertisement')),
+            ],
+            options={
+                'verbose_name': 'Похожее объявление',
+                'verbose_name_plural': 'Похожие объявления',
+                'ordering': ['advertisement', '-score'],
+                'indexes': [models.Index(fields=['advertisement', '-score'], name='ads_similar_ad_score_idx')],
+                'constraints': [models.UniqueConstraint(fields=('advertisement', 'similar'), name='unique_similar_advertisement')],
+            },
+        ),
+    ]
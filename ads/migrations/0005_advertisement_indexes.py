@@ -0,0 +1,71 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0004_similaradvertisement'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Таблица ads_advertisement_tags уже существует: явная промежуточная
+        # модель меняет только состояние миграций
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='AdvertisementTag',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('advertisement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ads.advertisement')),
+                        ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ads.tag')),
+                    ],
+                    options={
+                        'db_table': 'ads_advertisement_tags',
+                        'unique_together': {('advertisement', 'tag')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='advertisement',
+                    name='tags',
+                    field=models.ManyToManyField(blank=True, through='ads.AdvertisementTag', to='ads.tag', verbose_name='Теги'),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='advertisementtag',
+            index=models.Index(fields=['tag', 'advertisement'], name='ads_ad_tags_tag_ad_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='advertisement',
+            index=models.Index(fields=['category', '-created_at', '-id'], name='ads_ad_category_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='advertisement',
+            index=models.Index(fields=['city', '-created_at', '-id'], name='ads_ad_city_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='advertisement',
+            index=models.Index(fields=['author', '-created_at', '-id'], name='ads_ad_author_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='advertisement',
+            index=models.Index(fields=['-created_at', '-id'], name='ads_ad_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='advertisement',
+            index=models.Index(fields=['price', 'id'], name='ads_ad_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='advertisement',
+            index=models.Index(fields=['views', 'id'], name='ads_ad_views_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='advertisement',
+            index=models.Index(fields=['updated_at'], name='ads_ad_updated_idx'),
+        ),
+    ]
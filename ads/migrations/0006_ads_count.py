@@ -0,0 +1,45 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:06
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_ads_count(apps, schema_editor):
+    Advertisement = apps.get_model('ads', 'Advertisement')
+    AdvertisementTag = apps.get_model('ads', 'AdvertisementTag')
+    for model_name, rows in (
+        ('Category', Advertisement.objects.filter(category=OuterRef('pk')).values('category')),
+        ('City', Advertisement.objects.filter(city=OuterRef('pk')).values('city')),
+        ('Tag', AdvertisementTag.objects.filter(tag=OuterRef('pk')).values('tag')),
+    ):
+        counts = rows.annotate(total=Count('pk')).values('total')
+        apps.get_model('ads', model_name).objects.update(
+            ads_count=Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0005_advertisement_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='ads_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество объявлений'),
+        ),
+        migrations.AddField(
+            model_name='city',
+            name='ads_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество объявлений'),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='ads_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество объявлений'),
+        ),
+        migrations.RunPython(fill_ads_count, migrations.RunPython.noop),
+    ]
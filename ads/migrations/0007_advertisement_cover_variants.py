@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0006_ads_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='advertisement',
+            name='cover_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Копии обложки'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0007_advertisement_cover_variants'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='response',
+            index=models.Index(fields=['recipient', 'status', '-created_at', '-id'], name='ads_response_inbox_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='response',
+            index=models.Index(fields=['recipient', '-created_at', '-id'], name='ads_response_inbox_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='response',
+            index=models.Index(fields=['sender', '-created_at', '-id'], name='ads_response_outbox_idx'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.text import Truncator
+
+
+def fill_feed(apps, schema_editor):
+    Advertisement = apps.get_model('ads', 'Advertisement')
+    FeedEntry = apps.get_model('ads', 'FeedEntry')
+    size = getattr(settings, 'ADS_HOME_FEED_SIZE', 50) + 1
+    rows = Advertisement.objects.order_by('-created_at', '-pk').values(
+        'id', 'title', 'slug', 'description', 'price', 'views', 'created_at',
+        'city_id', 'city__name', 'author_id', 'author__username',
+    )[:size]
+    FeedEntry.objects.bulk_create([
+        FeedEntry(
+            advertisement_id=row['id'],
+            title=row['title'],
+            slug=row['slug'],
+            summary=Truncator(row['description']).chars(200),
+            price=row['price'],
+            views=row['views'],
+            created_at=row['created_at'],
+            city_id=row['city_id'],
+            city_name=row['city__name'],
+            author_id=row['author_id'],
+            author_username=row['author__username'],
+        )
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ads', '0008_response_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('advertisement', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='ads.advertisement')),
+                ('title', models.CharField(max_length=200)),
+                ('slug', models.SlugField(max_length=200)),
+                ('summary', models.CharField(max_length=200, verbose_name='Начало описания')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField()),
+                ('city_id', models.PositiveBigIntegerField()),
+                ('city_name', models.CharField(max_length=100)),
+                ('author_id', models.PositiveBigIntegerField()),
+                ('author_username', models.CharField(max_length=150)),
+            ],
+            options={
+                'verbose_name': 'Строка ленты главной',
+                'verbose_name_plural': 'Лента главной',
+                'indexes': [models.Index(fields=['-created_at', '-advertisement'], name='ads_feed_created_idx')],
+            },
+        ),
+        migrations.RunPython(fill_feed, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.utils.text import slugify
+from .slugs import save_with_unique_slug
 import os
 
 class Tag(models.Model):
@@ -9,6 +10,7 @@ class Tag(models.Model):
     slug = models.SlugField(max_length=50, unique=True, verbose_name="URL-адрес тега")
     color = models.CharField(max_length=7, default="#007bff", verbose_name="Цвет тега")
     created_at = models.DateTimeField(auto_now_add=True)
+    ads_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Количество объявлений")
 
     class Meta:
         verbose_name = "Тег"
@@ -23,18 +25,14 @@ class Tag(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.name)
-            original_slug = self.slug
-            counter = 1
-            while Tag.objects.filter(slug=self.slug).exclude(id=self.id).exists():
-                self.slug = f"{original_slug}-{counter}"
-                counter += 1
+            return save_with_unique_slug(self, self.name, lambda: super(Tag, self).save(*args, **kwargs))
         super().save(*args, **kwargs)
 
 class Category(models.Model):
     name = models.CharField(max_length=100, verbose_name="Название категории")
     slug = models.SlugField(max_length=100, unique=True, verbose_name="URL-адрес категории")
     description = models.TextField(blank=True, verbose_name="Описание категории")
+    ads_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Количество объявлений")
 
     class Meta:
         verbose_name = "Категория"
@@ -56,6 +54,7 @@ class City(models.Model):
     name = models.CharField(max_length=100, unique=True, verbose_name="Название города")
     slug = models.SlugField(max_length=100, unique=True, verbose_name="URL-адрес города")
     created_at = models.DateTimeField(auto_now_add=True)
+    ads_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Количество объявлений")
 
     class Meta:
         verbose_name = "Город"
@@ -67,12 +66,7 @@ class City(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.name)
-            original_slug = self.slug
-            counter = 1
-            while City.objects.filter(slug=self.slug).exclude(id=self.id).exists():
-                self.slug = f"{original_slug}-{counter}"
-                counter += 1
+            return save_with_unique_slug(self, self.name, lambda: super(City, self).save(*args, **kwargs))
         super().save(*args, **kwargs)
 
 class Advertisement(models.Model):
@@ -82,38 +76,118 @@ class Advertisement(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     city = models.ForeignKey(City, on_delete=models.CASCADE)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, verbose_name="Категория")
-    tags = models.ManyToManyField(Tag, blank=True, verbose_name="Теги")
+    tags = models.ManyToManyField(Tag, blank=True, through='AdvertisementTag', verbose_name="Теги")
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     cover = models.ImageField(upload_to='covers/%Y/%m/%d/', blank=True, null=True)
+    cover_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Копии обложки")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     views = models.PositiveIntegerField(default=0, verbose_name="Просмотры")
 
+    class Meta:
+        indexes = [
+            # Фильтры списков с сортировкой по новизне
+            models.Index(fields=['category', '-created_at', '-id'], name='ads_ad_category_created_idx'),
+            models.Index(fields=['city', '-created_at', '-id'], name='ads_ad_city_created_idx'),
+            models.Index(fields=['author', '-created_at', '-id'], name='ads_ad_author_created_idx'),
+            # Сортировки с id как дополнительным ключом курсорной пагинации
+            models.Index(fields=['-created_at', '-id'], name='ads_ad_created_idx'),
+            models.Index(fields=['price', 'id'], name='ads_ad_price_idx'),
+            models.Index(fields=['views', 'id'], name='ads_ad_views_idx'),
+            models.Index(fields=['updated_at'], name='ads_ad_updated_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
     def save(self, *args, **kwargs):
+        def save():
+            # Счётчики объявлений в категории, городе и тегах меняются в той же транзакции
+            with transaction.atomic():
+                super(Advertisement, self).save(*args, **kwargs)
+
         if not self.slug:
-            self.slug = slugify(self.title)
-            original_slug = self.slug
-            counter = 1
-            while Advertisement.objects.filter(slug=self.slug).exists():
-                self.slug = f"{original_slug}-{counter}"
-                counter += 1
-        super().save(*args, **kwargs)
+            return save_with_unique_slug(self, self.title, save)
+        save()
 
     def get_absolute_url(self):
         return reverse('advertisement_detail', args=[str(self.slug)])
 
     def increment_views(self):
-        """Увеличивает счетчик просмотров"""
-        self.views += 1
-        self.save(update_fields=['views'])
+        """Учитывает просмотр в буферизованном счетчике"""
+        from .counters import get_view_counter
+
+        self.views += get_view_counter().hit(self.pk)
 
     def delete(self, *args, **kwargs):
         if self.cover and os.path.isfile(self.cover.path):
             os.remove(self.cover.path)
-        super().delete(*args, **kwargs)
+        if self.cover_variants:
+            from .images import delete_variants
+
+            delete_variants(self.cover.storage, self.cover_variants)
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
+class AdvertisementTag(models.Model):
+    """Связь объявления с тегом (таблица ads_advertisement_tags)"""
+    advertisement = models.ForeignKey(Advertisement, on_delete=models.CASCADE)
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
+
+    class Meta:
+        db_table = 'ads_advertisement_tags'
+        unique_together = [('advertisement', 'tag')]
+        indexes = [
+            # Выборка объявлений по тегу без обращения к основной таблице
+            models.Index(fields=['tag', 'advertisement'], name='ads_ad_tags_tag_ad_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.advertisement_id} — {self.tag_id}"
+
+class SimilarAdvertisement(models.Model):
+    """Предрасчитанный сосед объявления для блока «Похожие объявления»"""
+    advertisement = models.ForeignKey(Advertisement, on_delete=models.CASCADE, related_name='similar_links')
+    similar = models.ForeignKey(Advertisement, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField(verbose_name="Сходство")
+
+    class Meta:
+        verbose_name = "Похожее объявление"
+        verbose_name_plural = "Похожие объявления"
+        ordering = ['advertisement', '-score']
+        constraints = [
+            models.UniqueConstraint(fields=['advertisement', 'similar'], name='unique_similar_advertisement'),
+        ]
+        indexes = [
+            models.Index(fields=['advertisement', '-score'], name='ads_similar_ad_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.advertisement_id} → {self.similar_id} ({self.score:.3f})"
+
+class FeedEntry(models.Model):
+    """Строка снимка первых страниц главной (см. ads.feed)"""
+    advertisement = models.OneToOneField(Advertisement, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    title = models.CharField(max_length=200)
+    slug = models.SlugField(max_length=200)
+    summary = models.CharField(max_length=200, verbose_name="Начало описания")
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    views = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField()
+    city_id = models.PositiveBigIntegerField()
+    city_name = models.CharField(max_length=100)
+    author_id = models.PositiveBigIntegerField()
+    author_username = models.CharField(max_length=150)
+
+    class Meta:
+        verbose_name = "Строка ленты главной"
+        verbose_name_plural = "Лента главной"
+        indexes = [
+            models.Index(fields=['-created_at', '-advertisement'], name='ads_feed_created_idx'),
+        ]
+
+    def __str__(self):
+        return self.title
 
 class Response(models.Model):
     RESPONSE_STATUS = [
@@ -129,6 +203,14 @@ class Response(models.Model):
     status = models.CharField(max_length=10, choices=RESPONSE_STATUS, default='new')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Разделы профиля с курсорной пагинацией по новизне
+            models.Index(fields=['recipient', 'status', '-created_at', '-id'], name='ads_response_inbox_status_idx'),
+            models.Index(fields=['recipient', '-created_at', '-id'], name='ads_response_inbox_idx'),
+            models.Index(fields=['sender', '-created_at', '-id'], name='ads_response_outbox_idx'),
+        ]
+
     def __str__(self):
         return f"Отклик на {self.advertisement.title} от {self.sender.username}"
 
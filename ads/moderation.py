@@ -0,0 +1,90 @@
+"""Принятие и отклонение откликов.
+
+Статус меняется одним условным UPDATE по откликам получателя со статусом
+``new``, поэтому уже обработанный (в том числе параллельно) отклик не
+перезаписывается. При принятии можно сразу отклонить остальные новые
+отклики на те же объявления — тем же запросом через CASE. Для каждого
+запрошенного id возвращается результат, переходы пишутся в лог. UPDATE не
+вызывает сигналы, поэтому счётчик новых откликов меняется здесь же — на
+число строк, которое вернул UPDATE.
+"""
+import logging
+
+from django.db import transaction
+from django.db.models import Case, Q, Value, When
+
+from .models import Response
+from .notifications import adjust_new_response_counts
+
+logger = logging.getLogger(__name__)
+
+ACTIONS = {'accept': 'accepted', 'reject': 'rejected'}
+
+# Ограничения на запрошенные id: не больше MAX_IDS за раз, в диапазоне BigAutoField
+MAX_IDS = 500
+MAX_ID = 2 ** 63 - 1
+
+
+def is_valid_id(pk):
+    return isinstance(pk, int) and not isinstance(pk, bool) and 0 < pk <= MAX_ID
+
+
+@transaction.atomic
+def moderate_responses(user, ids, action, reject_others=False):
+    """Возвращает ([{id, result, status}], id автоматически отклонённых откликов).
+
+    result: ``changed``, ``unchanged`` (отклик уже не новый), ``forbidden``
+    (отклик адресован не пользователю) или ``not_found``.
+    """
+    if action not in ACTIONS:
+        raise ValueError(f'Неизвестное действие: {action}')
+    status = ACTIONS[action]
+    ids = list(dict.fromkeys(ids))
+    rows = {
+        row['id']: row
+        for row in Response.objects.select_for_update()
+        .filter(pk__in=ids)
+        .values('id', 'recipient_id', 'status', 'advertisement_id')
+    }
+    changed = [pk for pk in ids if pk in rows and rows[pk]['recipient_id'] == user.pk and rows[pk]['status'] == 'new']
+
+    auto_rejected = []
+    if changed:
+        targets = Q(pk__in=changed)
+        if action == 'accept' and reject_others:
+            others = Response.objects.select_for_update().filter(
+                recipient=user, status='new', advertisement_id__in={rows[pk]['advertisement_id'] for pk in changed}
+            ).exclude(pk__in=changed)
+            auto_rejected = list(others.values_list('pk', flat=True))
+            targets |= Q(pk__in=auto_rejected)
+        total = Response.objects.filter(targets, recipient=user, status='new').update(
+            status=Case(When(pk__in=changed, then=Value(status)), default=Value('rejected'))
+        )
+        if total != len(changed) + len(auto_rejected):
+            # Без блокировки строк снимок мог устареть: результаты берутся из статусов после UPDATE
+            current = dict(Response.objects.filter(pk__in=changed + auto_rejected).values_list('pk', 'status'))
+            for pk in changed:
+                if pk in current:
+                    rows[pk]['status'] = current[pk]
+                else:
+                    del rows[pk]
+            changed = [pk for pk in changed if current.get(pk) == status]
+            auto_rejected = [pk for pk in auto_rejected if current.get(pk) == 'rejected']
+        transaction.on_commit(lambda: adjust_new_response_counts({user.pk: -total}))
+        for pk in changed:
+            logger.info('Отклик %s: new → %s, пользователь %s', pk, status, user.pk)
+        for pk in auto_rejected:
+            logger.info('Отклик %s: new → rejected автоматически, пользователь %s', pk, user.pk)
+
+    results = []
+    for pk in ids:
+        row = rows.get(pk)
+        if row is None:
+            results.append({'id': pk, 'result': 'not_found', 'status': None})
+        elif row['recipient_id'] != user.pk:
+            results.append({'id': pk, 'result': 'forbidden', 'status': None})
+        elif pk in changed:
+            results.append({'id': pk, 'result': 'changed', 'status': status})
+        else:
+            results.append({'id': pk, 'result': 'unchanged', 'status': row['status']})
+    return results, auto_rejected
@@ -0,0 +1,81 @@
+"""Счётчик новых откликов пользователя.
+
+Число откликов со статусом ``new`` для каждого получателя хранится в общем
+кэше и меняется сигналами при создании отклика и смене его статуса, после
+фиксации транзакции. Если записи нет, число считается заново одним
+запросом по индексу (recipient, status, -created_at, -id). Локальный кэш
+процесса (LocMemCache по умолчанию) не узнал бы об откликах, сохранённых
+другими процессами, поэтому с ним счётчик не кэшируется и считается этим
+запросом при каждом чтении. Отдельные обработчики удаления откликов не
+подключены, чтобы не отключать быстрое каскадное удаление: при удалении
+объявления счётчик автора сбрасывается, остальное исправится по истечении
+``ADS_NOTIFICATIONS_TIMEOUT``.
+
+Опрос ``api/notifications/`` поддерживает ETag и при общем кэше читает
+только кэш; под ASGI есть поток server-sent events
+``api/notifications/stream/``.
+"""
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+
+from .cache import is_shared_cache
+from .models import Response
+
+KEY_PREFIX = 'ads:new_responses:'
+
+
+def _key(user_id):
+    return f'{KEY_PREFIX}{user_id}'
+
+
+def _shared():
+    # django.core.cache.cache — прокси, тип бэкенда виден только у самого кэша
+    return is_shared_cache(caches[DEFAULT_CACHE_ALIAS])
+
+
+def _timeout():
+    return getattr(settings, 'ADS_NOTIFICATIONS_TIMEOUT', 600)
+
+
+def new_responses_query(user_id):
+    return Response.objects.filter(recipient_id=user_id, status='new')
+
+
+def get_new_response_count(user_id):
+    if not _shared():
+        return new_responses_query(user_id).count()
+    count = cache.get(_key(user_id))
+    if count is None:
+        count = new_responses_query(user_id).count()
+        # add не затирает значение, которое успели изменить параллельно
+        cache.add(_key(user_id), count, _timeout())
+    return count
+
+
+async def aget_new_response_count(user_id):
+    if not _shared():
+        return await new_responses_query(user_id).acount()
+    count = await cache.aget(_key(user_id))
+    if count is None:
+        count = await new_responses_query(user_id).acount()
+        await cache.aadd(_key(user_id), count, _timeout())
+    return count
+
+
+def adjust_new_response_counts(deltas):
+    """Меняет счётчики пользователей на {id пользователя: разница}"""
+    if not _shared():
+        return
+    for user_id, delta in deltas.items():
+        try:
+            if delta > 0:
+                cache.incr(_key(user_id), delta)
+            elif delta < 0:
+                cache.decr(_key(user_id), -delta)
+        except ValueError:
+            # Счётчика нет в кэше — он будет посчитан при следующем чтении
+            pass
+
+
+def reset_new_response_count(user_id):
+    cache.delete(_key(user_id))
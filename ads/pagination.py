@@ -0,0 +1,190 @@
+"""Курсорная (keyset) пагинация списков объявлений.
+
+Вместо OFFSET следующая страница выбирается условием по значению поля
+сортировки и id последнего показанного объявления, поэтому глубокие
+страницы открываются так же быстро, как первая. Курсор подписан и не
+раскрывает своё содержимое. Общее количество объявлений кэшируется.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import Q
+from django.http import Http404
+from django.utils.functional import cached_property
+
+SORT_OPTIONS = ['created_at', '-created_at', 'price', '-price', 'views', '-views']
+DEFAULT_SORT = '-created_at'
+
+CURSOR_SALT = 'ads.pagination.cursor'
+
+
+def get_sort(params, default=DEFAULT_SORT):
+    sort_by = params.get('sort')
+    return sort_by if sort_by in SORT_OPTIONS else default
+
+
+def encode_cursor(field, obj, direction):
+    # Строки .values() — словари, в них обязательно должны быть поле сортировки и id
+    if isinstance(obj, dict):
+        value, pk = obj[field], obj['id']
+    else:
+        value, pk = getattr(obj, field), obj.pk
+    return signing.dumps({'v': str(value), 'id': pk, 'd': direction}, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(token, model, field):
+    try:
+        data = signing.loads(token, salt=CURSOR_SALT)
+        value = model._meta.get_field(field).to_python(data['v'])
+        return value, int(data['id']), data['d']
+    except (signing.BadSignature, KeyError, TypeError, ValueError) as exc:
+        raise Http404('Неверный курсор страницы') from exc
+
+
+def cached_count(queryset):
+    """Количество строк запроса, закэшированное на ADS_PAGINATION_COUNT_TIMEOUT секунд"""
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.md5(f'{sql}{params}'.encode()).hexdigest()
+    timeout = getattr(settings, 'ADS_PAGINATION_COUNT_TIMEOUT', 60)
+    return cache.get_or_set(f'ads:count:{digest}', queryset.count, timeout)
+
+
+async def acached_count(queryset):
+    """Асинхронный вариант cached_count"""
+    sql, params = queryset.query.sql_with_params()
+    key = f'ads:count:{hashlib.md5(f"{sql}{params}".encode()).hexdigest()}'
+    count = await cache.aget(key)
+    if count is None:
+        count = await queryset.acount()
+        await cache.aset(key, count, getattr(settings, 'ADS_PAGINATION_COUNT_TIMEOUT', 60))
+    return count
+
+
+class CursorPaginator:
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    @cached_property
+    def count(self):
+        return cached_count(self.queryset.order_by())
+
+
+class CursorPage:
+    """Страница с интерфейсом, похожим на django.core.paginator.Page"""
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def _cursor_query(queryset, sort, per_page, token):
+    """Запрос одной страницы (на строку больше для проверки продолжения) и направление листания"""
+    field = sort.lstrip('-')
+    descending = sort.startswith('-')
+
+    direction = 'next'
+    if token:
+        value, pk, direction = decode_cursor(token, queryset.model, field)
+        after = direction == 'next'
+        # Для убывающей сортировки «после» означает «меньше»
+        lookup = 'lt' if descending == after else 'gt'
+        queryset = queryset.filter(
+            Q(**{f'{field}__{lookup}': value}) | Q(**{field: value, f'pk__{lookup}': pk})
+        )
+
+    ordering = [sort, '-pk' if descending else 'pk']
+    if direction == 'previous':
+        ordering = [item[1:] if item.startswith('-') else f'-{item}' for item in ordering]
+    return queryset.order_by(*ordering)[:per_page + 1], direction
+
+
+def _cursor_page(rows, paginator, sort, token, direction):
+    field = sort.lstrip('-')
+    has_more = len(rows) > paginator.per_page
+    rows = rows[:paginator.per_page]
+    if direction == 'previous':
+        rows.reverse()
+
+    if direction == 'next':
+        next_cursor = encode_cursor(field, rows[-1], 'next') if has_more else None
+        previous_cursor = encode_cursor(field, rows[0], 'previous') if token and rows else None
+    else:
+        next_cursor = encode_cursor(field, rows[-1], 'next') if rows else None
+        previous_cursor = encode_cursor(field, rows[0], 'previous') if has_more else None
+    return CursorPage(rows, paginator, next_cursor, previous_cursor)
+
+
+def paginate_by_cursor(queryset, sort, per_page, token=None):
+    """Возвращает CursorPage для запроса, отсортированного по ``sort`` с id как дополнительным ключом"""
+    page_query, direction = _cursor_query(queryset, sort, per_page, token)
+    return _cursor_page(list(page_query), CursorPaginator(queryset, per_page), sort, token, direction)
+
+
+async def apaginate_by_cursor(queryset, sort, per_page, token=None):
+    """Асинхронный вариант paginate_by_cursor"""
+    page_query, direction = _cursor_query(queryset, sort, per_page, token)
+    rows = [row async for row in page_query]
+    return _cursor_page(rows, CursorPaginator(queryset, per_page), sort, token, direction)
+
+
+class CursorPaginationMixin:
+    """Курсорная пагинация и сортировка для ListView объявлений"""
+
+    cursor_param = 'cursor'
+    default_sort = DEFAULT_SORT
+
+    def get_sort(self):
+        return get_sort(self.request.GET, self.default_sort)
+
+    def use_cursor_pagination(self):
+        return True
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.use_cursor_pagination():
+            return super().paginate_queryset(queryset, page_size)
+        page = paginate_by_cursor(
+            queryset, self.get_sort(), page_size, self.request.GET.get(self.cursor_param)
+        )
+        return page.paginator, page, page.object_list, page.has_other_pages()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+
+        params = self.request.GET.copy()
+        for param in (self.page_kwarg, self.cursor_param):
+            params.pop(param, None)
+        context['querystring'] = params.urlencode()
+
+        page = context.get('page_obj')
+        context['next_page_query'] = context['previous_page_query'] = ''
+        if isinstance(page, CursorPage):
+            if page.has_next():
+                context['next_page_query'] = f'{self.cursor_param}={page.next_cursor}'
+            if page.has_previous():
+                context['previous_page_query'] = f'{self.cursor_param}={page.previous_cursor}'
+        elif page is not None:
+            if page.has_next():
+                context['next_page_query'] = f'{self.page_kwarg}={page.next_page_number()}'
+            if page.has_previous():
+                context['previous_page_query'] = f'{self.page_kwarg}={page.previous_page_number()}'
+        return context
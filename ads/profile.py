@@ -0,0 +1,56 @@
+"""Запросы для страницы профиля.
+
+Каждый раздел профиля (объявления, полученные и отправленные отклики)
+листается курсором независимо от остальных. Для объявлений на странице
+число откликов по статусам считается одним запросом с группировкой, для
+полученных откликов — их количество по статусам для фильтра. Выборки
+откликов идут по индексам (recipient, status, -created_at, -id),
+(recipient, -created_at, -id) и (sender, -created_at, -id).
+"""
+from django.db.models import Count, Q
+
+from .models import Advertisement, Response
+
+SECTIONS = ('advertisements', 'received_responses', 'sent_responses')
+RESPONSE_STATUSES = [status for status, _ in Response.RESPONSE_STATUS]
+
+
+def get_section_querysets(user, received_status=None):
+    received = Response.objects.filter(recipient=user)
+    if received_status:
+        received = received.filter(status=received_status)
+    return {
+        'advertisements': Advertisement.objects.filter(author=user).select_related('city'),
+        'received_responses': received.select_related('advertisement', 'sender'),
+        'sent_responses': Response.objects.filter(sender=user).select_related('advertisement', 'recipient'),
+    }
+
+
+def response_stats_query(advertisement_ids):
+    """Строки {advertisement_id, total, new, accepted, rejected} для объявлений"""
+    return (
+        Response.objects.filter(advertisement_id__in=advertisement_ids)
+        .values('advertisement_id')
+        .annotate(total=Count('id'), **{status: Count('id', filter=Q(status=status)) for status in RESPONSE_STATUSES})
+        .order_by()
+    )
+
+
+def attach_response_stats(advertisements, rows):
+    """Записывает в ad.response_stats число откликов всего и по статусам"""
+    stats = {row.pop('advertisement_id'): row for row in rows}
+    empty = dict.fromkeys(['total', *RESPONSE_STATUSES], 0)
+    for advertisement in advertisements:
+        advertisement.response_stats = stats.get(advertisement.pk, empty)
+
+
+def status_counts_query(user):
+    return Response.objects.filter(recipient=user).values('status').annotate(count=Count('id')).order_by()
+
+
+def get_status_counts(rows):
+    """{'all': …, 'new': …, 'accepted': …, 'rejected': …} из строк status_counts_query"""
+    counts = dict.fromkeys(RESPONSE_STATUSES, 0)
+    counts.update((row['status'], row['count']) for row in rows)
+    counts['all'] = sum(counts.values())
+    return counts
@@ -0,0 +1,153 @@
+"""Расчёт похожих объявлений.
+
+Сходство двух объявлений — взвешенная сумма косинусной близости их тегов,
+совпадения категории, города и ценового диапазона. Для каждого объявления в
+таблицу ``SimilarAdvertisement`` сохраняются ``top_k`` лучших соседей.
+
+Кандидаты — объявления с общей категорией или тегом, они берутся из
+инвертированных списков «тег → объявления» и «категория → объявления»
+(массивы NumPy в формате CSR), поэтому память растёт с числом связей
+объявлений с тегами, а не с произведением числа объявлений на число тегов.
+"""
+import math
+
+import numpy as np
+from django.db import transaction
+
+from .models import Advertisement, SimilarAdvertisement
+from .similar import invalidate_similar_advertisements
+
+
+def _inverted_lists(keys, values, size):
+    """Списки values, сгруппированные по keys: (указатели, значения) в формате CSR"""
+    order = np.argsort(keys, kind='stable')
+    pointers = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=size), out=pointers[1:])
+    return pointers, values[order]
+
+
+class SimilarityEngine:
+    tag_weight = 3.0
+    category_weight = 1.0
+    city_weight = 0.5
+    price_weight = 0.5
+
+    def __init__(self, top_k=8, batch_size=200):
+        self.top_k = top_k
+        self.batch_size = batch_size
+
+    def load(self):
+        """Загружает каталог и инвертированные списки в массивы NumPy"""
+        rows = list(Advertisement.objects.order_by('pk').values_list('pk', 'category_id', 'city_id', 'price'))
+        self.ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.positions = {pk: position for position, pk in enumerate(self.ids.tolist())}
+        self.cities = np.array([row[2] for row in rows], dtype=np.int64)
+        # Ценовой диапазон — двоичный логарифм цены
+        self.price_bands = np.array([int(math.log2(float(row[3]) + 1)) for row in rows], dtype=np.int64)
+        category_ids, self.categories = np.unique(
+            np.array([row[1] for row in rows], dtype=np.int64), return_inverse=True,
+        )
+        self.category_pointers, self.category_members = _inverted_lists(
+            self.categories, np.arange(len(rows), dtype=np.int64), len(category_ids),
+        )
+
+        pairs = np.array(
+            [
+                (self.positions[advertisement_id], tag_id)
+                for advertisement_id, tag_id in Advertisement.tags.through.objects.values_list('advertisement_id', 'tag_id')
+                if advertisement_id in self.positions
+            ],
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        tag_ids, tag_columns = np.unique(pairs[:, 1], return_inverse=True)
+        self.tag_pointers, self.tag_members = _inverted_lists(tag_columns, pairs[:, 0], len(tag_ids))
+        self.ad_tag_pointers, self.ad_tags = _inverted_lists(pairs[:, 0], tag_columns, len(rows))
+        self.tag_norms = np.sqrt(np.diff(self.ad_tag_pointers)).astype(np.float32)
+
+    def _tags_of(self, row):
+        return self.ad_tags[self.ad_tag_pointers[row]:self.ad_tag_pointers[row + 1]]
+
+    def _members_of(self, tag):
+        return self.tag_members[self.tag_pointers[tag]:self.tag_pointers[tag + 1]]
+
+    def score(self, row):
+        """Кандидаты в соседи объявления row и их оценки сходства"""
+        tags = self._tags_of(row)
+        if len(tags):
+            tagged, shared = np.unique(np.concatenate([self._members_of(tag) for tag in tags]), return_counts=True)
+        else:
+            tagged, shared = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        category = self.categories[row]
+        same_category = self.category_members[self.category_pointers[category]:self.category_pointers[category + 1]]
+
+        candidates = np.union1d(tagged, same_category)
+        candidates = candidates[candidates != row]
+        shared_tags = np.zeros(len(candidates), dtype=np.float32)
+        found = np.isin(tagged, candidates)
+        shared_tags[np.searchsorted(candidates, tagged[found])] = shared[found]
+
+        norms = self.tag_norms[row] * self.tag_norms[candidates]
+        tag_similarity = np.divide(shared_tags, norms, out=np.zeros_like(shared_tags), where=norms > 0)
+        band_distance = np.abs(self.price_bands[row] - self.price_bands[candidates])
+        price_similarity = np.clip(1.0 - band_distance / 2.0, 0.0, 1.0)
+
+        scores = (
+            self.tag_weight * tag_similarity
+            + self.category_weight * (self.categories[candidates] == category)
+            + self.city_weight * (self.cities[candidates] == self.cities[row])
+            + self.price_weight * price_similarity
+        )
+        return candidates, scores
+
+    def affected_rows(self, advertisement_ids):
+        """Строки изменённых объявлений и объявлений, в чьих соседях они могут оказаться или уже есть"""
+        rows = {self.positions[pk] for pk in advertisement_ids if pk in self.positions}
+        # Объявления с общими тегами могут получить изменённое объявление в соседи
+        for row in list(rows):
+            for tag in self._tags_of(row):
+                rows.update(self._members_of(tag).tolist())
+        # А те, у кого оно уже в соседях, могут его потерять (например, после удаления тега)
+        advertisement_ids = list(advertisement_ids)
+        for start in range(0, len(advertisement_ids), self.batch_size):
+            rows.update(
+                self.positions[pk]
+                for pk in SimilarAdvertisement.objects.filter(
+                    similar_id__in=advertisement_ids[start:start + self.batch_size],
+                ).values_list('advertisement_id', flat=True).distinct()
+                if pk in self.positions
+            )
+        return np.array(sorted(rows), dtype=np.int64)
+
+    def compute(self, advertisement_ids=None):
+        """Пересчитывает соседей для указанных объявлений и затронутых ими (по умолчанию для всех)"""
+        self.load()
+        if advertisement_ids is None:
+            rows = np.arange(len(self.ids))
+        else:
+            rows = self.affected_rows(advertisement_ids)
+
+        total = 0
+        for start in range(0, len(rows), self.batch_size):
+            total += self._compute_batch(rows[start:start + self.batch_size])
+        invalidate_similar_advertisements()
+        return total
+
+    def _compute_batch(self, rows):
+        links = []
+        for row in rows.tolist():
+            candidates, scores = self.score(row)
+            k = min(self.top_k, len(candidates))
+            if not k:
+                continue
+            best = np.argpartition(-scores, k - 1)[:k]
+            for column, value in zip(candidates[best].tolist(), scores[best].tolist()):
+                links.append(SimilarAdvertisement(
+                    advertisement_id=int(self.ids[row]),
+                    similar_id=int(self.ids[column]),
+                    score=value,
+                ))
+
+        with transaction.atomic():
+            SimilarAdvertisement.objects.filter(advertisement_id__in=self.ids[rows].tolist()).delete()
+            SimilarAdvertisement.objects.bulk_create(links, batch_size=1000)
+        return len(rows)
@@ -0,0 +1,141 @@
+"""Импорт справочников (города, категории) пачками.
+
+Строки читаются потоком из CSV, JSON Lines или JSON, сравниваются с уже
+существующими записями и записываются через
+``bulk_create(update_conflicts=True)`` в одной транзакции. Ничего не
+удаляется, поэтому повторный импорт того же файла ничего не меняет.
+"""
+import csv
+import json
+import os
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import invalidate
+from .models import Advertisement, Category, City
+from .slugs import allocate_slugs, make_slug
+
+# Модель: (поле-ключ, поля для обновления, зависимость кэша страниц)
+REFERENCE_MODELS = {
+    'city': (City, 'name', ['slug'], 'cities'),
+    'category': (Category, 'slug', ['name', 'description'], 'categories'),
+}
+
+
+def read_rows(path):
+    """Возвращает итератор словарей из .csv, .jsonl/.ndjson или .json"""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, encoding='utf-8', newline='') as source:
+        if extension == '.csv':
+            yield from csv.DictReader(source)
+        elif extension in ('.jsonl', '.ndjson'):
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+        elif extension == '.json':
+            yield from json.load(source)
+        else:
+            raise ValueError(f'Неподдерживаемый формат файла: {extension}')
+
+
+def import_reference_data(kind, rows, batch_size=1000, log=None):
+    """Загружает строки справочника kind и возвращает Counter(created, updated, unchanged, skipped, rejected).
+
+    Строки, slug которых уже занят другой записью, отклоняются; причина
+    передаётся в log.
+    """
+    model, key, update_fields, dependency = REFERENCE_MODELS[kind]
+    fields = [key] + [field for field in update_fields if field != key]
+    result = Counter(created=0, updated=0, unchanged=0)
+    log = log or (lambda message: None)
+    # slug, назначенные строками импорта: {slug: значение ключа}
+    claimed = {}
+    changed = []
+
+    with transaction.atomic():
+        batch, numbers = {}, {}
+        for number, row in enumerate(rows, start=1):
+            # Значения из JSON могут быть числами
+            values = {field: str(row[field]).strip() for field in fields if row.get(field) is not None}
+            if not values.get(key) and key == 'slug' and values.get('name'):
+                values['slug'] = make_slug(values['name'])
+            if not values.get(key):
+                result['skipped'] += 1
+                continue
+            batch[values[key]] = values
+            numbers[values[key]] = number
+            if len(batch) >= batch_size:
+                changed += _import_batch(model, key, fields, batch, numbers, result, claimed, log)
+                batch, numbers = {}, {}
+        if batch:
+            changed += _import_batch(model, key, fields, batch, numbers, result, claimed, log)
+
+    if result['created'] or result['updated']:
+        # Страницы категорий кэшируются по своему slug и выводят название и описание категории
+        pages = [f'category:{slug}' for slug in changed] if model is Category else []
+        invalidate(dependency, *pages)
+    return result
+
+
+def _reject_taken_slugs(model, key, batch, existing, numbers, result, claimed, log):
+    """Убирает из пачки строки, чей новый slug занят другой записью справочника или строкой импорта"""
+    wanted = {
+        key_value: values['slug']
+        for key_value, values in batch.items()
+        if values.get('slug') and values['slug'] != existing.get(key_value, {}).get('slug')
+    }
+    if not wanted:
+        return
+    owners = dict(model.objects.filter(slug__in=set(wanted.values())).values_list('slug', key))
+    for key_value, slug in wanted.items():
+        owner = claimed.get(slug, owners.get(slug, key_value))
+        if owner != key_value:
+            result['rejected'] += 1
+            log(f'Строка {numbers[key_value]}: slug {slug} уже занят записью «{owner}»')
+            del batch[key_value]
+        else:
+            claimed[slug] = key_value
+
+
+def _import_batch(model, key, fields, batch, numbers, result, claimed, log):
+    """Записывает пачку и возвращает значения ключа созданных и изменённых записей"""
+    existing = {obj[key]: obj for obj in model.objects.filter(**{f'{key}__in': list(batch)}).values(*fields)}
+    if key != 'slug':
+        # Иначе нарушение уникальности slug откатило бы весь импорт
+        _reject_taken_slugs(model, key, batch, existing, numbers, result, claimed, log)
+    # Slug для всех новых записей пачки выбираются одним запросом по префиксам
+    missing_slugs = [values for key_value, values in batch.items() if key_value not in existing and not values.get('slug')]
+    allocated = allocate_slugs(model, [values['name'] for values in missing_slugs], reserved=claimed)
+    for values, slug in zip(missing_slugs, allocated):
+        values['slug'] = slug
+
+    objects, moved = [], []
+    for key_value, values in batch.items():
+        current = existing.get(key_value)
+        if current is None:
+            result['created'] += 1
+        else:
+            # Отсутствующие во входных данных поля остаются прежними
+            values = {**current, **{field: value for field, value in values.items() if value}}
+            if values == current:
+                result['unchanged'] += 1
+                continue
+            result['updated'] += 1
+            if key != 'slug' and values.get('slug') != current.get('slug'):
+                moved.append(key_value)
+        objects.append(model(**values))
+
+    if objects:
+        model.objects.bulk_create(
+            objects,
+            update_conflicts=True,
+            unique_fields=[key],
+            update_fields=[field for field in fields if field != key],
+        )
+    if moved:
+        # slug выводится в JSON API объявлений, их ETag строится по updated_at
+        relation = model._meta.model_name
+        Advertisement.objects.filter(**{f'{relation}__{key}__in': moved}).update(updated_at=timezone.now())
+    return [getattr(obj, key) for obj in objects]
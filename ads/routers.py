@@ -0,0 +1,130 @@
+"""Чтение объявлений с реплик базы данных.
+
+``ReplicaRoutingMiddleware`` разрешает чтение с реплик (``ADS_READ_REPLICAS``)
+только для безопасных запросов (GET, HEAD) и только моделям приложения
+``ads``; пользователи и сессии всегда читаются с основной базы. Запись
+всегда идёт в основную базу. После того как пользователь создал или
+изменил объявление или отклик (в том числе GET-ссылкой «Принять» или
+«Отклонить»), ему ставится cookie, и следующие
+``ADS_REPLICA_STICKY_SECONDS`` секунд он читает с основной базы, чтобы
+сразу увидеть свои изменения, даже если реплика отстаёт. Служебные записи
+вроде сброса счётчика просмотров выполняются в ``untracked_writes()`` и
+cookie не ставят. Недоступная реплика пропускается на
+``ADS_REPLICA_RETRY_SECONDS`` секунд.
+"""
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+STICKY_COOKIE = 'ads_read_primary'
+STICKY_MODELS = ('ads.advertisement', 'ads.response')
+
+_read_from_replica = ContextVar('ads_read_from_replica', default=False)
+_wrote = ContextVar('ads_wrote', default=False)
+_track_writes = ContextVar('ads_track_writes', default=True)
+_unavailable_until = {}
+
+
+@contextmanager
+def untracked_writes():
+    """Записи внутри блока не переключают пользователя на чтение с основной базы"""
+    token = _track_writes.set(False)
+    try:
+        yield
+    finally:
+        _track_writes.reset(token)
+
+
+def get_replicas():
+    return list(getattr(settings, 'ADS_READ_REPLICAS', []))
+
+
+def replica_available(alias):
+    """Проверяет соединение с репликой; после ошибки не пробует её ADS_REPLICA_RETRY_SECONDS секунд"""
+    if _unavailable_until.get(alias, 0) > time.monotonic():
+        return False
+    try:
+        connections[alias].ensure_connection()
+    except DatabaseError:
+        logger.warning('Реплика %s недоступна, чтение переключено на основную базу', alias, exc_info=True)
+        _unavailable_until[alias] = time.monotonic() + getattr(settings, 'ADS_REPLICA_RETRY_SECONDS', 30)
+        return False
+    _unavailable_until.pop(alias, None)
+    return True
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # После записи в этом же запросе читаем то, что записали, с основной базы
+        if not _read_from_replica.get() or _wrote.get() or model._meta.app_label != 'ads':
+            return None
+        replicas = get_replicas()
+        random.shuffle(replicas)
+        for alias in replicas:
+            if replica_available(alias):
+                return alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        if _track_writes.get() and model._meta.label_lower in STICKY_MODELS:
+            _wrote.set(True)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база
+        return True
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tokens = self.start(request)
+        try:
+            return self.finish(request, self.get_response(request))
+        finally:
+            self.reset(tokens)
+
+    async def __acall__(self, request):
+        tokens = self.start(request)
+        try:
+            return self.finish(request, await self.get_response(request))
+        finally:
+            self.reset(tokens)
+
+    def start(self, request):
+        use_replica = request.method in SAFE_METHODS and bool(get_replicas()) and STICKY_COOKIE not in request.COOKIES
+        return _read_from_replica.set(use_replica), _wrote.set(False)
+
+    def finish(self, request, response):
+        if _wrote.get():
+            response.set_cookie(
+                STICKY_COOKIE,
+                '1',
+                max_age=getattr(settings, 'ADS_REPLICA_STICKY_SECONDS', 10),
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    def reset(self, tokens):
+        read_token, wrote_token = tokens
+        _read_from_replica.reset(read_token)
+        _wrote.reset(wrote_token)
@@ -0,0 +1,232 @@
+"""Полнотекстовый поиск по объявлениям.
+
+Индекс строится по нормализованным (приведённым к основе) словам из
+``Advertisement.title`` и ``Advertisement.description``. Бэкенд выбирается
+настройкой ``ADS_SEARCH_BACKEND``; по умолчанию используется SQLite FTS5.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+WORD_RE = re.compile(r'\w+')
+
+# Стеммер Портера для русского языка (Snowball)
+_PERFECTIVE_GERUND = re.compile(r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+_REFLEXIVE = re.compile(r'(с[яь])$')
+_ADJECTIVE = re.compile(r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$')
+_PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+_VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)'
+    r'|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+)
+_NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+_RV = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+_DERIVATIONAL = re.compile(r'.*[^аеиоуыэюя]+[аеиоуыэюя].*ость?$')
+_DER = re.compile(r'ость?$')
+_SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+_I = re.compile(r'и$')
+_SOFT_SIGN = re.compile(r'ь$')
+_NN = re.compile(r'нн$')
+
+
+def stem(word):
+    """Возвращает основу русского слова; остальные слова не изменяются"""
+    match = _RV.match(word)
+    if not match:
+        return word
+    prefix, rv = match.groups()
+
+    temp = _PERFECTIVE_GERUND.sub('', rv, 1)
+    if temp == rv:
+        rv = _REFLEXIVE.sub('', rv, 1)
+        temp = _ADJECTIVE.sub('', rv, 1)
+        if temp != rv:
+            rv = _PARTICIPLE.sub('', temp, 1)
+        else:
+            temp = _VERB.sub('', rv, 1)
+            rv = _NOUN.sub('', rv, 1) if temp == rv else temp
+    else:
+        rv = temp
+
+    rv = _I.sub('', rv, 1)
+    if _DERIVATIONAL.match(rv):
+        rv = _DER.sub('', rv, 1)
+
+    temp = _SOFT_SIGN.sub('', rv, 1)
+    if temp == rv:
+        rv = _SUPERLATIVE.sub('', rv, 1)
+        rv = _NN.sub('н', rv, 1)
+    else:
+        rv = temp
+    return prefix + rv
+
+
+def normalize(text):
+    """Разбивает текст на слова и приводит их к основе"""
+    text = (text or '').lower().replace('ё', 'е')
+    return [stem(word) for word in WORD_RE.findall(text)]
+
+
+class BaseSearchBackend:
+    """Интерфейс поискового бэкенда"""
+
+    def is_available(self):
+        return True
+
+    def setup(self):
+        """Создаёт служебные структуры индекса (вызывается после migrate)"""
+
+    def index(self, advertisement):
+        raise NotImplementedError
+
+    def index_many(self, advertisements):
+        """Индексирует новые объявления (массовая загрузка идёт в обход сигналов)"""
+        for advertisement in advertisements:
+            self.index(advertisement)
+
+    def remove(self, advertisement_id):
+        raise NotImplementedError
+
+    def rebuild(self, queryset, batch_size=500):
+        raise NotImplementedError
+
+    def search(self, query, limit=None):
+        """Возвращает список id объявлений, отсортированный по релевантности"""
+        raise NotImplementedError
+
+    def condition(self, query):
+        """Условие Q на все найденные объявления, без ограничения ADS_SEARCH_RESULTS_LIMIT"""
+        raise NotImplementedError
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Запасной бэкенд без отдельного индекса: поиск через icontains"""
+
+    def index(self, advertisement):
+        pass
+
+    def remove(self, advertisement_id):
+        pass
+
+    def rebuild(self, queryset, batch_size=500):
+        return queryset.count()
+
+    def search(self, query, limit=None):
+        from .models import Advertisement
+
+        ids = Advertisement.objects.filter(self.condition(query)).order_by('-created_at').values_list('id', flat=True)
+        return list(ids[:limit or get_results_limit()])
+
+    def condition(self, query):
+        words = WORD_RE.findall(query or '')
+        if not words:
+            return Q(pk__in=[])
+        condition = Q()
+        for word in words:
+            condition &= Q(title__icontains=word) | Q(description__icontains=word)
+        return condition
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """Инвертированный индекс на виртуальной таблице SQLite FTS5"""
+
+    table = 'ads_advertisement_fts'
+    # Вес совпадений в заголовке и в описании для bm25()
+    title_weight = 10.0
+    description_weight = 1.0
+
+    def is_available(self):
+        return connection.vendor == 'sqlite'
+
+    def setup(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} "
+                f"USING fts5(title, description, tokenize='unicode61 remove_diacritics 2')"
+            )
+
+    def _document(self, title, description):
+        return ' '.join(normalize(title)), ' '.join(normalize(description))
+
+    def index(self, advertisement):
+        title, description = self._document(advertisement.title, advertisement.description)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [advertisement.pk])
+            cursor.execute(
+                f"INSERT INTO {self.table} (rowid, title, description) VALUES (%s, %s, %s)",
+                [advertisement.pk, title, description],
+            )
+
+    def index_many(self, advertisements):
+        rows = [(ad.pk, *self._document(ad.title, ad.description)) for ad in advertisements]
+        if rows:
+            with connection.cursor() as cursor:
+                self._insert_many(cursor, rows)
+
+    def remove(self, advertisement_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [advertisement_id])
+
+    def rebuild(self, queryset, batch_size=500):
+        self.setup()
+        total = 0
+        rows = queryset.order_by('pk').values_list('pk', 'title', 'description')
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+            batch = []
+            for pk, title, description in rows.iterator(chunk_size=batch_size):
+                batch.append((pk, *self._document(title, description)))
+                if len(batch) >= batch_size:
+                    total += self._insert_many(cursor, batch)
+                    batch = []
+            if batch:
+                total += self._insert_many(cursor, batch)
+        return total
+
+    def _insert_many(self, cursor, rows):
+        cursor.executemany(
+            f"INSERT INTO {self.table} (rowid, title, description) VALUES (%s, %s, %s)",
+            rows,
+        )
+        return len(rows)
+
+    def _match(self, query):
+        # Каждое слово ищем как префикс основы, чтобы поиск работал при наборе
+        return ' '.join(f'"{word}"*' for word in normalize(query))
+
+    def search(self, query, limit=None):
+        match = self._match(query)
+        if not match:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s "
+                f"ORDER BY bm25({self.table}, %s, %s) LIMIT %s",
+                [match, self.title_weight, self.description_weight, limit or get_results_limit()],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def condition(self, query):
+        match = self._match(query)
+        if not match:
+            return Q(pk__in=[])
+        return Q(pk__in=RawSQL(f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s", [match]))
+
+
+def get_results_limit():
+    return getattr(settings, 'ADS_SEARCH_RESULTS_LIMIT', 500)
+
+
+def get_search_backend():
+    """Возвращает настроенный бэкенд или запасной, если он недоступен для текущей БД"""
+    backend_path = getattr(settings, 'ADS_SEARCH_BACKEND', 'ads.search.SQLiteFTSBackend')
+    backend = import_string(backend_path)()
+    if not backend.is_available():
+        return DatabaseSearchBackend()
+    return backend
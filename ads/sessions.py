@@ -0,0 +1,63 @@
+"""Сессии без записи на каждый запрос.
+
+Сессии хранятся в базе, при общем кэше — в ``cached_db`` (чтение из кэша,
+запись в кэш и базу) или в подписанных cookie, а
+``SESSION_SAVE_EVERY_REQUEST`` выключен. Чтобы активный пользователь не
+разлогинивался через ``SESSION_COOKIE_AGE``, ``SlidingSessionMiddleware``
+продлевает сессию, только когда до её истечения остаётся меньше
+``ADS_SESSION_REFRESH_THRESHOLD`` секунд, — одна запись вместо записи на
+каждый запрос. При входе сессия и так сохраняется с полным сроком, поэтому
+сразу помечается продлённой. Истёкшие сессии удаляются командой
+``purge_sessions`` небольшими пачками.
+"""
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.deprecation import MiddlewareMixin
+
+REFRESHED_KEY = '_ads_session_refreshed'
+
+
+def mark_refreshed(session):
+    session[REFRESHED_KEY] = int(time.time())
+
+
+def get_session_model():
+    """Модель сессий текущего SESSION_ENGINE или None, если сессии хранятся не в базе"""
+    store = import_module(settings.SESSION_ENGINE).SessionStore
+    return store.get_model_class() if hasattr(store, 'get_model_class') else None
+
+
+def purge_expired_sessions(batch_size=1000, pause=0.0, log=None):
+    """Удаляет истёкшие сессии пачками по batch_size, каждую в своей транзакции"""
+    model = get_session_model()
+    log = log or (lambda message: None)
+    deleted = 0
+    now = timezone.now()
+    while True:
+        keys = list(model.objects.filter(expire_date__lt=now).values_list('session_key', flat=True)[:batch_size])
+        if not keys:
+            return deleted
+        deleted += model.objects.filter(session_key__in=keys).delete()[0]
+        log(f'Удалено сессий: {deleted}')
+        if pause:
+            time.sleep(pause)
+
+
+class SlidingSessionMiddleware(MiddlewareMixin):
+    def process_response(self, request, response):
+        session = getattr(request, 'session', None)
+        # Не загружаем сессию ради продления и не создаём её для анонимных посетителей
+        if session is None or not session.accessed or session.is_empty():
+            return response
+        if session.get_expire_at_browser_close():
+            return response
+
+        threshold = getattr(settings, 'ADS_SESSION_REFRESH_THRESHOLD', settings.SESSION_COOKIE_AGE // 2)
+        expires = session.get(REFRESHED_KEY, 0) + session.get_expiry_age()
+        # Изменённую сессию SessionMiddleware сохранит с новым сроком и заново выставит cookie
+        if session.modified or expires - time.time() < threshold:
+            mark_refreshed(session)
+        return response
@@ -0,0 +1,311 @@
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .ad_counts import adjust_ads_count
+from .cache import invalidate
+from .feed import fill_feed, refresh_feed_entries, update_feed
+from .images import schedule_cover_processing
+from .models import Advertisement, AdvertisementTag, Category, City, Response, Tag
+from .notifications import adjust_new_response_counts, reset_new_response_count
+from .search import get_search_backend
+from .sessions import mark_refreshed
+from .similar import invalidate_similar_advertisements
+
+
+def touch_advertisements(**filters):
+    """Сдвигает updated_at объявлений, вывод которых изменился вне их строк (ETag JSON API)"""
+    Advertisement.objects.filter(**filters).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Advertisement)
+def index_advertisement(sender, instance, update_fields=None, raw=False, **kwargs):
+    """Обновляет поисковый индекс при сохранении объявления"""
+    if raw:
+        return
+    if update_fields is not None and not {'title', 'description'} & set(update_fields):
+        return
+    get_search_backend().index(instance)
+
+
+@receiver(post_delete, sender=Advertisement)
+def unindex_advertisement(sender, instance, **kwargs):
+    """Удаляет объявление из поискового индекса"""
+    get_search_backend().remove(instance.pk)
+
+
+@receiver(post_save, sender=Advertisement)
+@receiver(post_delete, sender=Advertisement)
+def reset_similar_advertisements(sender, instance, update_fields=None, **kwargs):
+    """Сбрасывает кэш похожих объявлений при изменении категории"""
+    if update_fields is not None and 'category' not in update_fields:
+        return
+    invalidate_similar_advertisements()
+
+
+@receiver(m2m_changed, sender=Advertisement.tags.through)
+def reset_similar_advertisements_on_tags(sender, action, **kwargs):
+    """Сбрасывает кэш похожих объявлений при изменении тегов"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_similar_advertisements()
+
+
+@receiver(post_init, sender=Advertisement)
+def remember_counted_relations(sender, instance, **kwargs):
+    """Запоминает категорию и город, учтённые в счётчиках"""
+    # __dict__ вместо атрибутов: обращение к отложенному (only/defer) полю в post_init вызовет повторную загрузку
+    if instance.pk:
+        instance._counted_relations = (instance.__dict__.get('category_id'), instance.__dict__.get('city_id'))
+    else:
+        instance._counted_relations = (None, None)
+
+
+@receiver(post_save, sender=Advertisement)
+def invalidate_pages_on_save(sender, instance, update_fields=None, raw=False, **kwargs):
+    """Сбрасывает кэш страниц, где выводится объявление (до обновления _counted_relations)"""
+    if raw or (update_fields is not None and set(update_fields) <= {'views'}):
+        return
+    old_category, _ = instance._counted_relations
+    category_slugs = Category.objects.filter(pk__in={old_category, instance.category_id}).values_list('slug', flat=True)
+    tag_slugs = instance.tags.values_list('slug', flat=True)
+    invalidate(
+        'ads',
+        *[f'category:{slug}' for slug in category_slugs],
+        *[f'tag:{slug}' for slug in tag_slugs],
+    )
+
+
+@receiver(post_save, sender=Advertisement)
+def update_ads_counts_on_save(sender, instance, created, raw=False, **kwargs):
+    """Пересчитывает счётчики категории и города при создании или переносе объявления"""
+    if raw:
+        return
+    old_category, old_city = (None, None) if created else instance._counted_relations
+    if not created:
+        # Поле не загружалось (only/defer) — считаем, что оно не менялось
+        old_category = instance.category_id if old_category is None else old_category
+        old_city = instance.city_id if old_city is None else old_city
+    if old_category != instance.category_id:
+        adjust_ads_count(Category, [old_category], -1)
+        adjust_ads_count(Category, [instance.category_id], 1)
+    if old_city != instance.city_id:
+        adjust_ads_count(City, [old_city], -1)
+        adjust_ads_count(City, [instance.city_id], 1)
+    instance._counted_relations = (instance.category_id, instance.city_id)
+
+
+@receiver(pre_delete, sender=Advertisement)
+def update_tag_counts_on_delete(sender, instance, **kwargs):
+    """Связи с тегами удаляются каскадно без m2m_changed, поэтому счётчики тегов уменьшаются здесь"""
+    adjust_ads_count(Tag, list(instance.tags.values_list('pk', flat=True)), -1)
+
+
+@receiver(pre_delete, sender=Advertisement)
+def invalidate_pages_on_delete(sender, instance, **kwargs):
+    invalidate(
+        'ads',
+        *[f'category:{slug}' for slug in Category.objects.filter(pk=instance.category_id).values_list('slug', flat=True)],
+        *[f'tag:{slug}' for slug in instance.tags.values_list('slug', flat=True)],
+    )
+
+
+@receiver(post_delete, sender=Advertisement)
+def update_ads_counts_on_delete(sender, instance, **kwargs):
+    category, city = instance._counted_relations
+    adjust_ads_count(Category, [category], -1)
+    adjust_ads_count(City, [city], -1)
+
+
+@receiver(m2m_changed, sender=Advertisement.tags.through)
+def update_tag_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    """Пересчитывает счётчики тегов при добавлении и удалении связей"""
+    if action == 'pre_clear':
+        # После очистки связей уже не узнать, какие были удалены
+        if reverse:
+            instance._cleared_pks = list(instance.advertisement_set.values_list('pk', flat=True))
+        else:
+            instance._cleared_pks = list(instance.tags.values_list('pk', flat=True))
+        return
+    if action == 'pre_remove':
+        # В pk_set всё, что передали в remove(), в том числе несвязанные объекты
+        if reverse:
+            links = AdvertisementTag.objects.filter(tag=instance, advertisement_id__in=pk_set)
+            instance._removed_pks = set(links.values_list('advertisement_id', flat=True))
+        else:
+            links = AdvertisementTag.objects.filter(advertisement=instance, tag_id__in=pk_set)
+            instance._removed_pks = set(links.values_list('tag_id', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_pks', [])
+        delta = -1
+    elif action == 'post_add':
+        delta = 1
+    elif action == 'post_remove':
+        pk_set = getattr(instance, '_removed_pks', pk_set)
+        delta = -1
+    else:
+        return
+    if reverse:
+        adjust_ads_count(Tag, [instance.pk], delta * len(pk_set or []))
+    else:
+        adjust_ads_count(Tag, pk_set or [], delta)
+
+
+@receiver(m2m_changed, sender=Advertisement.tags.through)
+def invalidate_pages_on_tags_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_pks', [])
+    if reverse:
+        touch_advertisements(pk__in=pk_set or [])
+        invalidate('ads', f'tag:{instance.slug}')
+        return
+    touch_advertisements(pk=instance.pk)
+    invalidate('ads', *[f'tag:{slug}' for slug in Tag.objects.filter(pk__in=pk_set or []).values_list('slug', flat=True)])
+
+
+# Связь объявления со справочником: по ней объявления находятся при смене slug
+SLUG_RELATIONS = {Tag: 'tags', Category: 'category', City: 'city'}
+
+
+@receiver(pre_save, sender=Tag)
+@receiver(pre_save, sender=Category)
+@receiver(pre_save, sender=City)
+def remember_saved_slug(sender, instance, raw=False, **kwargs):
+    # Справочники сохраняются редко, лишний запрос дешевле post_init на каждой загрузке
+    instance._saved_slug = None
+    if instance.pk and not raw:
+        instance._saved_slug = sender.objects.filter(pk=instance.pk).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=City)
+def touch_advertisements_on_slug_change(sender, instance, created, raw=False, **kwargs):
+    """slug справочника выводится в JSON API объявлений"""
+    if raw or created or instance._saved_slug in (None, instance.slug):
+        return
+    touch_advertisements(**{SLUG_RELATIONS[sender]: instance})
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_pages(sender, instance, **kwargs):
+    invalidate('tags', f'tag:{instance.slug}')
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_pages(sender, instance, **kwargs):
+    invalidate('categories', f'category:{instance.slug}')
+
+
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+def invalidate_city_pages(sender, instance, **kwargs):
+    invalidate('cities')
+
+
+@receiver(post_init, sender=Advertisement)
+def remember_cover(sender, instance, **kwargs):
+    instance._processed_cover = instance.__dict__.get('cover') if instance.pk else None
+
+
+@receiver(post_save, sender=Advertisement)
+def process_new_cover(sender, instance, update_fields=None, raw=False, **kwargs):
+    """Запускает обработку обложки, если она была загружена или заменена"""
+    if raw or (update_fields is not None and 'cover' not in update_fields):
+        return
+    if not instance.cover or instance.cover.name == str(instance._processed_cover or ''):
+        return
+    instance._processed_cover = instance.cover.name
+    schedule_cover_processing(instance.pk)
+
+
+@receiver(user_logged_in)
+def mark_login_session_refreshed(sender, request, user, **kwargs):
+    """Сессия сохраняется при входе с полным сроком, продлевать её пока не нужно"""
+    if hasattr(request, 'session'):
+        mark_refreshed(request.session)
+
+
+@receiver(post_init, sender=Response)
+def remember_response_status(sender, instance, **kwargs):
+    # __dict__, а не атрибуты: отложенные поля не должны загружаться
+    instance._counted_status = (instance.__dict__.get('recipient_id'), instance.__dict__.get('status')) if instance.pk else None
+
+
+@receiver(post_save, sender=Response)
+def count_new_responses(sender, instance, raw=False, **kwargs):
+    """Меняет счётчик новых откликов получателя после создания отклика или смены статуса"""
+    if raw:
+        return
+    previous, current = instance._counted_status, (instance.recipient_id, instance.status)
+    instance._counted_status = current
+    deltas = {}
+    if previous and previous[1] == 'new':
+        deltas[previous[0]] = deltas.get(previous[0], 0) - 1
+    if current[1] == 'new':
+        deltas[current[0]] = deltas.get(current[0], 0) + 1
+    if any(deltas.values()):
+        transaction.on_commit(lambda: adjust_new_response_counts(deltas))
+
+
+@receiver(pre_delete, sender=Advertisement)
+def reset_notifications_on_delete(sender, instance, **kwargs):
+    # Отклики удаляются каскадно без сигналов: счётчик автора будет посчитан заново
+    transaction.on_commit(lambda: reset_new_response_count(instance.author_id))
+
+
+# Поля, которые выводятся в снимке главной (имена и attname для update_fields)
+FEED_FIELDS = {'title', 'slug', 'description', 'price', 'views', 'created_at', 'city', 'city_id', 'author', 'author_id'}
+
+
+@receiver(post_save, sender=Advertisement)
+def update_home_feed(sender, instance, update_fields=None, raw=False, **kwargs):
+    """Обновляет строку объявления в снимке главной в той же транзакции"""
+    if raw or (update_fields is not None and not FEED_FIELDS & set(update_fields)):
+        return
+    update_feed([instance.pk])
+
+
+@receiver(post_delete, sender=Advertisement)
+def fill_home_feed(sender, instance, **kwargs):
+    # Строка снимка удаляется каскадно, на её место встаёт следующее объявление
+    fill_feed()
+
+
+@receiver(post_save, sender=City)
+def refresh_home_feed_cities(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_feed_entries(city_id=instance.pk)
+
+
+@receiver(post_init, sender=User)
+def remember_username(sender, instance, **kwargs):
+    instance._saved_username = instance.__dict__.get('username') if instance.pk else None
+
+
+@receiver(post_save, sender=User)
+def refresh_home_feed_authors(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if created:
+        instance._saved_username = instance.username
+    # При входе сохраняется только last_login
+    if raw or created or (update_fields is not None and 'username' not in update_fields):
+        return
+    refresh_feed_entries(author_id=instance.pk)
+    if instance.username != instance._saved_username:
+        # Имя автора выводится на главной, страницах категорий и тегов и в JSON API объявлений
+        touch_advertisements(author=instance)
+        category_slugs = Category.objects.filter(advertisement__author=instance).values_list('slug', flat=True).distinct()
+        tag_slugs = Tag.objects.filter(advertisement__author=instance).values_list('slug', flat=True).distinct()
+        invalidate(
+            'ads',
+            *[f'category:{slug}' for slug in category_slugs],
+            *[f'tag:{slug}' for slug in tag_slugs],
+        )
+    instance._saved_username = instance.username
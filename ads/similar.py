@@ -0,0 +1,72 @@
+"""Блок «Похожие объявления» на странице объявления.
+
+Сначала используются соседи, предрасчитанные командой compute_similar_ads
+(см. ``ads.recommendations``). Для объявлений без расчёта список id похожих
+объявлений кэшируется для каждого объявления. Изменение категории или тегов
+любого объявления может изменить чужие списки, поэтому сброс увеличивает
+общее поколение кэша.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Advertisement, SimilarAdvertisement
+
+SIMILAR_ADS_LIMIT = 4
+
+
+GENERATION_KEY = 'ads:similar:generation'
+
+
+def _cache_key(advertisement_id):
+    return f'ads:similar:{advertisement_id}'
+
+
+def _generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, 1, timeout=None)
+        generation = cache.get(GENERATION_KEY, 1)
+    return generation
+
+
+def _find_similar_ids(advertisement, limit):
+    # Теги берутся из prefetch_related, без отдельного подзапроса. UNION вместо
+    # OR по двум таблицам позволяет каждой части использовать свой индекс
+    tag_ids = [tag.pk for tag in advertisement.tags.all()]
+    others = Advertisement.objects.exclude(id=advertisement.id).values_list('id', flat=True)
+    query = others.filter(category_id=advertisement.category_id)
+    if tag_ids:
+        query = query.union(others.filter(tags__in=tag_ids))
+    return list(query[:limit])
+
+
+def get_similar_advertisements(advertisement, limit=SIMILAR_ADS_LIMIT):
+    """Возвращает похожие объявления, сохраняя порядок из кэша"""
+    key = _cache_key(advertisement.pk)
+    generation = _generation()
+    ids = cache.get(key, version=generation)
+    timeout = getattr(settings, 'ADS_SIMILAR_ADS_TIMEOUT', 600)
+    if ids is None:
+        # Предрасчитанные соседи читаются одним запросом по индексу (advertisement, -score)
+        links = (
+            SimilarAdvertisement.objects.filter(advertisement=advertisement)
+            .select_related('similar__city')
+            .order_by('-score')[:limit]
+        )
+        precomputed = [link.similar for link in links]
+        if precomputed:
+            cache.set(key, [ad.pk for ad in precomputed], timeout, version=generation)
+            return precomputed
+        ids = _find_similar_ids(advertisement, limit)
+        cache.set(key, ids, timeout, version=generation)
+    if not ids:
+        return []
+    ads = Advertisement.objects.filter(id__in=ids).select_related('city').in_bulk()
+    return [ads[pk] for pk in ids if pk in ads]
+
+
+def invalidate_similar_advertisements():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, 1, timeout=None)
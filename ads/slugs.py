@@ -0,0 +1,102 @@
+"""Выбор свободных slug без перебора кандидатов запросами EXISTS.
+
+Занятые варианты ``base``, ``base-1``, ``base-2``, … читаются одним
+запросом по префиксу, первый свободный суффикс выбирается в памяти. Если
+параллельный запрос успел занять тот же slug, сохранение повторяется.
+
+Кириллица транслитерируется: ``slugify`` её отбрасывает, а маршруты
+``<slug:...>`` принимают только ASCII. Если от значения ничего не осталось,
+основой служит имя модели.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils.text import slugify
+
+SAVE_ATTEMPTS = 5
+PREFIX_QUERY_CHUNK = 200
+
+TRANSLITERATION = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh',
+    'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya',
+})
+
+
+def make_slug(value):
+    """slugify с транслитерацией кириллицы"""
+    return slugify(str(value).lower().translate(TRANSLITERATION))
+
+
+def _prefix_condition(field, bases):
+    condition = Q()
+    for base in bases:
+        condition |= Q(**{field: base}) | Q(**{f'{field}__startswith': f'{base}-'})
+    return condition
+
+
+def _first_free(base, taken, max_length):
+    if base not in taken:
+        return base
+    counter = 1
+    while True:
+        suffix = f'-{counter}'
+        candidate = f'{base[:max_length - len(suffix)]}{suffix}'
+        if candidate not in taken:
+            return candidate
+        counter += 1
+
+
+def _base(model, value, field):
+    max_length = model._meta.get_field(field).max_length
+    base = make_slug(value)[:max_length].strip('-') or model._meta.model_name
+    return base, max_length
+
+
+def next_free_slug(model, value, field='slug', exclude_pk=None):
+    """Первый свободный slug для value: одним запросом по префиксу"""
+    base, max_length = _base(model, value, field)
+    taken = model.objects.filter(_prefix_condition(field, [base]))
+    if exclude_pk is not None:
+        taken = taken.exclude(pk=exclude_pk)
+    return _first_free(base, set(taken.values_list(field, flat=True)), max_length)
+
+
+def allocate_slugs(model, values, field='slug', reserved=()):
+    """Свободные и попарно различные slug для списка values (для массового импорта).
+
+    ``reserved`` — slug, которые уже обещаны другим записям, но ещё не сохранены.
+    """
+    bases = []
+    max_length = model._meta.get_field(field).max_length
+    for value in values:
+        bases.append(_base(model, value, field)[0])
+
+    distinct = sorted(set(bases))
+    taken = set(reserved)
+    for start in range(0, len(distinct), PREFIX_QUERY_CHUNK):
+        chunk = distinct[start:start + PREFIX_QUERY_CHUNK]
+        taken.update(model.objects.filter(_prefix_condition(field, chunk)).values_list(field, flat=True))
+
+    slugs = []
+    for base in bases:
+        slug = _first_free(base, taken, max_length)
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
+def save_with_unique_slug(instance, value, save, field='slug'):
+    """Назначает instance свободный slug и вызывает save(), повторяя при конфликте уникальности"""
+    model = type(instance)
+    for attempt in range(SAVE_ATTEMPTS):
+        setattr(instance, field, next_free_slug(model, value, field, exclude_pk=instance.pk))
+        try:
+            with transaction.atomic():
+                return save()
+        except IntegrityError:
+            # Повторяем, только если slug заняли параллельно; иначе ошибка в другом поле
+            slug_taken = model.objects.filter(**{field: getattr(instance, field)}).exclude(pk=instance.pk).exists()
+            if not slug_taken or attempt == SAVE_ATTEMPTS - 1:
+                raise
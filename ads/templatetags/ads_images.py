@@ -0,0 +1,26 @@
+from django import template
+
+register = template.Library()
+
+
+@register.filter
+def cover_srcset(advertisement, image_format='jpeg'):
+    """srcset из копий обложки: «url 320w, url 640w»"""
+    variants = (advertisement.cover_variants or {}).get(image_format, [])
+    storage = advertisement.cover.storage
+    return ', '.join(f'{storage.url(path)} {width}w' for width, path in variants)
+
+
+@register.inclusion_tag('ads/cover_picture.html')
+def cover_picture(advertisement, sizes='100vw', css_class='', style=''):
+    """<picture> с WebP и JPEG копиями обложки; без копий выводится оригинал"""
+    jpeg = (advertisement.cover_variants or {}).get('jpeg')
+    return {
+        'advertisement': advertisement,
+        # Для браузеров без srcset — самая маленькая копия, а не оригинал
+        'src': advertisement.cover.storage.url(jpeg[0][1]) if jpeg else advertisement.cover.url,
+        'sizes': sizes,
+        'css_class': css_class,
+        'style': style,
+        'has_variants': bool(jpeg),
+    }
@@ -1,3 +1,1168 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from io import StringIO
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache, caches
+from django.db import OperationalError, connection, connections
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template import Context, Template
+from django.http import Http404, QueryDict
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from django.urls import reverse
+from django.utils import timezone
+
+from .ad_counts import reconcile_ads_counts
+from .benchmark import compare_results, generate_catalog, run_benchmark
+from .counters import ViewCounter
+from .facets import build_facets, get_facets
+from .feed import rebuild_feed
+from .images import process_cover
+from .ingest import AdvertisementIngest
+from .instrumentation import QueryBudgetExceeded, get_metrics_store
+from .moderation import moderate_responses
+from .notifications import get_new_response_count
+from .models import Advertisement, Category, City, FeedEntry, Response, SimilarAdvertisement, Tag
+from .recommendations import SimilarityEngine
+from .reference_data import import_reference_data, read_rows
+from .routers import STICKY_COOKIE, _unavailable_until, _wrote, replica_available
+from .search import get_search_backend, normalize
+from .sessions import REFRESHED_KEY, purge_expired_sessions
+from .slugs import allocate_slugs, next_free_slug
+from .views import AdvertisementListView
+from .views_async import (
+    AsyncAdvertisementDetailView,
+    AsyncAdvertisementListView,
+    AsyncProfileView,
+    NotificationStreamView,
+)
+
+
+@override_settings(ADS_QUERY_BUDGET_STRICT=True)
+class AdsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['view_counts'].clear()
+        get_metrics_store().clear()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='seller', password='password')
+        cls.category = Category.objects.create(name='Электроника', slug='electronics')
+        cls.city = City.objects.create(name='Москва', slug='moscow')
+
+    @classmethod
+    def create_ad(cls, title, description='', **kwargs):
+        # Явный slug делает адреса в тестах предсказуемыми
+        kwargs.setdefault('slug', f'ad-{Advertisement.objects.count() + 1}')
+        kwargs.setdefault('price', 100)
+        kwargs.setdefault('city', cls.city)
+        kwargs.setdefault('category', cls.category)
+        kwargs.setdefault('author', cls.user)
+        return Advertisement.objects.create(title=title, description=description, **kwargs)
+
+
+class SearchTests(AdsTestCase):
+    def test_normalize_reduces_word_forms_to_same_stem(self):
+        self.assertEqual(normalize('Телефоны'), normalize('телефон'))
+        self.assertEqual(normalize('Ёлка ёлки'), ['елк', 'елк'])
+
+    def test_index_follows_save_and_delete(self):
+        ad = self.create_ad('Продам велосипед', 'Горный, почти новый')
+        backend = get_search_backend()
+        self.assertEqual(backend.search('велосипеды'), [ad.pk])
+
+        ad.title = 'Продам самокат'
+        ad.save()
+        self.assertEqual(backend.search('велосипед'), [])
+        self.assertEqual(backend.search('самокаты'), [ad.pk])
+
+        ad.delete()
+        self.assertEqual(backend.search('самокат'), [])
+
+    def test_home_search_is_ranked_by_relevance(self):
+        in_description = self.create_ad('Продам шкаф', 'Отдам в придачу телефон')
+        in_title = self.create_ad('Телефон Nokia', 'Рабочий')
+        response = self.client.get(reverse('home'), {'q': 'телефоны'})
+        self.assertEqual(list(response.context['advertisements']), [in_title, in_description])
+
+    @override_settings(ADS_SEARCH_RESULTS_LIMIT=1)
+    def test_search_is_not_truncated_by_results_limit(self):
+        older = self.create_ad('Продам шкаф', 'Отдам в придачу телефон')
+        newer = self.create_ad('Продам стол', 'И телефон тоже')
+        in_title = self.create_ad('Телефон Nokia', 'Рабочий')
+        response = self.client.get(reverse('home'), {'q': 'телефоны'})
+        # Первый по релевантности, остальные найденные — по новизне
+        self.assertEqual(list(response.context['advertisements']), [in_title, newer, older])
+        self.assertContains(response, 'Найдено объявлений: 3')
+        self.assertEqual(sum(value.count for value in response.context['categories']), 3)
+
+        response = self.client.get(reverse('api_advertisements'), {'q': 'телефоны'})
+        self.assertEqual(len(response.json()['results']), 3)
+
+
+class ViewCounterTests(AdsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.counter = ViewCounter(cache_alias='view_counts', flush_interval=3600, max_pending=1000)
+
+    def test_hits_are_buffered_until_flush(self):
+        ad = self.create_ad('Продам диван')
+        other = self.create_ad('Продам стол')
+        for _ in range(3):
+            self.counter.hit(ad.pk)
+        self.assertEqual(self.counter.hit(other.pk), 1)
+
+        ad.refresh_from_db()
+        self.assertEqual(ad.views, 0)
+
+        self.assertEqual(self.counter.flush(), 4)
+        ad.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((ad.views, other.views), (3, 1))
+        self.assertEqual(self.counter.pending(ad.pk), 0)
+        self.assertEqual(self.counter.flush(), 0)
+
+    def test_flush_when_pending_limit_reached(self):
+        ad = self.create_ad('Продам шкаф')
+        self.counter.max_pending = 2
+        self.counter.hit(ad.pk)
+        self.counter.hit(ad.pk)
+        ad.refresh_from_db()
+        self.assertEqual(ad.views, 2)
+
+    def test_shared_buffer_is_flushed_only_by_one_job(self):
+        ad = self.create_ad('Продам шкаф')
+        counter = ViewCounter(cache_alias='view_counts', flush_interval=0, max_pending=1, flush_in_process=False)
+        counter.hit(ad.pk)
+        counter.hit(ad.pk)
+        self.assertEqual(counter.flush(), 0)
+
+        # Пока идёт другой сброс, второй ничего не делает
+        counter.cache.add(counter.lock_key, 1)
+        self.assertEqual(counter.flush([ad.pk]), 0)
+        counter.cache.delete(counter.lock_key)
+
+        self.assertEqual(counter.flush([ad.pk]), 2)
+        ad.refresh_from_db()
+        self.assertEqual((ad.views, counter.pending(ad.pk)), (2, 0))
+
+
+class AdvertisementDetailTests(AdsTestCase):
+    # Объявление, его теги и предрасчитанные похожие объявления
+    QUERY_BUDGET = 3
+
+    def setUp(self):
+        super().setUp()
+        self.tag = Tag.objects.create(name='Смартфоны', slug='phones')
+        self.ad = self.create_ad('Телефон')
+        self.ad.tags.add(self.tag)
+        self.similar = self.create_ad('Чехол', category=Category.objects.create(name='Аксессуары', slug='accessories'))
+        self.similar.tags.add(self.tag)
+        self.url = reverse('advertisement_detail', args=[self.ad.slug])
+
+    def test_detail_page_fits_query_budget_and_counts_one_view(self):
+        SimilarityEngine().compute()
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            response = self.client.get(self.url)
+        self.assertEqual(response.context['similar_ads'], [self.similar])
+        self.assertEqual(response.context['advertisement'].views, 1)
+
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            response = self.client.get(self.url)
+        self.assertEqual(response.context['advertisement'].views, 2)
+
+    def test_similar_ads_without_precomputed_neighbours_are_cached(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['similar_ads'], [self.similar])
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            self.client.get(self.url)
+
+    def test_similar_ads_are_invalidated_when_tags_change(self):
+        self.client.get(self.url)
+        self.similar.tags.remove(self.tag)
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['similar_ads'], [])
+
+
+class SimilarityEngineTests(AdsTestCase):
+    def test_neighbours_are_ranked_by_shared_tags_and_attributes(self):
+        other_category = Category.objects.create(name='Мебель', slug='furniture')
+        phones = Tag.objects.create(name='Смартфоны', slug='phones')
+        ad = self.create_ad('Телефон')
+        ad.tags.add(phones)
+        same_tag = self.create_ad('Чехол', category=other_category)
+        same_tag.tags.add(phones)
+        same_category = self.create_ad('Наушники', price=100000)
+        unrelated = self.create_ad('Диван', category=other_category)
+
+        SimilarityEngine(top_k=3).compute()
+
+        neighbours = list(
+            SimilarAdvertisement.objects.filter(advertisement=ad).values_list('similar_id', flat=True)
+        )
+        self.assertEqual(neighbours, [same_tag.pk, same_category.pk])
+        self.assertNotIn(unrelated.pk, neighbours)
+
+        response = self.client.get(reverse('advertisement_detail', args=[ad.slug]))
+        self.assertEqual(response.context['similar_ads'], [same_tag, same_category])
+
+    def test_partial_recompute_updates_lists_of_tag_neighbours(self):
+        other_category = Category.objects.create(name='Мебель', slug='furniture')
+        phones = Tag.objects.create(name='Смартфоны', slug='phones')
+        ad = self.create_ad('Телефон', category=other_category)
+        ad.tags.add(phones)
+        changed = self.create_ad('Чехол')
+        changed.tags.add(phones)
+        SimilarityEngine().compute()
+
+        def neighbours(advertisement):
+            return list(SimilarAdvertisement.objects.filter(advertisement=advertisement).values_list('similar_id', flat=True))
+
+        self.assertEqual(neighbours(ad), [changed.pk])
+        changed.tags.remove(phones)
+        SimilarityEngine().compute([changed.pk])
+        self.assertEqual(neighbours(ad), [])
+
+        added = self.create_ad('Зарядка')
+        added.tags.add(phones)
+        SimilarityEngine().compute([added.pk])
+        self.assertEqual(neighbours(ad), [added.pk])
+
+
+class CursorPaginationTests(AdsTestCase):
+    def setUp(self):
+        super().setUp()
+        # Одинаковые цены проверяют доп. ключ сортировки по id
+        self.ads = [self.create_ad(f'Объявление {i}', price=100 * (i // 3)) for i in range(25)]
+
+    def collect_pages(self, url, params):
+        pages, cursor = [], None
+        while True:
+            response = self.client.get(url, {**params, **({'cursor': cursor} if cursor else {})})
+            pages.append(list(response.context['advertisements']))
+            page = response.context['page_obj']
+            if not page.has_next():
+                return pages, response
+            cursor = page.next_cursor
+
+    def test_pages_cover_catalog_without_gaps_or_duplicates(self):
+        url = reverse('category_ads', args=[self.category.slug])
+        for sort in ['-created_at', 'price', '-price']:
+            pages, _ = self.collect_pages(url, {'sort': sort})
+            self.assertEqual([len(page) for page in pages], [10, 10, 5])
+            seen = [ad for page in pages for ad in page]
+            self.assertEqual(len(set(seen)), 25)
+            ordered = sorted(self.ads, key=lambda ad: (ad.price, ad.pk), reverse=sort.startswith('-'))
+            if sort != '-created_at':
+                self.assertEqual(seen, ordered)
+
+    def test_previous_cursor_returns_preceding_page(self):
+        url = reverse('home')
+        pages, response = self.collect_pages(url, {'sort': 'price'})
+        previous = self.client.get(url, {'sort': 'price', 'cursor': response.context['page_obj'].previous_cursor})
+        self.assertEqual(list(previous.context['advertisements']), pages[1])
+        self.assertEqual(previous.context['paginator'].count, 25)
+
+    def test_tampered_cursor_is_rejected(self):
+        response = self.client.get(reverse('home'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+
+class QueryPlanTests(AdsTestCase):
+    def test_list_views_do_not_scan_tables(self):
+        tag = Tag.objects.create(name='Смартфоны', slug='phones')
+        self.create_ad('Телефон').tags.add(tag)
+        out = StringIO()
+        call_command('check_query_plans', stdout=out)
+        self.assertIn('tag_ads: OK', out.getvalue())
+
+
+class AdsCountTests(AdsTestCase):
+    def assertCounts(self, category, city, *tags):
+        self.category.refresh_from_db()
+        self.city.refresh_from_db()
+        self.assertEqual((self.category.ads_count, self.city.ads_count), (category, city))
+        self.assertEqual([Tag.objects.get(pk=tag.pk).ads_count for tag in self.tags], list(tags))
+
+    def setUp(self):
+        super().setUp()
+        self.tags = [Tag.objects.create(name=f'Тег {i}', slug=f'tag-{i}') for i in range(2)]
+
+    def test_counts_follow_advertisement_lifecycle(self):
+        ad = self.create_ad('Телефон')
+        ad.tags.add(*self.tags)
+        self.assertCounts(1, 1, 1, 1)
+
+        ad.tags.remove(self.tags[0])
+        self.tags[1].advertisement_set.add(self.create_ad('Чехол'))
+        self.assertCounts(2, 2, 0, 2)
+
+        ad.category = Category.objects.create(name='Мебель', slug='furniture')
+        ad.save()
+        self.assertCounts(1, 2, 0, 2)
+
+        ad.tags.clear()
+        ad.delete()
+        self.assertCounts(1, 1, 0, 1)
+
+    def test_removing_unlinked_objects_keeps_counts(self):
+        ad, other = self.create_ad('Телефон'), self.create_ad('Чехол')
+        ad.tags.add(self.tags[0])
+        other.tags.add(self.tags[1])
+        ad.tags.remove(*self.tags)
+        self.tags[1].advertisement_set.remove(ad)
+        self.assertCounts(2, 2, 0, 1)
+        self.assertEqual(set(reconcile_ads_counts().values()), {0})
+
+    def test_reconcile_repairs_drift(self):
+        self.create_ad('Телефон').tags.add(self.tags[0])
+        Tag.objects.update(ads_count=5)
+        fixed = reconcile_ads_counts()
+        self.assertEqual(fixed[Tag._meta.verbose_name_plural], 2)
+        self.assertCounts(1, 1, 1, 0)
+
+    def test_tag_list_reads_stored_counts(self):
+        with self.assertNumQueries(2):
+            self.client.get(reverse('tag_list'))
+
+
+class PageCacheTests(AdsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other_category = Category.objects.create(name='Мебель', slug='furniture')
+        self.create_ad('Телефон')
+        self.create_ad('Диван', category=self.other_category)
+
+    def test_anonymous_pages_are_served_from_cache(self):
+        self.client.get(reverse('home'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Телефон')
+
+    def test_saving_advertisement_evicts_only_affected_pages(self):
+        electronics = reverse('category_ads', args=[self.category.slug])
+        furniture = reverse('category_ads', args=[self.other_category.slug])
+        for url in (reverse('home'), electronics, furniture):
+            self.client.get(url)
+
+        self.create_ad('Ноутбук')
+
+        with self.assertNumQueries(0):
+            self.client.get(furniture)
+        self.assertContains(self.client.get(electronics), 'Ноутбук')
+        self.assertContains(self.client.get(reverse('home'), {'sort': '', 'category': ''}), 'Ноутбук')
+
+    def test_username_change_evicts_pages_with_author_name(self):
+        tag = Tag.objects.create(name='Смартфоны', slug='phones')
+        Advertisement.objects.get(title='Телефон').tags.add(tag)
+        urls = [reverse('home'), reverse('category_ads', args=[self.category.slug]), reverse('tag_ads', args=[tag.slug])]
+        for url in urls:
+            self.assertContains(self.client.get(url), 'seller')
+
+        user = User.objects.get(pk=self.user.pk)
+        user.username = 'seller2'
+        user.save()
+        for url in urls:
+            self.assertContains(self.client.get(url), 'seller2')
+
+    def test_authenticated_users_bypass_page_cache(self):
+        self.client.get(reverse('home'))
+        self.client.force_login(self.user)
+        self.assertIsNotNone(self.client.get(reverse('home')).context)
+
+
+class CoverPipelineTests(AdsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+
+    def make_upload(self):
+        image = Image.new('RGB', (800, 600), (200, 30, 30))
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', exif=exif)
+        return SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def test_upload_is_stripped_and_resized(self):
+        with override_settings(MEDIA_ROOT=self.media_root, ADS_IMAGE_WORKERS=0):
+            with self.captureOnCommitCallbacks(execute=True):
+                ad = self.create_ad('Телефон', cover=self.make_upload())
+            ad.refresh_from_db()
+
+            self.assertEqual([width for width, _ in ad.cover_variants['webp']], [320, 640])
+            with ad.cover.storage.open(ad.cover.name) as original:
+                self.assertFalse(Image.open(original).getexif())
+            with ad.cover.storage.open(ad.cover_variants['jpeg'][0][1]) as variant:
+                self.assertEqual(Image.open(variant).size, (320, 240))
+
+            html = Template('{% load ads_images %}{% cover_picture ad sizes="200px" %}').render(Context({'ad': ad}))
+            self.assertIn('type="image/webp"', html)
+            self.assertIn('-640.webp 640w', html)
+
+            # Повторная обработка (backfill --force) не перекодирует очищенный оригинал
+            with ad.cover.storage.open(ad.cover.name) as original:
+                content = original.read()
+            process_cover(ad.pk)
+            ad.refresh_from_db()
+            with ad.cover.storage.open(ad.cover.name) as original:
+                self.assertEqual(original.read(), content)
+
+    def test_original_survives_failed_save(self):
+        with override_settings(MEDIA_ROOT=self.media_root, ADS_IMAGE_WORKERS=0):
+            ad = self.create_ad('Телефон', cover=self.make_upload())
+            storage = ad.cover.storage
+            with mock.patch.object(storage, 'save', side_effect=OSError('No space left on device')):
+                with self.assertRaises(OSError):
+                    process_cover(ad.pk)
+            ad.refresh_from_db()
+            self.assertTrue(storage.exists(ad.cover.name))
+            self.assertEqual(ad.cover_variants, {})
+
+            # Успешная обработка указывает на сохранённый файл и удаляет старый
+            old_name = ad.cover.name
+            process_cover(ad.pk)
+            ad.refresh_from_db()
+            self.assertNotEqual(ad.cover.name, old_name)
+            self.assertTrue(storage.exists(ad.cover.name))
+            self.assertFalse(storage.exists(old_name))
+
+
+class ReferenceDataImportTests(AdsTestCase):
+    def write_file(self, name, content):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = f'{directory}/{name}'
+        with open(path, 'w', encoding='utf-8') as target:
+            target.write(content)
+        return path
+
+    def test_import_is_idempotent_and_reports_changes(self):
+        path = self.write_file('cities.csv', 'name,slug\nМосква,moskva\nКазань,kazan\nТула,\n')
+        result = import_reference_data('city', read_rows(path))
+        self.assertEqual((result['created'], result['updated'], result['unchanged']), (2, 1, 0))
+        self.assertEqual(City.objects.get(name='Москва').slug, 'moskva')
+
+        with self.assertNumQueries(3):
+            result = import_reference_data('city', read_rows(path))
+        self.assertEqual((result['created'], result['updated'], result['unchanged']), (0, 0, 3))
+
+    def test_categories_from_json_lines(self):
+        path = self.write_file('categories.jsonl', '{"slug": "electronics", "name": "Техника"}\n{"slug": "jobs", "name": "Работа"}\n')
+        result = import_reference_data('category', read_rows(path))
+        self.assertEqual((result['created'], result['updated']), (1, 1))
+        self.assertEqual(Category.objects.get(slug='electronics').name, 'Техника')
+
+    def test_numeric_values_and_taken_slugs_are_reported_per_row(self):
+        City.objects.create(name='Казань', slug='kazan')
+        path = self.write_file('cities.json', json.dumps([
+            {'name': 'Москва', 'slug': 'kazan'},
+            {'name': 1905, 'slug': 'city-1905'},
+            {'name': 'Тула', 'slug': 'city-1905'},
+        ], ensure_ascii=False))
+        messages = []
+        result = import_reference_data('city', read_rows(path), log=messages.append)
+        self.assertEqual((result['created'], result['rejected']), (1, 2))
+        self.assertEqual(messages, ['Строка 1: slug kazan уже занят записью «Казань»', 'Строка 3: slug city-1905 уже занят записью «1905»'])
+        self.assertEqual(City.objects.get(name='Москва').slug, 'moscow')
+
+    def test_category_rename_resets_its_cached_page(self):
+        url = reverse('category_ads', args=['electronics'])
+        self.assertContains(self.client.get(url), 'Электроника')
+        import_reference_data('category', [{'slug': 'electronics', 'name': 'Техника'}])
+        self.assertContains(self.client.get(url), 'Техника')
+
+    def test_load_initial_data_keeps_advertisements(self):
+        ad = self.create_ad('Телефон')
+        call_command('load_initial_data', stdout=StringIO())
+        call_command('load_initial_data', stdout=StringIO())
+        self.assertTrue(Advertisement.objects.filter(pk=ad.pk).exists())
+        self.assertEqual(Category.objects.filter(slug='electronics').count(), 1)
+
+
+class SlugAllocationTests(AdsTestCase):
+    def test_next_free_suffix_in_one_query(self):
+        for slug in ('phone', 'phone-1', 'phone-3', 'phone-case'):
+            self.create_ad('Phone', slug=slug)
+        with self.assertNumQueries(1):
+            self.assertEqual(next_free_slug(Advertisement, 'Phone'), 'phone-2')
+        self.assertEqual(allocate_slugs(Advertisement, ['Phone', 'Phone', 'Case']), ['phone-2', 'phone-4', 'case'])
+
+    def test_save_assigns_unique_slug(self):
+        first = self.create_ad('Phone', slug='')
+        second = self.create_ad('Phone', slug='')
+        self.assertEqual((first.slug, second.slug), ('phone', 'phone-1'))
+        self.assertEqual(Tag.objects.create(name='x' * 50).slug, 'x' * 50)
+        self.assertEqual(Tag.objects.create(name='X' * 50).slug, 'x' * 48 + '-1')
+
+    def test_cyrillic_titles_are_transliterated(self):
+        first = self.create_ad('Продам щенка', slug='')
+        second = self.create_ad('Продам щенка!', slug='')
+        self.assertEqual((first.slug, second.slug), ('prodam-shchenka', 'prodam-shchenka-1'))
+        self.assertEqual(allocate_slugs(Advertisement, ['Продам щенка', '???']), ['prodam-shchenka-2', 'advertisement'])
+
+
+class JSONAPITests(AdsTestCase):
+    def test_advertisement_list_filters_paginates_and_revalidates(self):
+        tag = Tag.objects.create(name='Смартфоны', slug='phones')
+        for number in range(3):
+            self.create_ad(f'Телефон {number}', price=100 + number).tags.add(tag)
+        self.create_ad('Диван', category=Category.objects.create(name='Мебель', slug='furniture'))
+
+        response = self.client.get(reverse('api_advertisements'), {'category': 'electronics', 'sort': 'price', 'limit': 2})
+        data = response.json()
+        self.assertEqual([row['title'] for row in data['results']], ['Телефон 0', 'Телефон 1'])
+        self.assertEqual(data['results'][0]['tags'], ['phones'])
+        self.assertEqual(data['results'][0]['city_slug'], 'moscow')
+        self.assertEqual([row['title'] for row in self.client.get(data['next']).json()['results']], ['Телефон 2'])
+
+        # Один агрегат по отфильтрованным объявлениям
+        with self.assertNumQueries(1):
+            cached = self.client.get(
+                reverse('api_advertisements'),
+                {'category': 'electronics', 'sort': 'price', 'limit': 2},
+                HTTP_IF_NONE_MATCH=response['ETag'],
+            )
+        self.assertEqual(cached.status_code, 304)
+
+        # Изменение в другом процессе не сбрасывает версии локального кэша
+        with mock.patch('ads.signals.invalidate'):
+            Advertisement.objects.filter(title='Телефон 2').update(price=50)
+            Advertisement.objects.get(title='Телефон 2').save()
+        changed = self.client.get(
+            reverse('api_advertisements'),
+            {'category': 'electronics', 'sort': 'price', 'limit': 2},
+            HTTP_IF_NONE_MATCH=response['ETag'],
+        )
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()['results'][0]['title'], 'Телефон 2')
+
+    def rename_user(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.username = 'seller2'
+        user.save()
+
+    def change_city_slug(self):
+        city = City.objects.get(pk=self.city.pk)
+        city.slug = 'msk'
+        city.save()
+
+    def test_etags_follow_changes_outside_updated_at(self):
+        ad = self.create_ad('Телефон')
+        tag = Tag.objects.create(name='Смартфоны', slug='phones')
+        counter = ViewCounter(cache_alias='view_counts', flush_interval=3600, max_pending=1000)
+        urls = [reverse('api_advertisements'), reverse('api_advertisement_detail', args=[ad.slug])]
+        changes = [
+            lambda: ad.tags.add(tag),
+            lambda: tag.advertisement_set.clear(),
+            self.change_city_slug,
+            self.rename_user,
+            lambda: counter.hit(ad.pk) and counter.flush(),
+        ]
+        for change in changes:
+            etags = [self.client.get(url)['ETag'] for url in urls]
+            # updated_at сдвигается вместе с изменением, версии кэша не нужны
+            with mock.patch('ads.signals.invalidate'):
+                change()
+            for url, etag in zip(urls, etags):
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detail_and_reference_lists(self):
+        ad = self.create_ad('Телефон', 'Почти новый')
+        response = self.client.get(reverse('api_advertisement_detail', args=[ad.slug]))
+        self.assertEqual(response.json()['description'], 'Почти новый')
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(
+            self.client.get(response.request['PATH_INFO'], HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304
+        )
+        self.assertEqual(self.client.get(reverse('api_advertisement_detail', args=['missing'])).status_code, 404)
+
+        response = self.client.get(reverse('api_cities'))
+        self.assertEqual(response.json()['results'][0]['ads_count'], 1)
+        with self.assertNumQueries(1):
+            cached = self.client.get(reverse('api_cities'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        with mock.patch('ads.signals.invalidate'):
+            City.objects.create(name='Казань', slug='kazan')
+        self.assertEqual(self.client.get(reverse('api_cities'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+
+class ExportTests(AdsTestCase):
+    def test_streaming_endpoint_is_staff_only(self):
+        ad = self.create_ad('Телефон')
+        ad.tags.add(Tag.objects.create(name='Смартфоны', slug='phones'))
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('api_export')).status_code, 403)
+
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        response = self.client.get(reverse('api_export'), {'format': 'csv'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'slug', 'title'])
+        self.assertIn('Москва,electronics,seller,phones', lines[1])
+
+    def test_incremental_command_uses_state_file(self):
+        first = self.create_ad('Телефон')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        state_file = f'{directory}/state'
+
+        output = StringIO()
+        call_command('export_advertisements', state_file=state_file, chunk_size=1, stdout=output, stderr=StringIO())
+        self.assertEqual(json.loads(output.getvalue())['id'], first.pk)
+
+        second = self.create_ad('Диван')
+        # Транзакция, зафиксированная после выгрузки, со временем раньше отметки
+        late = self.create_ad('Шкаф')
+        Advertisement.objects.filter(pk=late.pk).update(updated_at=first.updated_at - timedelta(seconds=1))
+        output = StringIO()
+        call_command('export_advertisements', state_file=state_file, stdout=output, stderr=StringIO())
+        self.assertEqual([json.loads(line)['id'] for line in output.getvalue().splitlines()], [late.pk, first.pk, second.pk])
+
+        with override_settings(ADS_EXPORT_OVERLAP_SECONDS=0):
+            output = StringIO()
+            call_command('export_advertisements', state_file=state_file, stdout=output, stderr=StringIO())
+        self.assertEqual([json.loads(line)['id'] for line in output.getvalue().splitlines()], [second.pk])
+
+
+class IngestTests(AdsTestCase):
+    def test_command_imports_valid_rows_and_reports_errors(self):
+        Tag.objects.create(name='Смартфоны', slug='phones')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        rows = [
+            {'title': 'Phone', 'description': 'Почти новый', 'price': '100', 'city': 'moscow', 'category': 'electronics', 'tags': 'phones'},
+            {'title': 'Phone', 'description': 'Второй', 'price': '200', 'new_city': 'Казань', 'category': 'electronics'},
+            {'title': 'Диван', 'description': 'Мягкий', 'price': '300', 'city': 'moscow', 'new_city': 'Казань', 'category': 'electronics'},
+            {'title': 'Стол', 'description': 'Дубовый', 'price': 'дорого', 'city': 'moscow', 'category': 'furniture'},
+        ]
+        with open(f'{directory}/ads.jsonl', 'w', encoding='utf-8') as source:
+            source.write('\n'.join(json.dumps(row, ensure_ascii=False) for row in rows))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command(
+                'import_advertisements', f'{directory}/ads.jsonl', author='seller', batch_size=2,
+                report=f'{directory}/report.csv', stdout=StringIO(),
+            )
+
+        with open(f'{directory}/report.csv', encoding='utf-8') as report:
+            results = list(csv.DictReader(report))
+        self.assertEqual([result['status'] for result in results], ['created', 'created', 'error', 'error'])
+        self.assertEqual([result['slug'] for result in results[:2]], ['phone', 'phone-1'])
+        self.assertIn('Выберите только один вариант', results[2]['errors'])
+        self.assertIn('Категория не найдена: furniture', results[3]['errors'])
+        self.assertIn('price', results[3]['errors'])
+
+        self.assertEqual(Advertisement.objects.get(slug='phone-1').city.name, 'Казань')
+        self.assertEqual(Tag.objects.get(slug='phones').ads_count, 1)
+        self.assertEqual(set(reconcile_ads_counts().values()), {0})
+        self.assertEqual(len(get_search_backend().search('почти новый')), 1)
+
+    def test_failed_chunk_is_reported_and_its_covers_removed(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with open(f'{directory}/photo.jpg', 'wb') as cover:
+            cover.write(b'jpeg')
+        rows = [
+            {'title': 'Phone', 'description': 'Новый', 'price': '100', 'city': 'moscow', 'category': 'electronics'},
+            {'title': 'Phone', 'description': 'Новый', 'price': '100', 'city': 'moscow', 'category': 'electronics', 'cover': f'{directory}/photo.jpg'},
+        ]
+        insert = AdvertisementIngest.insert
+
+        def insert_without_covers(ingest, prepared):
+            if any(item[1].cover for item in prepared):
+                raise OperationalError('database is locked')
+            return insert(ingest, prepared)
+
+        with override_settings(MEDIA_ROOT=f'{directory}/media'):
+            with mock.patch.object(AdvertisementIngest, 'insert', autospec=True, side_effect=insert_without_covers):
+                report = AdvertisementIngest(self.user, batch_size=1).run(rows)
+            copied = [name for _, _, names in os.walk(f'{directory}/media') for name in names]
+        self.assertEqual([result['status'] for result in report], ['created', 'error'])
+        self.assertEqual(report[1]['errors'], ['База данных: database is locked'])
+        self.assertEqual(copied, [])
+
+    def test_city_choice_error_is_reported_with_other_errors(self):
+        rows = [{'title': 'Phone', 'description': 'Новый', 'price': 'дорого', 'city': 'moscow', 'new_city': 'Казань', 'category': 'furniture'}]
+        errors = AdvertisementIngest(self.user).run(rows)[0]['errors']
+        self.assertIn('Выберите только один вариант: город из списка или новый город', errors)
+        self.assertIn('Категория не найдена: furniture', errors)
+        self.assertTrue(any(error.startswith('price') for error in errors))
+
+    def test_api_rejects_server_side_cover_paths(self):
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        self.client.force_login(self.user)
+        rows = [{'title': 'Phone', 'description': 'Новый', 'price': '100', 'city': 'moscow', 'category': 'electronics', 'cover': '/etc/passwd'}]
+        response = self.client.post(reverse('api_import'), json.dumps(rows), content_type='application/json')
+        self.assertEqual(response.json()['errors'], 1)
+        self.assertFalse(Advertisement.objects.exists())
+
+
+class InstrumentationTests(AdsTestCase):
+    def test_server_timing_and_metrics_page(self):
+        self.create_ad('Телефон')
+        response = self.client.get(reverse('home'))
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, total;dur=')
+        self.assertEqual(get_metrics_store().summary()[0]['name'], 'home')
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('request_metrics')).status_code, 403)
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        self.assertContains(self.client.get(reverse('request_metrics')), '<td>home</td>')
+
+    @override_settings(ADS_QUERY_BUDGETS={'home': 1})
+    def test_exceeded_budget_fails_in_strict_mode(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse('home'))
+
+
+class ProfileTests(AdsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.buyer = User.objects.create_user(username='buyer', password='password')
+        self.ads = [self.create_ad(f'Объявление {number}') for number in range(12)]
+        for status in ('new', 'accepted', 'rejected'):
+            Response.objects.create(advertisement=self.ads[-1], sender=self.buyer, recipient=self.user, text='Беру', status=status)
+        self.url = reverse('profile', args=[self.user.username])
+
+    def test_sections_are_paginated_with_response_stats(self):
+        self.client.force_login(self.user)
+        # Сессия, пользователь, владелец профиля, три страницы разделов, статистика откликов и счётчики статусов
+        with self.assertNumQueries(8):
+            response = self.client.get(self.url)
+        advertisements = response.context['advertisements']
+        self.assertEqual(len(advertisements), 10)
+        self.assertEqual(advertisements.object_list[0].response_stats, {'total': 3, 'new': 1, 'accepted': 1, 'rejected': 1})
+        self.assertEqual(advertisements.object_list[1].response_stats['total'], 0)
+        self.assertEqual([count for _, _, count, _ in response.context['status_filters']], [3, 1, 1, 1])
+
+        links = response.context['section_links']['advertisements']
+        response = self.client.get(f"{self.url}?{links['next']}&{links['querystring']}")
+        self.assertEqual(len(response.context['advertisements']), 2)
+        self.assertEqual(len(response.context['received_responses']), 3)
+
+    def test_received_responses_filter_by_status(self):
+        response = self.client.get(self.url, {'status': 'accepted'})
+        self.assertEqual([item.status for item in response.context['received_responses']], ['accepted'])
+        self.assertEqual(response.context['current_status'], 'accepted')
+
+
+class NotificationTests(AdsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.buyer = User.objects.create_user(username='buyer', password='password')
+        self.ad = self.create_ad('Телефон')
+        self.url = reverse('api_notifications')
+
+    def respond(self):
+        self.client.force_login(self.buyer)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('create_response', args=[self.ad.slug]), {'text': 'Беру'})
+        return Response.objects.latest('pk')
+
+    @mock.patch('ads.notifications.is_shared_cache', return_value=True)
+    def test_counter_follows_new_and_moderated_responses(self, shared):
+        self.assertEqual(get_new_response_count(self.user.pk), 0)
+        first, second = self.respond(), self.respond()
+        self.assertEqual(get_new_response_count(self.user.pk), 2)
+
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('accept_response', args=[first.pk]))
+            self.client.get(reverse('reject_response', args=[second.pk]))
+        self.assertEqual(get_new_response_count(self.user.pk), 0)
+        self.assertEqual(Response.objects.filter(recipient=self.user, status='new').count(), 0)
+
+    def test_endpoint_supports_etag(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.respond()
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.json(), {'new_responses': 1})
+
+        # Локальный кэш процесса: счётчик считается по базе и видит отклики из других процессов
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        Response.objects.filter(recipient=self.user).update(status='accepted')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).json(), {'new_responses': 0})
+
+    def test_endpoint_reads_shared_cache(self):
+        with mock.patch('ads.notifications.is_shared_cache', return_value=True):
+            self.respond()
+            self.client.force_login(self.user)
+            response = self.client.get(self.url)
+            self.assertEqual(response.json(), {'new_responses': 1})
+
+            # Только сессия и пользователь: счётчик уже в кэше
+            with self.assertNumQueries(2):
+                response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+
+    @override_settings(ADS_NOTIFICATIONS_STREAM_INTERVAL=0.01, ADS_NOTIFICATIONS_STREAM_TIMEOUT=0.05)
+    async def test_stream_sends_count_once(self):
+        request = AsyncRequestFactory().get('/api/notifications/stream/')
+
+        async def auser():
+            return self.user
+        request.auser = auser
+        response = await NotificationStreamView.as_view()(request)
+        events = [chunk.decode() async for chunk in response.streaming_content]
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(events[1:], ['event: new_responses\ndata: {"new_responses": 0}\n\n'])
+
+
+class ModerationTests(AdsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.buyer = User.objects.create_user(username='buyer', password='password')
+        self.ad, self.other_ad = self.create_ad('Телефон'), self.create_ad('Диван')
+
+    def respond(self, advertisement, recipient=None, status='new'):
+        return Response.objects.create(
+            advertisement=advertisement, sender=self.buyer, recipient=recipient or self.user, text='Беру', status=status
+        )
+
+    def test_accept_with_auto_reject_reports_every_id(self):
+        chosen, first_rival, second_rival = (self.respond(self.ad) for _ in range(3))
+        other_ad = self.respond(self.other_ad)
+        foreign = self.respond(self.ad, recipient=self.buyer)
+        done = self.respond(self.ad, status='rejected')
+        self.assertEqual(get_new_response_count(self.user.pk), 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            results, auto_rejected = moderate_responses(
+                self.user, [chosen.pk, other_ad.pk, foreign.pk, done.pk, 999], 'accept', reject_others=True
+            )
+        self.assertEqual([(result['result'], result['status']) for result in results], [
+            ('changed', 'accepted'), ('changed', 'accepted'), ('forbidden', None), ('unchanged', 'rejected'), ('not_found', None),
+        ])
+        self.assertCountEqual(auto_rejected, [first_rival.pk, second_rival.pk])
+        statuses = dict(Response.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses[first_rival.pk], 'rejected')
+        self.assertEqual(statuses[foreign.pk], 'new')
+        self.assertEqual(get_new_response_count(self.user.pk), 0)
+
+    def test_api_and_single_response_views(self):
+        response = self.respond(self.ad)
+        self.client.force_login(self.buyer)
+        self.assertEqual(self.client.get(reverse('accept_response', args=[response.pk])).status_code, 403)
+        self.assertEqual(self.client.get(reverse('accept_response', args=[999])).status_code, 404)
+
+        self.client.force_login(self.user)
+        url = reverse('api_moderate_responses')
+        self.assertEqual(self.client.post(url, {'ids': 'x'}, content_type='application/json').status_code, 400)
+        result = self.client.post(url, {'ids': [response.pk], 'action': 'reject'}, content_type='application/json').json()
+        self.assertEqual(result, {'results': [{'id': response.pk, 'result': 'changed', 'status': 'rejected'}], 'auto_rejected': []})
+
+        self.client.get(reverse('accept_response', args=[response.pk]))
+        self.assertEqual(Response.objects.get(pk=response.pk).status, 'rejected')
+
+        other = self.respond(self.other_ad)
+        self.assertRedirects(
+            self.client.post(reverse('moderate_responses'), {'ids': [other.pk], 'action': 'accept'}),
+            reverse('profile', args=[self.user.username]),
+        )
+        self.assertEqual(Response.objects.get(pk=other.pk).status, 'accepted')
+
+    def test_invalid_ids_and_reject_others_over_get_are_ignored(self):
+        chosen, rival = self.respond(self.ad), self.respond(self.ad)
+        self.client.force_login(self.user)
+        url = reverse('api_moderate_responses')
+        for ids in ([True], [2 ** 63], [chosen.pk] * 501):
+            self.assertEqual(self.client.post(url, {'ids': ids, 'action': 'reject'}, content_type='application/json').status_code, 400)
+        self.client.post(reverse('moderate_responses'), {'ids': ['²', '-1'], 'action': 'reject'})
+        self.assertEqual(Response.objects.filter(status='new').count(), 2)
+
+        self.client.get(reverse('accept_response', args=[chosen.pk]), {'reject_others': '1'})
+        self.assertEqual(Response.objects.get(pk=rival.pk).status, 'new')
+        self.client.post(reverse('accept_response', args=[rival.pk]), {'reject_others': '1'})
+        self.assertEqual(Response.objects.get(pk=rival.pk).status, 'accepted')
+
+    def test_results_follow_update_when_snapshot_is_stale(self):
+        first, second = self.respond(self.ad), self.respond(self.other_ad)
+        select_for_update = Response.objects.select_for_update
+
+        def stale_snapshot():
+            snapshot = select_for_update().filter(pk__in=[first.pk, second.pk])
+            rows = list(snapshot.values('id', 'recipient_id', 'status', 'advertisement_id'))
+            # Параллельный запрос успевает отклонить отклик после чтения
+            Response.objects.filter(pk=first.pk).update(status='rejected')
+            return mock.Mock(**{'filter.return_value.values.return_value': rows})
+
+        with mock.patch.object(Response.objects, 'select_for_update', side_effect=stale_snapshot), \
+                mock.patch('ads.moderation.adjust_new_response_counts') as adjust, \
+                self.captureOnCommitCallbacks(execute=True):
+            results, _ = moderate_responses(self.user, [first.pk, second.pk], 'accept')
+        self.assertEqual([(result['result'], result['status']) for result in results], [
+            ('unchanged', 'rejected'), ('changed', 'accepted'),
+        ])
+        adjust.assert_called_once_with({self.user.pk: -1})
+
+
+@override_settings(ADS_HOME_FEED_SIZE=20)
+class HomeFeedTests(AdsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ads = [self.create_ad(f'Объявление {i}', 'Описание ' * 40, views=i) for i in range(25)]
+
+    def get_pages(self):
+        pages, cursor = [], None
+        for _ in range(3):
+            # Кэш страниц сбрасывается, чтобы страница каждый раз строилась заново
+            cache.clear()
+            response = self.client.get(reverse('home'), {'cursor': cursor} if cursor else {})
+            pages.append(response.content.decode())
+            cursor = response.context['page_obj'].next_cursor
+        return pages
+
+    def snapshot(self):
+        return list(FeedEntry.objects.order_by('-created_at', '-pk').values())
+
+    def test_snapshot_pages_match_regular_rendering(self):
+        cache.clear()
+        # Фасеты кэшируются отдельно от страницы и при промахе считаются по объявлениям
+        get_facets(QueryDict())
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('home'))
+        self.assertFalse([query['sql'] for query in queries if '"ads_advertisement"' in query['sql']])
+
+        pages = self.get_pages()
+        FeedEntry.objects.all().delete()
+        self.assertEqual(self.get_pages(), pages)
+
+    def test_snapshot_follows_changes(self):
+        self.create_ad('Новое объявление')
+        self.ads[-1].delete()
+        self.ads[-2].title = 'Изменённое объявление'
+        self.ads[-2].save()
+        self.city.name = 'Санкт-Петербург'
+        self.city.save()
+        counter = ViewCounter(cache_alias='view_counts', flush_interval=3600, max_pending=1000)
+        counter.hit(self.ads[-3].pk)
+        counter.flush()
+
+        snapshot = self.snapshot()
+        self.assertEqual(len(snapshot), 21)
+        self.assertEqual(snapshot[0]['title'], 'Новое объявление')
+        rebuild_feed()
+        self.assertEqual(snapshot, self.snapshot())
+
+
+class FacetTests(AdsTestCase):
+    def setUp(self):
+        super().setUp()
+        furniture = Category.objects.create(name='Мебель', slug='furniture')
+        kazan = City.objects.create(name='Казань', slug='kazan')
+        phones = Tag.objects.create(name='Смартфоны', slug='phones')
+        self.create_ad('Телефон', price=500).tags.add(phones)
+        self.create_ad('Планшет', price=3000, city=kazan).tags.add(phones)
+        self.create_ad('Стол', price=3000, category=furniture)
+        self.create_ad('Шкаф', price=150000, category=furniture, city=kazan).tags.add(phones)
+
+    def counts(self, values):
+        return {value.slug: value.count for value in values}
+
+    def test_dimension_counts_ignore_own_filter(self):
+        with self.assertNumQueries(4):
+            facets = build_facets({'category': 'electronics', 'tag': 'phones'})
+        self.assertEqual(self.counts(facets['categories']), {'electronics': 2, 'furniture': 1})
+        self.assertEqual(self.counts(facets['cities']), {'moscow': 1, 'kazan': 1})
+        self.assertEqual(self.counts(facets['tags']), {'phones': 2})
+        self.assertEqual(
+            self.counts(facets['price_ranges']),
+            {'-1000': 1, '1000-5000': 1, '5000-20000': 0, '20000-100000': 0, '100000-': 0},
+        )
+
+        # Без других фильтров счётчики берутся из ads_count
+        with self.assertNumQueries(4):
+            facets = build_facets({})
+        self.assertEqual(self.counts(facets['categories']), {'electronics': 2, 'furniture': 2})
+        self.assertEqual(self.counts(facets['tags']), {'phones': 3})
+
+    def test_facets_are_cached_per_filter_set(self):
+        get_facets(QueryDict('tag=phones&city=kazan&sort=price'))
+        with self.assertNumQueries(0):
+            get_facets(QueryDict('city=kazan&tag=phones&cursor=x'))
+
+    def test_price_filter_on_home(self):
+        response = self.client.get(reverse('home'), {'price': '1000-5000'})
+        self.assertEqual([ad.title for ad in response.context['advertisements']], ['Стол', 'Планшет'])
+        self.assertContains(response, '1 000 – 5 000 ₽ (2)')
+        self.assertContains(response, 'href="?tag=phones&price=1000-5000"')
+
+    def test_non_finite_price_bounds_are_ignored(self):
+        for value in ('NaN-', '-Infinity', 'inf-snan'):
+            self.assertEqual(self.client.get(reverse('home'), {'price': value}).context['paginator'].count, 4)
+            self.assertEqual(len(self.client.get(reverse('api_advertisements'), {'price': value}).json()['results']), 4)
+
+
+class AsyncViewTests(AdsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ads = [self.create_ad(title, price=price) for title, price in [('Телефон', 300), ('Диван', 100), ('Стол', 200)]]
+        self.factory = AsyncRequestFactory()
+
+    def make_request(self, path, **params):
+        request = self.factory.get(path, params)
+        request.user = AnonymousUser()
+        return request
+
+    async def test_home_matches_sync_view(self):
+        request = self.make_request('/', sort='price')
+        response = await AsyncAdvertisementListView.as_view(paginate_by=2)(request)
+        expected = await sync_to_async(lambda: AdvertisementListView.as_view(paginate_by=2)(request))()
+
+        self.assertEqual(response.context_data['advertisements'], expected.context_data['advertisements'])
+        self.assertEqual(response.context_data['paginator'].count, 3)
+        self.assertEqual(response.context_data['categories'], expected.context_data['categories'])
+        self.assertEqual([(value.slug, value.count) for value in response.context_data['categories']], [('electronics', 3)])
+        self.assertTrue(response.context_data['next_page_query'].startswith('cursor='))
+        await sync_to_async(response.render)()
+        self.assertContains(response, 'Диван')
+
+    async def test_detail_counts_view_and_raises_404(self):
+        ad = self.ads[0]
+        response = await AsyncAdvertisementDetailView.as_view()(self.make_request(ad.get_absolute_url()), slug=ad.slug)
+        self.assertEqual(response.context_data['advertisement'].views, 1)
+        self.assertCountEqual(response.context_data['similar_ads'], self.ads[1:])
+        with self.assertRaises(Http404):
+            await AsyncAdvertisementDetailView.as_view()(self.make_request('/advertisement/missing/'), slug='missing')
+
+    async def test_profile_sections_are_loaded(self):
+        response = await AsyncProfileView.as_view()(self.make_request('/profile/seller/'), username='seller')
+        self.assertEqual(response.context_data['profile_user'], self.user)
+        self.assertEqual(len(response.context_data['advertisements']), 3)
+        self.assertEqual(response.context_data['advertisements'].object_list[0].response_stats['total'], 0)
+        self.assertEqual(len(response.context_data['received_responses']), 0)
+
+    async def test_middleware_records_queries_under_asgi(self):
+        response = await self.async_client.get(reverse('api_advertisements'))
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+
+
+class SessionTests(AdsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.client.get(reverse('home'))
+        self.session = Session.objects.get(session_key=self.client.session.session_key)
+
+    def test_requests_do_not_write_fresh_session(self):
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(reverse('city_list'))
+        # Сессия только читается (при общем кэше — из кэша) и не перезаписывается
+        writes = [query for query in captured if 'django_session' in query['sql'] and not query['sql'].startswith('SELECT')]
+        self.assertEqual(writes, [])
+        self.assertEqual(Session.objects.get(pk=self.session.pk).expire_date, self.session.expire_date)
+
+    def test_session_is_extended_close_to_expiry(self):
+        session = self.client.session
+        session[REFRESHED_KEY] -= 10 * 24 * 3600
+        session.save()
+        stale = Session.objects.get(pk=self.session.pk).expire_date
+
+        response = self.client.get(reverse('home'))
+        self.assertIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertGreater(Session.objects.get(pk=self.session.pk).expire_date, stale)
+
+    def test_purge_deletes_only_expired_sessions_in_batches(self):
+        past = timezone.now() - timedelta(days=1)
+        Session.objects.bulk_create([Session(session_key=f'expired{number}', session_data='', expire_date=past) for number in range(5)])
+        self.assertEqual(purge_expired_sessions(batch_size=2), 5)
+        self.assertEqual(list(Session.objects.values_list('pk', flat=True)), [self.session.pk])
+
+
+class BenchmarkTests(AdsTestCase):
+    def test_generated_catalog_runs_through_all_scenarios(self):
+        generate_catalog(ads=40, users=5, cities=3, tags=6, responses=1, batch_size=15)
+        self.assertEqual(Advertisement.objects.filter(slug__startswith='synthetic-').count(), 40)
+        self.assertEqual(set(reconcile_ads_counts().values()), {0})
+
+        results = run_benchmark(iterations=2, warmup=0)
+        self.assertIn('profile', results['scenarios'])
+        self.assertEqual(set(results['scenarios']['home']), {'iterations', 'queries', 'p50_ms', 'p95_ms', 'peak_memory_kb'})
+
+        asgi = run_benchmark(iterations=1, warmup=0, mode='asgi')
+        self.assertEqual(asgi['scenarios'].keys(), results['scenarios'].keys())
+        self.assertEqual(asgi['meta']['mode'], 'asgi')
+
+        slower = {'scenarios': {'home': {**results['scenarios']['home'], 'queries': 99}}}
+        self.assertEqual(compare_results(slower, results), [f"home: запросов {results['scenarios']['home']['queries']} → 99"])
+
+
+@override_settings(ADS_READ_REPLICAS=['replica'])
+class ReplicaRoutingTests(AdsTestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Отдельная пустая база в роли реплики: видно, откуда читается страница.
+        # Алиас добавляется здесь, а не в атрибуте класса, — тестовый раннер о нём не знает
+        cls.replica_dir = tempfile.mkdtemp()
+        connections.settings['replica'] = {**connections['default'].settings_dict, 'NAME': f'{cls.replica_dir}/replica.sqlite3'}
+        call_command('migrate', database='replica', verbosity=0)
+        cls.databases = {'default', 'replica'}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        shutil.rmtree(cls.replica_dir)
+
+    def test_reads_go_to_replica_until_user_writes(self):
+        self.create_ad('Телефон')
+        self.client.force_login(self.user)
+        self.assertEqual(len(self.client.get(reverse('home')).context['advertisements']), 0)
+
+        response = self.client.post(reverse('advertisement_create'), {
+            'title': 'Sofa', 'description': 'Мягкий', 'price': '100', 'city': self.city.pk, 'category': self.category.pk,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        self.assertEqual(len(self.client.get(reverse('home')).context['advertisements']), 2)
+
+        del self.client.cookies[STICKY_COOKIE]
+        self.assertEqual(len(self.client.get(reverse('home')).context['advertisements']), 0)
+
+    def test_get_moderation_sets_cookie_but_view_flush_does_not(self):
+        ad = self.create_ad('Телефон')
+        buyer = User.objects.create_user(username='buyer', password='password')
+        response = Response.objects.create(advertisement=ad, sender=buyer, recipient=self.user, text='Беру')
+        self.client.force_login(self.user)
+
+        counter = ViewCounter(cache_alias='view_counts', flush_interval=3600, max_pending=1000)
+        counter.hit(ad.pk)
+        token = _wrote.set(False)
+        self.addCleanup(_wrote.reset, token)
+        self.assertEqual(counter.flush(), 1)
+        self.assertFalse(_wrote.get())
+
+        accepted = self.client.get(reverse('accept_response', args=[response.pk]))
+        self.assertEqual(accepted.status_code, 302)
+        self.assertIn(STICKY_COOKIE, accepted.cookies)
+
+    def test_unavailable_replica_falls_back_to_primary(self):
+        self.create_ad('Телефон')
+        failure = mock.patch.object(connections['replica'], 'ensure_connection', side_effect=OperationalError('down'))
+        with failure as ensure_connection, self.assertLogs('ads.routers', 'WARNING'):
+            response = self.client.get(reverse('home'))
+            self.assertEqual(len(response.context['advertisements']), 1)
+            # Недоступная реплика не проверяется повторно до ADS_REPLICA_RETRY_SECONDS
+            self.assertFalse(replica_available('replica'))
+        self.assertEqual(ensure_connection.call_count, 1)
+        self.addCleanup(_unavailable_until.clear)
@@ -1,9 +1,20 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, views_api, views_async
 from .views_auth import CustomLoginView, CustomSignupView, CustomLogoutView
 
+# Под ASGI главная, объявление и профиль обслуживаются асинхронными вариантами
+if settings.ADS_ASYNC_VIEWS:
+    list_view = views_async.AsyncAdvertisementListView
+    detail_view = views_async.AsyncAdvertisementDetailView
+    profile_view = views_async.AsyncProfileView
+else:
+    list_view = views.AdvertisementListView
+    detail_view = views.AdvertisementDetailView
+    profile_view = views.ProfileView
+
 urlpatterns = [
-    path('', views.AdvertisementListView.as_view(), name='home'),
+    path('', list_view.as_view(), name='home'),
     path('my-ads/', views.UserAdvertisementListView.as_view(), name='my_ads'),
     path('admin-ads/', views.AdminAdvertisementListView.as_view(), name='admin_ads'),  # ✅ новый маршрут
 
@@ -14,18 +25,37 @@ urlpatterns = [
     path('cities/', views.CityListView.as_view(), name='city_list'),
 
     path('advertisement/new/', views.AdvertisementCreateView.as_view(), name='advertisement_create'),
-    path('advertisement/<slug:slug>/', views.AdvertisementDetailView.as_view(), name='advertisement_detail'),
+    path('advertisement/<slug:slug>/', detail_view.as_view(), name='advertisement_detail'),
     path('advertisement/<slug:slug>/update/', views.AdvertisementUpdateView.as_view(), name='advertisement_update'),
     path('advertisement/<slug:slug>/delete/', views.AdvertisementDeleteView.as_view(), name='advertisement_delete'),
 
     path('response/<int:pk>/', views.ResponseDetailView.as_view(), name='response_detail'),
     path('response/<int:pk>/accept/', views.ResponseAcceptView.as_view(), name='accept_response'),
     path('response/<int:pk>/reject/', views.ResponseRejectView.as_view(), name='reject_response'),
+    path('responses/moderate/', views.ResponseBulkModerationView.as_view(), name='moderate_responses'),
     path('advertisement/<slug:slug>/respond/', views.ResponseCreateView.as_view(), name='create_response'),
 
-    path('profile/<str:username>/', views.ProfileView.as_view(), name='profile'),
+    path('metrics/', views.RequestMetricsView.as_view(), name='request_metrics'),
+
+    path('profile/<str:username>/', profile_view.as_view(), name='profile'),
+
+    path('api/ads/', views_api.AdvertisementListAPIView.as_view(), name='api_advertisements'),
+    path('api/ads/<slug:slug>/', views_api.AdvertisementDetailAPIView.as_view(), name='api_advertisement_detail'),
+    path('api/categories/', views_api.CategoryListAPIView.as_view(), name='api_categories'),
+    path('api/cities/', views_api.CityListAPIView.as_view(), name='api_cities'),
+    path('api/tags/', views_api.TagListAPIView.as_view(), name='api_tags'),
+    path('api/notifications/', views_api.NotificationCountAPIView.as_view(), name='api_notifications'),
+    path('api/responses/moderate/', views_api.ResponseModerationAPIView.as_view(), name='api_moderate_responses'),
+    path('api/export/', views_api.AdvertisementExportView.as_view(), name='api_export'),
+    path('api/import/', views_api.AdvertisementImportView.as_view(), name='api_import'),
 
     path('accounts/login/', CustomLoginView.as_view(), name='account_login'),
     path('accounts/signup/', CustomSignupView.as_view(), name='account_signup'),
     path('accounts/logout/', CustomLogoutView.as_view(), name='account_logout'),
 ]
+
+if settings.ADS_ASYNC_VIEWS:
+    # Долгое соединение не занимает поток только под ASGI
+    urlpatterns.append(
+        path('api/notifications/stream/', views_async.NotificationStreamView.as_view(), name='api_notifications_stream')
+    )
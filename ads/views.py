@@ -1,72 +1,71 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, View
+from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, TemplateView, View
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.models import User
 from django.urls import reverse_lazy
 from django.contrib import messages
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
 from django.db import models
-from django.db.models import Q
+from django.db.models import Case, IntegerField, When
 from .models import Advertisement, Response, City, Category, Tag
+from .cache import CachedPageMixin
+from .facets import get_facets
+from .feed import get_feed_page
+from .filters import filter_advertisements, get_ranked_ids
+from .instrumentation import get_metrics_store
+from .moderation import ACTIONS, MAX_IDS, is_valid_id, moderate_responses
 from .forms import AdvertisementForm, ResponseForm, TagForm
-
-
-class CategoryAdvertisementListView(ListView):
+from .pagination import DEFAULT_SORT, SORT_OPTIONS, CursorPaginationMixin, paginate_by_cursor
+from .profile import (
+    RESPONSE_STATUSES,
+    attach_response_stats,
+    get_section_querysets,
+    get_status_counts,
+    response_stats_query,
+    status_counts_query,
+)
+from .similar import get_similar_advertisements
+
+
+class CategoryAdvertisementListView(CachedPageMixin, CursorPaginationMixin, ListView):
     model = Advertisement
     template_name = 'ads/category_ads.html'
     context_object_name = 'advertisements'
     paginate_by = 10
 
+    def get_cache_dependencies(self):
+        return [f"category:{self.kwargs['category_slug']}", 'cities']
+
     def get_queryset(self):
         self.category = get_object_or_404(Category, slug=self.kwargs['category_slug'])
         queryset = Advertisement.objects.filter(category=self.category)
-
-        sort_by = self.request.GET.get('sort', '-created_at')
-        if sort_by in ['created_at', '-created_at', 'price', '-price', 'views', '-views']:
-            queryset = queryset.order_by(sort_by)
-        else:
-            queryset = queryset.order_by('-created_at')
-
-        return queryset
+        return queryset.order_by(self.get_sort()).select_related('author', 'city')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['category'] = self.category
-
-        params = self.request.GET.copy()
-        if 'page' in params:
-            params.pop('page')
-        context['querystring'] = params.urlencode()
-
         return context
 
 
-class TagAdvertisementListView(ListView):
+class TagAdvertisementListView(CachedPageMixin, CursorPaginationMixin, ListView):
     model = Advertisement
     template_name = 'ads/tag_ads.html'
     context_object_name = 'advertisements'
     paginate_by = 10
 
+    def get_cache_dependencies(self):
+        return [f"tag:{self.kwargs['tag_slug']}", 'cities']
+
     def get_queryset(self):
         self.tag = get_object_or_404(Tag, slug=self.kwargs['tag_slug'])
         queryset = Advertisement.objects.filter(tags=self.tag)
-
-        sort_by = self.request.GET.get('sort', '-created_at')
-        if sort_by in ['created_at', '-created_at', 'price', '-price', 'views', '-views']:
-            queryset = queryset.order_by(sort_by)
-        else:
-            queryset = queryset.order_by('-created_at')
-
-        return queryset
+        return queryset.order_by(self.get_sort()).select_related('author', 'city')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['tag'] = self.tag
-
-        params = self.request.GET.copy()
-        if 'page' in params:
-            params.pop('page')
-        context['querystring'] = params.urlencode()
-
         return context
 
 
@@ -88,13 +87,16 @@ class TagListView(ListView):
     paginate_by = 20
 
 
-class CityListView(ListView):
+class CityListView(CachedPageMixin, ListView):
     model = City
     template_name = 'ads/city_list.html'
     context_object_name = 'cities'
     paginate_by = 50
     ordering = ['name']
 
+    def get_cache_dependencies(self):
+        return ['cities']
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
@@ -106,57 +108,80 @@ class CityListView(ListView):
         return context
 
 
-class AdvertisementListView(ListView):
+class AdvertisementListView(CachedPageMixin, CursorPaginationMixin, ListView):
     model = Advertisement
     template_name = 'ads/home.html'
     context_object_name = 'advertisements'
     paginate_by = 10
-    ordering = ['-created_at']
+
+    def get_cache_dependencies(self):
+        return ['ads', 'categories', 'tags', 'cities']
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = filter_advertisements(super().get_queryset(), self.request.GET)
+
+        if self.use_cursor_pagination():
+            queryset = queryset.order_by(self.get_sort())
+        else:
+            # Без явной сортировки первые ADS_SEARCH_RESULTS_LIMIT совпадений упорядочены
+            # по релевантности, остальные найденные идут за ними по новизне
+            ranked_ids = get_ranked_ids(self.request.GET)
+            queryset = queryset.order_by(Case(
+                *[When(id=pk, then=position) for position, pk in enumerate(ranked_ids)],
+                default=len(ranked_ids),
+                output_field=IntegerField(),
+            ), '-created_at', '-id')
 
-        category_slug = self.request.GET.get('category')
-        if category_slug:
-            queryset = queryset.filter(category__slug=category_slug)
+        return queryset.select_related('author', 'city', 'category').prefetch_related('tags')
 
-        city_slug = self.request.GET.get('city')
-        if city_slug:
-            queryset = queryset.filter(city__slug=city_slug)
+    sidebar = None
 
-        tag_slug = self.request.GET.get('tag')
-        if tag_slug:
-            queryset = queryset.filter(tags__slug=tag_slug)
+    def get_sidebar(self):
+        """Категории, города, теги и диапазоны цен со счётчиками для текущих фильтров"""
+        return get_facets(self.request.GET)
 
-        search_query = self.request.GET.get('q')
-        if search_query:
-            queryset = queryset.filter(
-                Q(title__icontains=search_query) |
-                Q(description__icontains=search_query)
-            )
+    def use_cursor_pagination(self):
+        # Выдача поиска по релевантности листается по номерам страниц
+        return not self.request.GET.get('q') or self.request.GET.get('sort') in SORT_OPTIONS
 
-        sort_by = self.request.GET.get('sort', '-created_at')
-        if sort_by in ['created_at', '-created_at', 'price', '-price', 'views', '-views']:
-            queryset = queryset.order_by(sort_by)
+    def use_home_feed(self):
+        # Без фильтров и с сортировкой по новизне первые страницы есть в снимке (ads.feed)
+        params = set(self.request.GET) - {self.cursor_param}
+        return not params or (params == {'sort'} and self.request.GET.get('sort') == DEFAULT_SORT)
 
-        return queryset.select_related('author', 'city', 'category').prefetch_related('tags')
+    def get_home_feed_page(self, page_size):
+        """Страница из снимка или None, если её там нет"""
+        if not self.use_home_feed():
+            return None
+        return get_feed_page(page_size, self.request.GET.get(self.cursor_param))
+
+    def paginate_queryset(self, queryset, page_size):
+        page = self.get_home_feed_page(page_size)
+        if page is not None:
+            return page.paginator, page, page.object_list, page.has_other_pages()
+        return super().paginate_queryset(queryset, page_size)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categories'] = Category.objects.all()
-        context['tags'] = Tag.objects.all()[:10]
-        context['cities'] = City.objects.all()[:10]
+        if self.sidebar is None:
+            self.sidebar = self.get_sidebar()
+        context.update(self.sidebar)
+
+        # Ссылки уточнений сохраняют остальные фильтры и сортировку
+        params = self.request.GET.copy()
+        for param in (self.page_kwarg, self.cursor_param):
+            params.pop(param, None)
+        context['facet_queries'] = {}
+        for param in ('category', 'city', 'tag', 'price'):
+            facet_params = params.copy()
+            facet_params.pop(param, None)
+            context['facet_queries'][param] = facet_params.urlencode()
         context['current_sort'] = self.request.GET.get('sort', '-created_at')
         context['current_category'] = self.request.GET.get('category', '')
         context['current_city'] = self.request.GET.get('city', '')
         context['current_tag'] = self.request.GET.get('tag', '')
+        context['current_price'] = self.request.GET.get('price', '')
         context['search_query'] = self.request.GET.get('q', '')
-
-        params = self.request.GET.copy()
-        if 'page' in params:
-            params.pop('page')
-        context['querystring'] = params.urlencode()
-
         return context
 
 
@@ -170,7 +195,7 @@ class UserAdvertisementListView(LoginRequiredMixin, ListView):
         return Advertisement.objects.filter(author=self.request.user).order_by('-created_at')
 
 
-class AdminAdvertisementListView(ListView):
+class AdminAdvertisementListView(CursorPaginationMixin, ListView):
     model = Advertisement
     template_name = 'ads/admin_advertisements.html'
     context_object_name = 'advertisements'
@@ -178,48 +203,28 @@ class AdminAdvertisementListView(ListView):
 
     def get_queryset(self):
         queryset = Advertisement.objects.filter(author__username__iexact='admin')
-
-        sort_by = self.request.GET.get('sort', '-created_at')
-        if sort_by in ['created_at', '-created_at', 'price', '-price', 'views', '-views']:
-            queryset = queryset.order_by(sort_by)
-        else:
-            queryset = queryset.order_by('-created_at')
-
-        return queryset.select_related('author', 'city', 'category').prefetch_related('tags')
-
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-
-        params = self.request.GET.copy()
-        if 'page' in params:
-            params.pop('page')
-        context['querystring'] = params.urlencode()
-
-        return context
+        return queryset.order_by(self.get_sort()).select_related('author', 'city', 'category').prefetch_related('tags')
 
 
 class AdvertisementDetailView(DetailView):
     model = Advertisement
     template_name = 'ads/advertisement_detail.html'
 
-    def get_object(self, queryset=None):
-        slug = self.kwargs.get('slug')
-        advertisement = get_object_or_404(
-            Advertisement.objects.select_related('author', 'city', 'category').prefetch_related('tags'),
-            slug=slug
-        )
-        advertisement.increment_views()
-        return advertisement
+    def get_queryset(self):
+        return Advertisement.objects.select_related('author', 'city', 'category').prefetch_related('tags')
+
+    def get(self, request, *args, **kwargs):
+        # Объявление загружается один раз, просмотр учитывается один раз
+        self.object = self.get_object()
+        self.object.increment_views()
+        self.similar_ads = get_similar_advertisements(self.object)
+        context = self.get_context_data(object=self.object)
+        return self.render_to_response(context)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['response_form'] = ResponseForm()
-        advertisement = self.get_object()
-        similar_ads = Advertisement.objects.filter(
-            Q(category=advertisement.category) |
-            Q(tags__in=advertisement.tags.all())
-        ).exclude(id=advertisement.id).distinct()[:4]
-        context['similar_ads'] = similar_ads
+        context['similar_ads'] = self.similar_ads
         return context
 
 
@@ -299,29 +304,71 @@ class ResponseCreateView(LoginRequiredMixin, CreateView):
         return reverse_lazy('advertisement_detail', kwargs={'slug': self.kwargs['slug']})
 
 
-class ResponseAcceptView(LoginRequiredMixin, UserPassesTestMixin, View):
-    def test_func(self):
-        response = get_object_or_404(Response, pk=self.kwargs['pk'])
-        return self.request.user == response.recipient
+class ResponseModerationView(LoginRequiredMixin, View):
+    """Принятие или отклонение одного отклика.
+
+    Отклонить остальные отклики на объявление (reject_others=1) можно только
+    POST-запросом с CSRF-токеном, чтобы его не вызвала чужая ссылка.
+    """
+
+    action = None
+    success_message = ''
 
     def get(self, request, *args, **kwargs):
-        response = get_object_or_404(Response, pk=kwargs['pk'])
-        response.status = 'accepted'
-        response.save()
-        messages.success(request, 'Отклик принят!')
+        return self.moderate(request, kwargs['pk'], reject_others=False)
+
+    def post(self, request, *args, **kwargs):
+        return self.moderate(request, kwargs['pk'], reject_others=request.POST.get('reject_others') == '1')
+
+    def moderate(self, request, pk, reject_others):
+        [result], auto_rejected = moderate_responses(request.user, [pk], self.action, reject_others)
+        if result['result'] == 'not_found':
+            raise Http404('Отклик не найден')
+        if result['result'] == 'forbidden':
+            raise PermissionDenied
+        if result['result'] == 'changed':
+            messages.success(request, self.success_message)
+        else:
+            messages.info(request, 'Отклик уже обработан.')
+        if auto_rejected:
+            messages.info(request, f'Остальные отклики на объявление отклонены: {len(auto_rejected)}.')
         return redirect('profile', username=request.user.username)
 
 
-class ResponseRejectView(LoginRequiredMixin, UserPassesTestMixin, View):
-    def test_func(self):
-        response = get_object_or_404(Response, pk=self.kwargs['pk'])
-        return self.request.user == response.recipient
+class ResponseAcceptView(ResponseModerationView):
+    action = 'accept'
+    success_message = 'Отклик принят!'
 
-    def get(self, request, *args, **kwargs):
-        response = get_object_or_404(Response, pk=kwargs['pk'])
-        response.status = 'rejected'
-        response.save()
-        messages.success(request, 'Отклик отклонён.')
+
+class ResponseRejectView(ResponseModerationView):
+    action = 'reject'
+    success_message = 'Отклик отклонён.'
+
+
+class ResponseBulkModerationView(LoginRequiredMixin, View):
+    """Принятие или отклонение отмеченных откликов из профиля"""
+
+    http_method_names = ['post']
+
+    def post(self, request, *args, **kwargs):
+        action = request.POST.get('action')
+        ids = []
+        for value in request.POST.getlist('ids')[:MAX_IDS]:
+            try:
+                pk = int(value)
+            except ValueError:
+                continue
+            if is_valid_id(pk):
+                ids.append(pk)
+        if action not in ACTIONS or not ids:
+            messages.error(request, 'Отметьте отклики и выберите действие.')
+            return redirect('profile', username=request.user.username)
+
+        results, auto_rejected = moderate_responses(request.user, ids, action, request.POST.get('reject_others') == '1')
+        changed = sum(result['result'] == 'changed' for result in results)
+        messages.success(request, f'Обработано откликов: {changed} из {len(results)}.')
+        if auto_rejected:
+            messages.info(request, f'Остальные отклики на эти объявления отклонены: {len(auto_rejected)}.')
         return redirect('profile', username=request.user.username)
 
 
@@ -333,14 +380,78 @@ class ProfileView(DetailView):
     slug_field = 'username'
     slug_url_kwarg = 'username'
 
+    paginate_by = 10
+    sort = '-created_at'
+    sections = None
+    status_counts = None
+
+    def get_received_status(self):
+        status = self.request.GET.get('status')
+        return status if status in RESPONSE_STATUSES else None
+
+    def get_cursor(self, section):
+        return self.request.GET.get(f'{section}_cursor')
+
+    def get_section_querysets(self):
+        return get_section_querysets(self.object, self.get_received_status())
+
+    def get_sections(self):
+        sections = {
+            name: paginate_by_cursor(queryset, self.sort, self.paginate_by, self.get_cursor(name))
+            for name, queryset in self.get_section_querysets().items()
+        }
+        advertisements = sections['advertisements'].object_list
+        attach_response_stats(advertisements, response_stats_query([ad.pk for ad in advertisements]))
+        self.status_counts = get_status_counts(status_counts_query(self.object))
+        return sections
+
+    def get_section_links(self, section, page):
+        """Параметры для ads/pagination.html; курсоры других разделов сохраняются"""
+        param = f'{section}_cursor'
+        params = self.request.GET.copy()
+        params.pop(param, None)
+        return {
+            'next': f'{param}={page.next_cursor}' if page.next_cursor else '',
+            'previous': f'{param}={page.previous_cursor}' if page.previous_cursor else '',
+            'querystring': params.urlencode(),
+        }
+
+    def get_status_query(self, status):
+        params = self.request.GET.copy()
+        params.pop('received_responses_cursor', None)
+        params.pop('status', None)
+        if status:
+            params['status'] = status
+        return params.urlencode()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user = self.get_object()
-        context['advertisements'] = Advertisement.objects.filter(author=user)
-        context['received_responses'] = Response.objects.filter(recipient=user).select_related('advertisement', 'sender')
-        context['sent_responses'] = Response.objects.filter(sender=user).select_related('advertisement', 'recipient')
+        if self.sections is None:
+            self.sections = self.get_sections()
+        context.update(self.sections)
+        context['section_links'] = {name: self.get_section_links(name, page) for name, page in self.sections.items()}
+        context['current_status'] = self.get_received_status() or ''
+        context['status_filters'] = [
+            (status, label, self.status_counts[status or 'all'], self.get_status_query(status))
+            for status, label in [('', 'Все'), *Response.RESPONSE_STATUS]
+        ]
         return context
 
 
+class RequestMetricsView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
+    template_name = 'ads/request_metrics.html'
 
+    def test_func(self):
+        return self.request.user.is_staff
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        store = get_metrics_store()
+        budgets = getattr(settings, 'ADS_QUERY_BUDGETS', {})
+        metrics = store.summary()
+        for row in metrics:
+            row['budget'] = budgets.get(row['name'])
+            row['over_budget'] = row['budget'] is not None and row['queries']['p100'] > row['budget']
+        context['metrics'] = metrics
+        context['window'] = store.window
+        return context
@@ -0,0 +1,262 @@
+"""JSON API только для чтения: объявления, категории, города и теги.
+
+Ответы содержат ETag (и Last-Modified для отдельного объявления, по
+``updated_at``); на повторный запрос с If-None-Match / If-Modified-Since
+возвращается 304 без выборки самих данных. Валидаторы строятся по состоянию
+базы, а не по версиям кэша: у LocMemCache они свои в каждом процессе.
+ETag списка объявлений — один агрегат по отфильтрованным строкам (последний
+``updated_at``, число строк и сумма просмотров). Изменения, которые
+выводятся в ответе, но хранятся вне строки объявления (теги, slug города,
+категории и тега, имя автора), сдвигают ``updated_at`` (``ads.signals``).
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.db.models import Count, F, Max, Sum
+from django.contrib.auth.mixins import UserPassesTestMixin
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.generic import View
+
+from .cache import normalize_querystring
+from .export import EXPORT_FORMATS, export_lines, export_rows, parse_since
+from .filters import filter_advertisements
+from .ingest import AdvertisementIngest
+from .moderation import ACTIONS, MAX_IDS, is_valid_id, moderate_responses
+from .models import Advertisement, AdvertisementTag, Category, City, Tag
+from .notifications import get_new_response_count
+from .pagination import get_sort, paginate_by_cursor
+
+ADVERTISEMENT_FIELDS = ['id', 'slug', 'title', 'price', 'views', 'created_at', 'updated_at']
+ADVERTISEMENT_RELATED = {
+    'city_slug': F('city__slug'),
+    'category_slug': F('category__slug'),
+    'author_username': F('author__username'),
+}
+
+
+def _make_etag(*parts):
+    return quote_etag(hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest())
+
+
+def get_page_size(params):
+    default = getattr(settings, 'ADS_API_PAGE_SIZE', 20)
+    try:
+        size = int(params.get('limit', default))
+    except ValueError:
+        size = default
+    return max(1, min(size, getattr(settings, 'ADS_API_MAX_PAGE_SIZE', 100)))
+
+
+def _cover_url(path):
+    return Advertisement._meta.get_field('cover').storage.url(path) if path else None
+
+
+def _serialize_advertisements(rows):
+    """Добавляет к строкам slug тегов (одним запросом) и адрес обложки"""
+    tags = {}
+    pairs = AdvertisementTag.objects.filter(advertisement_id__in=[row['id'] for row in rows])
+    for advertisement_id, slug in pairs.values_list('advertisement_id', 'tag__slug'):
+        tags.setdefault(advertisement_id, []).append(slug)
+    for row in rows:
+        row['tags'] = tags.get(row['id'], [])
+        row['cover'] = _cover_url(row.pop('cover'))
+    return rows
+
+
+class JSONView(View):
+    """Базовый GET-эндпоинт с условными ответами"""
+
+    http_method_names = ['get', 'head', 'options']
+
+    def get_validators(self):
+        """Возвращает (etag, last_modified) без выборки данных ответа"""
+        return None, None
+
+    def get_data(self):
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators()
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = JsonResponse(self.get_data(), json_dumps_params={'ensure_ascii': False})
+        if etag:
+            response['ETag'] = etag
+        if timestamp:
+            response['Last-Modified'] = http_date(timestamp)
+        # Клиент может хранить ответ, но обязан перепроверять его
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    def paginate(self, queryset, sort):
+        page = paginate_by_cursor(queryset, sort, get_page_size(self.request.GET), self.request.GET.get('cursor'))
+        return page.object_list, {
+            'next': self.page_url(page.next_cursor),
+            'previous': self.page_url(page.previous_cursor),
+        }
+
+    def page_url(self, cursor):
+        if cursor is None:
+            return None
+        params = self.request.GET.copy()
+        params['cursor'] = cursor
+        return f'{self.request.path}?{params.urlencode()}'
+
+
+class AdvertisementListAPIView(JSONView):
+    """Список объявлений с теми же фильтрами и сортировками, что и главная страница"""
+
+    def get_queryset(self):
+        # Поиск здесь только фильтрует: выдача всегда листается курсором по sort
+        if not hasattr(self, '_queryset'):
+            self._queryset = filter_advertisements(Advertisement.objects.all(), self.request.GET)
+        return self._queryset
+
+    def get_validators(self):
+        # Удаление меняет число строк, сброс счётчика — сумму просмотров, остальное — updated_at
+        state = self.get_queryset().aggregate(updated_at=Max('updated_at'), count=Count('pk'), views=Sum('views'))
+        return _make_etag(state['updated_at'], state['count'], state['views'], normalize_querystring(self.request.GET)), None
+
+    def get_data(self):
+        queryset = self.get_queryset().values(*ADVERTISEMENT_FIELDS, 'cover', **ADVERTISEMENT_RELATED)
+        rows, links = self.paginate(queryset, get_sort(self.request.GET))
+        return {'results': _serialize_advertisements(rows), **links}
+
+
+class AdvertisementDetailAPIView(JSONView):
+    def get_validators(self):
+        state = Advertisement.objects.filter(slug=self.kwargs['slug']).values('updated_at', 'views').first()
+        if state is None:
+            raise Http404('Объявление не найдено')
+        return _make_etag(state['updated_at'], state['views']), state['updated_at']
+
+    def get_data(self):
+        queryset = Advertisement.objects.filter(slug=self.kwargs['slug'])
+        rows = list(queryset.values(*ADVERTISEMENT_FIELDS, 'description', 'cover', **ADVERTISEMENT_RELATED))
+        if not rows:
+            raise Http404('Объявление не найдено')
+        return _serialize_advertisements(rows)[0]
+
+
+class ReferenceListAPIView(JSONView):
+    """Список справочника; у справочников нет updated_at, поэтому ETag считается по самой странице"""
+
+    model = None
+    fields = ()
+
+    def get_validators(self):
+        # Страница справочника — один небольшой запрос, он же используется для ответа
+        rows, links = self.paginate(self.model.objects.values(*self.fields), 'name')
+        self.data = {'results': rows, **links}
+        return _make_etag(json.dumps(self.data, sort_keys=True, default=str)), None
+
+    def get_data(self):
+        return self.data
+
+
+class CategoryListAPIView(ReferenceListAPIView):
+    model = Category
+    fields = ('id', 'slug', 'name', 'description', 'ads_count')
+
+
+class CityListAPIView(ReferenceListAPIView):
+    model = City
+    fields = ('id', 'slug', 'name', 'ads_count')
+
+
+class TagListAPIView(ReferenceListAPIView):
+    model = Tag
+    fields = ('id', 'slug', 'name', 'color', 'ads_count')
+
+
+class NotificationCountAPIView(UserPassesTestMixin, JSONView):
+    """Число новых откликов текущего пользователя; читается из кэша"""
+
+    raise_exception = True
+
+    def test_func(self):
+        return self.request.user.is_authenticated
+
+    def get_validators(self):
+        self.count = get_new_response_count(self.request.user.pk)
+        return _make_etag(self.request.user.pk, self.count), None
+
+    def get_data(self):
+        return {'new_responses': self.count}
+
+
+class ResponseModerationAPIView(UserPassesTestMixin, View):
+    """POST {"ids": [...], "action": "accept" | "reject", "reject_others": false}; ответ — результат по каждому id"""
+
+    http_method_names = ['post']
+    raise_exception = True
+
+    def test_func(self):
+        return self.request.user.is_authenticated
+
+    def post(self, request, *args, **kwargs):
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return HttpResponseBadRequest('Ожидается JSON-объект')
+        ids = data.get('ids') if isinstance(data, dict) else None
+        if isinstance(ids, list) and len(ids) > MAX_IDS:
+            return HttpResponseBadRequest(f'Не больше {MAX_IDS} ids за запрос')
+        if not isinstance(ids, list) or not all(is_valid_id(pk) for pk in ids) or data.get('action') not in ACTIONS:
+            return HttpResponseBadRequest('Нужны список ids (положительные целые) и action: accept или reject')
+
+        results, auto_rejected = moderate_responses(request.user, ids, data['action'], bool(data.get('reject_others')))
+        return JsonResponse({'results': results, 'auto_rejected': auto_rejected})
+
+
+class AdvertisementExportView(UserPassesTestMixin, View):
+    """Потоковая выгрузка объявлений для сотрудников: ?format=csv|ndjson&since=<ISO 8601>"""
+
+    http_method_names = ['get']
+    raise_exception = True
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.GET.get('format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return HttpResponseBadRequest('Неизвестный формат выгрузки')
+        try:
+            since = parse_since(request.GET.get('since'))
+        except ValueError as exc:
+            return HttpResponseBadRequest(str(exc))
+
+        rows = export_rows(since, getattr(settings, 'ADS_EXPORT_CHUNK_SIZE', 1000))
+        response = StreamingHttpResponse(export_lines(export_format, rows), content_type=EXPORT_FORMATS[export_format])
+        response['Content-Disposition'] = f'attachment; filename="advertisements.{export_format}"'
+        return response
+
+
+class AdvertisementImportView(UserPassesTestMixin, View):
+    """Массовая загрузка объявлений сотрудником: POST с JSON-массивом строк, ответ — отчёт по строкам"""
+
+    http_method_names = ['post']
+    raise_exception = True
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def post(self, request, *args, **kwargs):
+        try:
+            rows = json.loads(request.body)
+        except ValueError:
+            return HttpResponseBadRequest('Ожидается JSON-массив объявлений')
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            return HttpResponseBadRequest('Ожидается JSON-массив объявлений')
+
+        report = AdvertisementIngest(request.user, allow_local_covers=False).run(rows)
+        created = sum(result['status'] == 'created' for result in report)
+        return JsonResponse(
+            {'created': created, 'errors': len(report) - created, 'rows': report},
+            json_dumps_params={'ensure_ascii': False},
+        )
@@ -0,0 +1,130 @@
+"""Асинхронные варианты страниц с наибольшим числом запросов.
+
+Представления повторяют синхронные из ``ads.views`` (шаблоны, контекст,
+кэш страниц), но загружают данные через асинхронный ORM, а независимые
+части страницы — список и счётчик объявлений, боковую панель, похожие
+объявления, разделы профиля — запрашивают одновременно через
+``asyncio.gather``. Подключаются вместо синхронных при ``ADS_ASYNC_VIEWS``
+(см. ``BulletinBoard.asgi``). В Django 5.2 асинхронный ORM выполняет запросы
+одного HTTP-запроса в одном потоке, поэтому выигрыш даёт не параллельность
+запросов к базе, а то, что ожидание базы не занимает воркер сервера.
+"""
+import asyncio
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404
+from django.views.generic import View
+
+from .notifications import aget_new_response_count
+from .pagination import acached_count, apaginate_by_cursor
+from .profile import attach_response_stats, get_status_counts, response_stats_query, status_counts_query
+from .similar import get_similar_advertisements
+from .views import AdvertisementDetailView, AdvertisementListView, ProfileView
+
+
+async def alist(queryset):
+    return [obj async for obj in queryset]
+
+
+class AsyncAdvertisementListView(AdvertisementListView):
+    prepared_page = None
+
+    async def get(self, request, *args, **kwargs):
+        # Поиск выполняет сырой SQL, поэтому фильтрация вызывается синхронно
+        self.object_list = await sync_to_async(self.get_queryset)()
+        page_size = self.get_paginate_by(self.object_list)
+        # Фасеты считаются синхронно, как и фильтрация
+        sidebar = sync_to_async(self.get_sidebar)()
+
+        feed_page = await sync_to_async(self.get_home_feed_page)(page_size) if self.use_home_feed() else None
+        if feed_page is not None:
+            self.prepared_page = (feed_page.paginator, feed_page, feed_page.object_list, feed_page.has_other_pages())
+            self.sidebar = await sidebar
+        elif self.use_cursor_pagination():
+            page, count, self.sidebar = await asyncio.gather(
+                apaginate_by_cursor(self.object_list, self.get_sort(), page_size, request.GET.get(self.cursor_param)),
+                acached_count(self.object_list),
+                sidebar,
+            )
+            page.paginator.count = count
+            self.prepared_page = (page.paginator, page, page.object_list, page.has_other_pages())
+        else:
+            self.prepared_page, self.sidebar = await asyncio.gather(
+                sync_to_async(super().paginate_queryset)(self.object_list, page_size),
+                sidebar,
+            )
+        return self.render_to_response(self.get_context_data())
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.prepared_page is not None:
+            return self.prepared_page
+        return super().paginate_queryset(queryset, page_size)
+
+
+class AsyncAdvertisementDetailView(AdvertisementDetailView):
+    async def get(self, request, *args, **kwargs):
+        try:
+            self.object = await self.get_queryset().aget(slug=self.kwargs[self.slug_url_kwarg])
+        except self.model.DoesNotExist:
+            raise Http404('Объявление не найдено')
+        # Счётчик просмотров работает через кэш, похожие объявления — через кэш и базу
+        self.similar_ads, _ = await asyncio.gather(
+            sync_to_async(get_similar_advertisements)(self.object),
+            sync_to_async(self.object.increment_views)(),
+        )
+        return self.render_to_response(self.get_context_data(object=self.object))
+
+
+class AsyncProfileView(ProfileView):
+    async def get(self, request, *args, **kwargs):
+        self.object = await aget_object_or_404(User, username=self.kwargs[self.slug_url_kwarg])
+        querysets = self.get_section_querysets()
+        pages = [
+            apaginate_by_cursor(queryset, self.sort, self.paginate_by, self.get_cursor(name))
+            for name, queryset in querysets.items()
+        ]
+        *pages, status_rows = await asyncio.gather(*pages, alist(status_counts_query(self.object)))
+        self.sections = dict(zip(querysets, pages))
+        advertisements = self.sections['advertisements'].object_list
+        attach_response_stats(advertisements, await alist(response_stats_query([ad.pk for ad in advertisements])))
+        self.status_counts = get_status_counts(status_rows)
+        return self.render_to_response(self.get_context_data(object=self.object))
+
+
+class NotificationStreamView(View):
+    """Server-sent events с числом новых откликов текущего пользователя"""
+
+    http_method_names = ['get']
+    keepalive = 15
+
+    async def get(self, request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            raise PermissionDenied
+        response = StreamingHttpResponse(self.events(user.pk), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Иначе nginx буферизует поток
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def events(self, user_id):
+        interval = getattr(settings, 'ADS_NOTIFICATIONS_STREAM_INTERVAL', 2)
+        # Поток закрывается через ADS_NOTIFICATIONS_STREAM_TIMEOUT, EventSource переподключается сам
+        deadline = time.monotonic() + getattr(settings, 'ADS_NOTIFICATIONS_STREAM_TIMEOUT', 300)
+        last_count, last_sent = None, time.monotonic()
+        yield f'retry: {int(interval * 1000)}\n\n'
+        while time.monotonic() < deadline:
+            count = await aget_new_response_count(user_id)
+            if count != last_count:
+                last_count, last_sent = count, time.monotonic()
+                yield f'event: new_responses\ndata: {json.dumps({"new_responses": count})}\n\n'
+            elif time.monotonic() - last_sent >= self.keepalive:
+                last_sent = time.monotonic()
+                yield ': keepalive\n\n'
+            await asyncio.sleep(interval)